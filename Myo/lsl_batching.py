@@ -0,0 +1,119 @@
+"""
+Batched publishing of Myo samples with timestamps from the armband.
+
+DeviceClock maps the SDK's event timestamps (microseconds on the Myo
+Connect clock) onto the LSL clock. The offset between the two is the smallest
+(local_clock() - device time) seen over the last two windows: Bluetooth
+batching only ever delays an event, so the smallest difference is the one with
+the least delay, and restarting the window lets the offset follow slow drift
+between the clocks. A jump of more than RESET_SECONDS (the armband reconnected
+or Myo Connect restarted) starts over.
+
+SampleBatch collects samples in a preallocated block and sends them with a
+single push_chunk() once it holds max_samples samples or its oldest sample is
+max_seconds old, each sample keeping its own timestamp. The age is checked as
+samples are added and by flush_due(), which the main loop calls between events
+so a batch does not wait for the next sample when the armband goes quiet.
+"""
+
+import ctypes
+import threading
+import numpy as np
+import pylsl
+
+DEFAULT_WINDOW_SECONDS = 10.0
+RESET_SECONDS = 1.0
+
+
+class DeviceClock:
+    """Device microseconds to LSL seconds for one armband."""
+
+    def __init__(self, window_seconds=DEFAULT_WINDOW_SECONDS):
+        self.window_seconds = window_seconds
+        self.offset = None
+        self.current = np.inf
+        self.previous = np.inf
+        self.window_end = None
+
+    def to_lsl(self, device_us, now=None):
+        now = pylsl.local_clock() if now is None else now
+        device = device_us / 1e6
+        offset = now - device
+        if self.offset is None or abs(offset - self.offset) > RESET_SECONDS:
+            self.current = self.previous = offset
+            self.window_end = now + self.window_seconds
+        elif now >= self.window_end:
+            self.previous, self.current = self.current, offset
+            self.window_end = now + self.window_seconds
+        else:
+            self.current = min(self.current, offset)
+        self.offset = min(self.current, self.previous)
+        return device + self.offset
+
+
+def push_chunk(outlet, values, timestamps, pushthrough=True):
+    """
+    outlet.push_chunk() for a C-contiguous block of samples in the outlet's
+    channel format with one timestamp per sample, handing liblsl both arrays'
+    memory.
+    """
+    push = getattr(outlet, 'do_push_chunk_n', None)
+    if push is None:
+        # pylsl without per-sample timestamps for chunks
+        for sample, timestamp in zip(values.tolist(), timestamps.tolist()):
+            outlet.push_sample(sample, timestamp, pushthrough)
+        return
+    error = push(outlet.obj, ctypes.c_void_p(values.ctypes.data), ctypes.c_long(values.size),
+                 ctypes.c_void_p(timestamps.ctypes.data), ctypes.c_int(pushthrough))
+    if error is not None and error < 0:
+        raise RuntimeError('LSL push_chunk failed with error %d' % error)
+
+
+class SampleBatch:
+    """Samples waiting to be pushed to one outlet, added by the hub thread and flushed by either thread."""
+
+    def __init__(self, outlet, channels, max_samples, max_seconds=None, dtype=np.float32):
+        self.outlet = outlet
+        self.max_seconds = max_seconds
+        self.values = np.empty((max_samples, channels), dtype=dtype)
+        self.timestamps = np.empty(max_samples, dtype=np.float64)
+        self.count = 0
+        self.deadline = None
+        self.lock = threading.Lock()
+
+    def add(self, values, timestamp, now):
+        """Queue one sample (copied), pushing the batch if it is full or old enough."""
+        with self.lock:
+            if self.count == 0 and self.max_seconds:
+                self.deadline = now + self.max_seconds
+            self.values[self.count] = values
+            self.timestamps[self.count] = timestamp
+            self.count += 1
+            if self.count == len(self.timestamps) or (self.deadline is not None and now >= self.deadline):
+                self._push()
+
+    def flush_due(self, now):
+        """Push the batch if its oldest sample is max_seconds old (now on the LSL clock)."""
+        with self.lock:
+            if self.deadline is not None and now >= self.deadline:
+                self._push()
+
+    def flush(self):
+        with self.lock:
+            self._push()
+
+    def _push(self):
+        if self.count:
+            push_chunk(self.outlet, self.values[:self.count], self.timestamps[:self.count])
+        self.count = 0
+        self.deadline = None
+
+
+def batch_capacity(batch_samples, batch_ms, nominal_srate, armbands=2):
+    """
+    Samples a batch must hold: batch_samples if given, otherwise what
+    `armbands` armbands produce in batch_ms (so the time limit is what flushes).
+    """
+    if batch_samples:
+        return batch_samples
+    return max(1, int(np.ceil(batch_ms / 1000.0 * nominal_srate * armbands)))
@@ -0,0 +1,68 @@
+"""
+Channel layout of the Myo LSL streams, shared by myo_data_collection.py and the
+benchmarks. Only needs pylsl, so it can be imported without the Myo SDK.
+
+The single layout publishes everything as one 29 channel float32 stream at the
+EMG rate. The split layout publishes each armband as three streams instead:
+EMG (8 int8 channels at 200 Hz), IMU (quaternion, acceleration, gyroscope and
+Euler angles as float32 at 50 Hz) and markers (one text channel, irregular
+rate) for state changes such as arm sync, warmup and lock.
+"""
+
+import pylsl
+
+MYO_MAKE_MODEL = 'Thalmic Labs Myo'
+LAYOUTS = ('single', 'split')
+EMG_RATE = 200
+IMU_RATE = 50
+
+lsl_header = ['Device ID', 'Warm?', 'Sync', 'Arm', 'Timestamp', 'Orientation_W', 'Orientation_X', 'Orientation_Y',
+          'Orientation_Z', 'Acc_X', 'Acc_Y', 'Acc_Z', 'Gyro_X', 'Gyro_Y', 'Gyro_Z', 'Pose', 'EMG_1', 'EMG_2',
+          'EMG_3', 'EMG_4', 'EMG_5', 'EMG_6', 'EMG_7', 'EMG_8','Locked', 'RSSI', 'Roll', 'Pitch', 'Yaw']
+
+lsl_units = ['Number', None, None, 'Arm', 'Time', 'Degrees', 'Degrees', 'Degrees', 'Degrees', 'g', 'g', 'g',
+         'Degrees', 'Degrees', 'Degrees', 'Pose', 'mVolts', 'mVolts', 'mVolts', 'mVolts', 'mVolts', 'mVolts', 'mVolts',
+         'mVolts', None, 'Strength', 'Degrees', 'Degrees', 'Degrees']
+
+emg_header = ['EMG_1', 'EMG_2', 'EMG_3', 'EMG_4', 'EMG_5', 'EMG_6', 'EMG_7', 'EMG_8']
+emg_units = ['mVolts'] * 8
+
+imu_header = ['Orientation_W', 'Orientation_X', 'Orientation_Y', 'Orientation_Z', 'Acc_X', 'Acc_Y', 'Acc_Z',
+              'Gyro_X', 'Gyro_Y', 'Gyro_Z', 'Roll', 'Pitch', 'Yaw']
+imu_units = ['Degrees'] * 4 + ['g'] * 3 + ['Degrees'] * 6
+
+marker_header = ['Event']
+marker_units = [None]
+
+
+def add_manufacturer(desc):
+    """Add manufacturer into to a stream's desc"""
+    acq = desc.append_child('acquisition')
+    acq.append_child_value('manufacturer', 'Thalamatic Labs')
+    acq.append_child_value('model', 'Myo Armband')
+
+
+def myo_stream_info(name, source_id, nominal_srate=EMG_RATE, channel_format=pylsl.cf_float32, header=lsl_header,
+                    units=lsl_units, stream_type='Misc'):
+    """StreamInfo for a Myo outlet, with the channel labels and units in its desc."""
+    info = pylsl.StreamInfo(name, stream_type, len(header), nominal_srate=nominal_srate,
+                            channel_format=channel_format, source_id=source_id)
+    desc = info.desc()
+    add_manufacturer(desc)
+    chns = desc.append_child('channels')
+    for key, unit in zip(header, units):
+        chn = chns.append_child('channel')
+        chn.append_child_value('label', key)
+        if unit is not None:
+            chn.append_child_value('unit', unit)
+    return info
+
+
+def split_stream_infos(name, source_id):
+    """StreamInfos of the EMG, IMU and marker outlets of one armband in the split layout."""
+    return (myo_stream_info(name + ' EMG', source_id + '-EMG', EMG_RATE, pylsl.cf_int8, emg_header, emg_units,
+                            'EMG'),
+            myo_stream_info(name + ' IMU', source_id + '-IMU', IMU_RATE, pylsl.cf_float32, imu_header, imu_units,
+                            'IMU'),
+            myo_stream_info(name + ' Markers', source_id + '-Markers', pylsl.IRREGULAR_RATE, pylsl.cf_string,
+                            marker_header, marker_units, 'Markers'))
@@ -0,0 +1,165 @@
+"""
+Binary capture files for Myo EMG and IMU samples, and their conversion to CSV.
+
+<prefix>_emg.bin and <prefix>_imu.bin hold fixed-size little-endian records:
+    emg     uint64 device id, uint64 SDK timestamp, 8 x int8 EMG          (24 bytes)
+    imu     uint64 device id, uint64 SDK timestamp, 4 x float32 quaternion
+            (w, x, y, z), 3 x float32 acceleration, 3 x float32 gyroscope (56 bytes)
+after a header of MAGIC, uint16 version, uint32 length and that many bytes of
+JSON describing the records ({"kind", "fields", "labels", "record_size", ...}),
+padded to 8 bytes. The SDK timestamp is the event's own timestamp in
+microseconds. A reader only needs the header to make sense of the records,
+and a record cut short by a crash at the end of the file is ignored.
+
+    python Myo/myo_binary.py myo_capture_emg.bin [more.bin ...]
+writes myo_capture_emg.csv next to each file.
+"""
+
+import os
+import sys
+import json
+import time
+import struct
+import argparse
+import numpy as np
+
+MAGIC = b'MYOBIN\0\0'
+VERSION = 1
+HEADER_STRUCT = struct.Struct('<8sHI')
+DEFAULT_BLOCK_RECORDS = 8192
+DEFAULT_FLUSH_SECONDS = 5.0
+
+# name, dtype, shape of every record field
+RECORD_FIELDS = {
+    'emg': [('device_id', '<u8', []), ('timestamp', '<u8', []), ('emg', '<i1', [8])],
+    'imu': [('device_id', '<u8', []), ('timestamp', '<u8', []), ('orientation', '<f4', [4]),
+            ('acceleration', '<f4', [3]), ('gyroscope', '<f4', [3])],
+}
+RECORD_LABELS = {
+    'emg': ['Device ID', 'SDK_Timestamp', 'EMG_1', 'EMG_2', 'EMG_3', 'EMG_4', 'EMG_5', 'EMG_6', 'EMG_7', 'EMG_8'],
+    'imu': ['Device ID', 'SDK_Timestamp', 'Orientation_W', 'Orientation_X', 'Orientation_Y', 'Orientation_Z',
+            'Acc_X', 'Acc_Y', 'Acc_Z', 'Gyro_X', 'Gyro_Y', 'Gyro_Z'],
+}
+
+
+def _padding(size):
+    return -size % 8
+
+
+def record_dtype(fields):
+    return np.dtype([(name, dtype, tuple(shape)) for name, dtype, shape in fields])
+
+
+class RecordWriter:
+    """
+    Appends records of one kind to a capture file. Records are filled into a
+    preallocated block that is written out when it is full or flush_seconds
+    old, so the file sees a few large writes instead of one per event.
+    """
+
+    def __init__(self, file_name, kind, block_records=DEFAULT_BLOCK_RECORDS, flush_seconds=DEFAULT_FLUSH_SECONDS):
+        self.file_name = file_name
+        self.kind = kind
+        self.flush_seconds = flush_seconds
+        self.block = np.zeros(block_records, dtype=record_dtype(RECORD_FIELDS[kind]))
+        # Field views, so filling a record does not look the fields up every time
+        self.fields = {name: self.block[name] for name, _, _ in RECORD_FIELDS[kind]}
+        self.count = 0
+        exists = os.path.isfile(file_name) and os.path.getsize(file_name) > 0
+        if exists and read_header(file_name)['fields'] != RECORD_FIELDS[kind]:
+            raise ValueError('%s holds records of a different layout' % file_name)
+        self.file = open(file_name, 'ab')
+        if not exists:
+            meta = json.dumps({'kind': kind, 'fields': RECORD_FIELDS[kind], 'labels': RECORD_LABELS[kind],
+                               'record_size': self.block.dtype.itemsize, 'timestamp_unit': 'us',
+                               'created': time.time()}).encode('utf-8')
+            meta += b' ' * _padding(HEADER_STRUCT.size + len(meta))
+            self.file.write(HEADER_STRUCT.pack(MAGIC, VERSION, len(meta)))
+            self.file.write(meta)
+        self.last_flush = time.monotonic()
+
+    def append(self, device_id, timestamp, *values):
+        """One record: device id, SDK timestamp and the remaining fields in RECORD_FIELDS order."""
+        k = self.count
+        fields = self.fields
+        fields['device_id'][k] = device_id
+        fields['timestamp'][k] = timestamp
+        for (name, _, _), value in zip(RECORD_FIELDS[self.kind][2:], values):
+            fields[name][k] = value
+        self.count = k + 1
+        if self.count == len(self.block):
+            self.flush()
+        elif self.flush_seconds and time.monotonic() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    def flush(self):
+        if self.count:
+            self.file.write(self.block[:self.count].tobytes())
+            self.count = 0
+        self.file.flush()
+        self.last_flush = time.monotonic()
+
+    def close(self):
+        if not self.file.closed:
+            self.flush()
+            self.file.close()
+
+
+def read_header(file_name):
+    with open(file_name, 'rb') as f:
+        start = f.read(HEADER_STRUCT.size)
+        if len(start) < HEADER_STRUCT.size:
+            raise ValueError('%s has no complete header' % file_name)
+        magic, version, length = HEADER_STRUCT.unpack(start)
+        if magic != MAGIC:
+            raise ValueError('%s is not a Myo capture file' % file_name)
+        if version != VERSION:
+            raise ValueError('Unsupported Myo capture version %d' % version)
+        header = json.loads(f.read(length).decode('utf-8'))
+    header['data_offset'] = HEADER_STRUCT.size + length
+    return header
+
+
+def read_records(file_name):
+    """The header and all complete records of a capture file, as a structured array."""
+    header = read_header(file_name)
+    dtype = record_dtype(header['fields'])
+    count = (os.path.getsize(file_name) - header['data_offset']) // dtype.itemsize
+    return header, np.fromfile(file_name, dtype=dtype, count=count, offset=header['data_offset'])
+
+
+def to_csv(file_name, out_name=None, rows_per_block=100000):
+    """Write a capture file as CSV (one column per value, labels from the header); returns the rows written."""
+    header, records = read_records(file_name)
+    out_name = out_name or os.path.splitext(file_name)[0] + '.csv'
+    formats = []
+    for name, dtype, shape in header['fields']:
+        formats += ['%.9g' if np.dtype(dtype).kind == 'f' else '%d'] * int(np.prod(shape, dtype=int))
+    row_format = ','.join(formats) + '\n'
+    with open(out_name, 'w', newline='') as f:
+        f.write(','.join(header['labels']) + '\n')
+        for start in range(0, len(records), rows_per_block):
+            block = records[start:start + rows_per_block]
+            columns = []
+            for name, _, shape in header['fields']:
+                column = block[name]
+                columns += [column] if not shape else [column[:, k] for k in range(shape[0])]
+            f.write(''.join(row_format % row for row in zip(*(column.tolist() for column in columns))))
+    return len(records)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Convert Myo capture files to CSV')
+    parser.add_argument('files', nargs='+', help='<prefix>_emg.bin / <prefix>_imu.bin files')
+    args = parser.parse_args()
+    for file_name in args.files:
+        try:
+            rows = to_csv(file_name)
+        except (ValueError, OSError) as e:
+            print('Could not convert %s: %s' % (file_name, e), file=sys.stderr)
+            continue
+        print('%s: %d rows' % (file_name, rows))
+
+
+if __name__ == '__main__':
+    main()
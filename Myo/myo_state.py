@@ -0,0 +1,133 @@
+"""
+Numeric state of one Myo armband, kept as the LSL sample it is published as.
+
+MyoState holds a float32 array in lsl_header order that the Listener's on_*
+callbacks update in place, so publishing a sample is one copy into the
+outlet instead of formatting the state as text and parsing it back. For the
+split layout it also keeps the EMG as int8 and gathers the IMU channels into
+their own array. Only needs numpy, so it can be imported without the Myo SDK.
+"""
+
+import time
+import ctypes
+from datetime import datetime
+import numpy as np
+from lsl_layout import MYO_MAKE_MODEL, lsl_header, imu_header
+
+CHANNELS = {label: index for index, label in enumerate(lsl_header)}
+DEVICE_ID = CHANNELS['Device ID']
+WARM = CHANNELS['Warm?']
+SYNC = CHANNELS['Sync']
+ARM = CHANNELS['Arm']
+TIMESTAMP = CHANNELS['Timestamp']
+ORIENTATION = slice(CHANNELS['Orientation_W'], CHANNELS['Orientation_Z'] + 1)
+ACCELERATION = slice(CHANNELS['Acc_X'], CHANNELS['Acc_Z'] + 1)
+GYROSCOPE = slice(CHANNELS['Gyro_X'], CHANNELS['Gyro_Z'] + 1)
+POSE = CHANNELS['Pose']
+EMG = slice(CHANNELS['EMG_1'], CHANNELS['EMG_8'] + 1)
+LOCKED = CHANNELS['Locked']
+RSSI = CHANNELS['RSSI']
+EULER = slice(CHANNELS['Roll'], CHANNELS['Yaw'] + 1)
+# Where the channels of the split layout's IMU stream are in values
+IMU = np.array([CHANNELS[label] for label in imu_header])
+
+# Arm as published on LSL; anything else (unknown) is -1
+ARM_CODES = {'right': 0, 'left': 1}
+
+
+class MyoState:
+    """
+    The last known values of one armband. values is the LSL sample; the
+    names of the warmup state, arm and pose are kept for the text outputs.
+    """
+
+    def __init__(self, device_id):
+        self.device_id = device_id
+        self.device_make_model = MYO_MAKE_MODEL
+        self.values = np.zeros(len(lsl_header), dtype=np.float32)
+        self.values[DEVICE_ID] = device_id
+        self.values[ARM] = -1
+        # Pose is not tracked, it is always published as -1
+        self.values[POSE] = -1
+        self.emg_values = np.zeros(EMG.stop - EMG.start, dtype=np.int8)
+        self.imu_values = np.zeros(len(IMU), dtype=np.float32)
+        self.warm = 'unknown'
+        self.sync = None
+        self.arm = 'unknown'
+        self.pose = 'rest'
+        self.locked = False
+        self.time = None
+
+    def set_emg(self, emg):
+        self.values[EMG] = emg
+        self.emg_values[:] = emg
+        self.time = time.time()
+
+    def set_orientation(self, orientation):
+        values = self.values
+        values[ORIENTATION] = (orientation.w, orientation.x, orientation.y, orientation.z)
+        values[EULER] = (orientation.roll, orientation.pitch, orientation.yaw)
+        self.time = time.time()
+
+    def set_acceleration(self, acceleration):
+        self.values[ACCELERATION] = (acceleration.x, acceleration.y, acceleration.z)
+        self.time = time.time()
+
+    def set_gyroscope(self, gyroscope):
+        self.values[GYROSCOPE] = (gyroscope.x, gyroscope.y, gyroscope.z)
+
+    def set_rssi(self, rssi):
+        self.values[RSSI] = rssi
+
+    def set_locked(self, locked):
+        self.locked = locked
+        self.values[LOCKED] = locked
+
+    def set_sync(self, sync, arm=None, warm=None):
+        self.sync = sync
+        self.values[SYNC] = sync is True
+        if arm is not None:
+            self.arm = arm
+            self.values[ARM] = ARM_CODES.get(arm, -1)
+        if warm is not None:
+            self.set_warm(warm)
+
+    def set_warm(self, warm):
+        # Published as 1 once the warmup has completed
+        self.warm = warm
+        self.values[WARM] = warm is True
+
+    def imu_sample(self):
+        """The IMU channels of values, in imu_header order."""
+        np.take(self.values, IMU, out=self.imu_values)
+        return self.imu_values
+
+    def toList(self):
+        """The state as text fields in lsl_header order, like the CSV output."""
+        values = self.values
+        time_text = datetime.fromtimestamp(self.time).strftime('%Y-%m-%d %H:%M:%S %f') if self.time else 'None'
+        fields = [str(self.device_id), str(self.warm), str(self.sync), str(self.arm), time_text]
+        fields += ['%.9g' % v for v in values[ORIENTATION.start:POSE]]
+        fields.append(str(self.pose))
+        fields += ['%d' % v for v in values[EMG]]
+        fields += [str(self.locked), '%.9g' % values[RSSI]]
+        fields += ['%.9g' % v for v in values[EULER]]
+        return fields
+
+    def toCSV(self):
+        return ','.join(self.toList()) + '\n'
+
+
+def push_values(outlet, values, timestamp, pushthrough=True):
+    """
+    outlet.push_sample() for a numpy array of the outlet's channel format,
+    handing liblsl the array's memory instead of converting it value by value.
+    """
+    push = getattr(outlet, 'do_push_sample', None)
+    if push is None:
+        outlet.push_sample(values.tolist(), timestamp, pushthrough)
+        return
+    error = push(outlet.obj, outlet.sample_type.from_buffer(values), ctypes.c_double(timestamp),
+                 ctypes.c_int(pushthrough))
+    if error is not None and error < 0:
+        raise RuntimeError('LSL push_sample failed with error %d' % error)
@@ -0,0 +1,300 @@
+"""
+Where myo_data_collection.py sends the armband state: one Sink per --store
+target, built once at startup by build_sinks().
+
+The Listener turns every SDK callback into one call per sink:
+    connect(event)         an armband connected (its MyoState is new)
+    emg(event)             an EMG sample
+    imu(event)             an IMU sample (after all three IMU callbacks)
+    marker(event, text)    a state change: arm sync, warmup, lock, pose, RSSI...
+    tick()                 every 0.25 s from the main loop: push out what is overdue
+    flush()                push out whatever is batched
+    close()                at shutdown, after the last event
+An Event carries the state and the SDK timestamp and serializes the state at
+most once however many sinks ask for it (Event.csv). Each sink batches on its
+own schedule: the text sinks write every flush_seconds, the LSL sink pushes
+samples as they come or in chunks with --batch-ms / --batch-samples.
+
+A new target is a Sink subclass decorated with @register_sink('name'); it
+becomes a --store choice as soon as its module is imported.
+"""
+
+import sys
+import time
+import numpy as np
+import pylsl
+from lsl_layout import EMG_RATE, IMU_RATE, lsl_header, myo_stream_info, split_stream_infos
+from myo_state import TIMESTAMP, ORIENTATION, ACCELERATION, GYROSCOPE, push_values
+from lsl_batching import DeviceClock, SampleBatch, batch_capacity
+from myo_binary import RecordWriter
+
+SINKS = {}
+
+# MyoState.toCSV() writes its fields in lsl_header order
+FILE_HEADER = ','.join(lsl_header) + '\n'
+
+
+def register_sink(name):
+    """Class decorator that makes a Sink available as --store name."""
+    def register(sink_class):
+        SINKS[name] = sink_class
+        return sink_class
+    return register
+
+
+def build_sinks(names, options, stream_name, source_id):
+    """
+    One sink per distinct name in --store, in order. options are the parsed
+    command line arguments, stream_name and source_id name the LSL streams.
+    """
+    sinks = []
+    for name in dict.fromkeys(names):
+        if name not in SINKS:
+            raise ValueError('Unknown --store target %s (choose from %s)' % (name, ', '.join(sorted(SINKS))))
+        sinks.append(SINKS[name](options, stream_name, source_id))
+    return sinks
+
+
+class Event:
+    """One SDK event of one armband, with its state serialized on demand."""
+
+    def __init__(self, myo_id, state, timestamp):
+        self.myo_id = myo_id
+        self.state = state
+        self.timestamp = timestamp
+        self._csv = None
+
+    @property
+    def csv(self):
+        if self._csv is None:
+            self._csv = self.state.toCSV()
+        return self._csv
+
+
+class Sink:
+    """Does nothing for every event; subclasses override what they use."""
+
+    def __init__(self, options, stream_name, source_id):
+        self.options = options
+        self.stream_name = stream_name
+        self.source_id = source_id
+
+    def connect(self, event):
+        pass
+
+    def emg(self, event):
+        pass
+
+    def imu(self, event):
+        pass
+
+    def marker(self, event, text):
+        pass
+
+    def tick(self):
+        pass
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.flush()
+
+
+class TextSink(Sink):
+    """Collects text lines per output and writes them together every flush_seconds."""
+
+    flush_seconds = 1.0
+
+    def __init__(self, options, stream_name, source_id):
+        super(TextSink, self).__init__(options, stream_name, source_id)
+        self.pending = {}
+        self.next_flush = time.monotonic() + self.flush_seconds
+
+    def write(self, output, text):
+        self.pending.setdefault(output, []).append(text)
+        now = time.monotonic()
+        if now >= self.next_flush:
+            self.flush()
+            self.next_flush = now + self.flush_seconds
+
+    def flush(self):
+        for output, lines in self.pending.items():
+            if lines:
+                output.write(''.join(lines))
+                output.flush()
+                del lines[:]
+
+
+@register_sink('file')
+class FileSink(TextSink):
+    """The state as CSV, EMG samples to -e and IMU samples to -i."""
+
+    def __init__(self, options, stream_name, source_id):
+        super(FileSink, self).__init__(options, stream_name, source_id)
+        options.f_emg.write(FILE_HEADER)
+        options.f_imu.write(FILE_HEADER)
+
+    def emg(self, event):
+        self.write(self.options.f_emg, event.csv)
+
+    def imu(self, event):
+        self.write(self.options.f_imu, event.csv)
+
+
+@register_sink('binary')
+class BinarySink(Sink):
+    """Fixed-size EMG and IMU records in <prefix>_emg.bin and <prefix>_imu.bin (see myo_binary.py)."""
+
+    def __init__(self, options, stream_name, source_id):
+        super(BinarySink, self).__init__(options, stream_name, source_id)
+        self.emg_file = RecordWriter(options.binary_prefix + '_emg.bin', 'emg')
+        self.imu_file = RecordWriter(options.binary_prefix + '_imu.bin', 'imu')
+
+    def emg(self, event):
+        self.emg_file.append(event.myo_id, event.timestamp, event.state.emg_values)
+
+    def imu(self, event):
+        values = event.state.values
+        self.imu_file.append(event.myo_id, event.timestamp, values[ORIENTATION], values[ACCELERATION],
+                             values[GYROSCOPE])
+
+    def flush(self):
+        self.emg_file.flush()
+        self.imu_file.flush()
+
+    def close(self):
+        self.emg_file.close()
+        self.imu_file.close()
+
+
+@register_sink('stdout')
+class StdoutSink(TextSink):
+    """The state as CSV on stdout for every EMG sample."""
+
+    flush_seconds = 0.1
+
+    def emg(self, event):
+        self.write(sys.stdout, event.csv)
+
+
+@register_sink('stdout_feedback')
+class FeedbackSink(TextSink):
+    """Armband, arm and warmup state on stdout for every EMG sample."""
+
+    flush_seconds = 0.1
+
+    def emg(self, event):
+        state = event.state
+        self.write(sys.stdout, '%s %s %s\n' % (event.myo_id, state.arm, state.warm))
+
+
+class ArmbandOutlets:
+    """The EMG, IMU and marker outlets of one armband in the split layout."""
+
+    def __init__(self, name, source_id, options, batching):
+        emg_info, imu_info, marker_info = split_stream_infos(name, source_id)
+        self.emg = pylsl.StreamOutlet(emg_info)
+        self.imu = pylsl.StreamOutlet(imu_info)
+        self.markers = pylsl.StreamOutlet(marker_info)
+        self.emg_batch = self.imu_batch = None
+        if batching:
+            self.emg_batch = SampleBatch(self.emg, emg_info.channel_count(),
+                                         batch_capacity(options.batch_samples, options.batch_ms, EMG_RATE, 1),
+                                         options.batch_ms / 1000.0, np.int8)
+            self.imu_batch = SampleBatch(self.imu, imu_info.channel_count(),
+                                         batch_capacity(options.batch_samples, options.batch_ms, IMU_RATE, 1),
+                                         options.batch_ms / 1000.0)
+
+    def flush_due(self, now):
+        if self.emg_batch is not None:
+            self.emg_batch.flush_due(now)
+            self.imu_batch.flush_due(now)
+
+    def flush(self):
+        if self.emg_batch is not None:
+            self.emg_batch.flush()
+            self.imu_batch.flush()
+
+
+@register_sink('lsl')
+class LslSink(Sink):
+    """
+    The state on LSL, as one stream for all armbands (--layout single) or as
+    EMG, IMU and marker streams per armband (--layout split).
+    """
+
+    def __init__(self, options, stream_name, source_id):
+        super(LslSink, self).__init__(options, stream_name, source_id)
+        self.split = options.layout == 'split'
+        # With batching, samples are stamped from the SDK's event timestamps and pushed a chunk at a time
+        self.batching = options.batch_ms > 0 or options.batch_samples > 0
+        self.batch = None
+        self.device_clocks = {}
+        # Split layout: outlets are made per armband as it connects
+        self.armband_outlets = {}
+        if not self.split:
+            info = myo_stream_info(self.stream_name, self.source_id)
+            self.outlet = pylsl.StreamOutlet(info)
+            if self.batching:
+                capacity = batch_capacity(options.batch_samples, options.batch_ms, info.nominal_srate())
+                self.batch = SampleBatch(self.outlet, info.channel_count(), capacity, options.batch_ms / 1000.0)
+
+    def sample_stamp(self, event, lsl_stamp):
+        if self.batching:
+            return self.device_clocks[event.myo_id].to_lsl(event.timestamp, lsl_stamp)
+        return lsl_stamp
+
+    @staticmethod
+    def push(outlet, batch, values, sample_stamp, lsl_stamp):
+        if batch is None:
+            push_values(outlet, values, sample_stamp)
+        else:
+            batch.add(values, sample_stamp, lsl_stamp)
+
+    def connect(self, event):
+        if event.myo_id not in self.device_clocks:
+            self.device_clocks[event.myo_id] = DeviceClock()
+            if self.split:
+                number = len(self.armband_outlets) + 1
+                self.armband_outlets[event.myo_id] = ArmbandOutlets(
+                    '%s %d' % (self.stream_name, number), '%s-%d' % (self.source_id, number), self.options, self.batching)
+
+    def emg(self, event):
+        state = event.state
+        lsl_stamp = pylsl.local_clock()
+        sample_stamp = self.sample_stamp(event, lsl_stamp)
+        if self.split:
+            outlets = self.armband_outlets[event.myo_id]
+            self.push(outlets.emg, outlets.emg_batch, state.emg_values, sample_stamp, lsl_stamp)
+        else:
+            # The state is already the LSL sample, only the timestamp channel changes
+            state.values[TIMESTAMP] = sample_stamp
+            self.push(self.outlet, self.batch, state.values, sample_stamp, lsl_stamp)
+
+    def imu(self, event):
+        # The single layout sends the IMU values along with every EMG sample
+        if self.split:
+            outlets = self.armband_outlets[event.myo_id]
+            lsl_stamp = pylsl.local_clock()
+            self.push(outlets.imu, outlets.imu_batch, event.state.imu_sample(), self.sample_stamp(event, lsl_stamp),
+                      lsl_stamp)
+
+    def marker(self, event, text):
+        if self.split and event.myo_id in self.armband_outlets:
+            outlets = self.armband_outlets[event.myo_id]
+            outlets.markers.push_sample([text], self.sample_stamp(event, pylsl.local_clock()))
+
+    def tick(self):
+        # Batches of an armband that went quiet; the hub thread may be adding outlets meanwhile
+        now = pylsl.local_clock()
+        if self.batch is not None:
+            self.batch.flush_due(now)
+        for outlets in list(self.armband_outlets.values()):
+            outlets.flush_due(now)
+
+    def flush(self):
+        if self.batch is not None:
+            self.batch.flush()
+        for outlets in list(self.armband_outlets.values()):
+            outlets.flush()
@@ -0,0 +1,266 @@
+"""
+Threaded acquisition engine.
+
+Every inlet gets its own reader thread that blocks in pull_chunk(timeout=...)
+instead of busy-polling, fills the stream's column buffer and hands finished
+chunks to one shared writer thread. A slow or silent stream only ever blocks
+its own reader.
+"""
+
+import time
+import ctypes
+import logging
+import threading
+import numpy as np
+import pylsl
+from Util.writequeue import ChunkQueue, chunk_nbytes
+from Util.telemetry import StreamStats
+from Util.timesync import TimestampCorrector, OffsetRefresher
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_PULL_TIMEOUT = 0.2  # Longest a reader waits in pull_chunk() before checking for shutdown
+IRREGULAR_RATE_MAX_SAMPLES = 1024
+
+
+class ChunkPuller:
+    """
+    Pulls an inlet straight into preallocated NumPy arrays.
+
+    After pull() returns n, data[:n] and timestamps[:n] hold the new samples.
+    For numeric streams the inlet's C pull function is called directly with
+    both arrays, so nothing is allocated per sample; other inlets go through
+    pull_chunk(dest_obj=...) and string streams through plain pull_chunk().
+    """
+
+    def __init__(self, inlet, channels, dtype, max_samples):
+        self.inlet = inlet
+        self.channels = channels
+        self.dtype = np.dtype(dtype)
+        self.timestamps = np.empty(max_samples, dtype=np.float64)
+        self.data = np.empty((max_samples, channels), dtype=self.dtype)
+        self.numeric = self.dtype.kind != 'O'
+        self.direct = self.numeric and all(hasattr(inlet, attr) for attr in ('do_pull_chunk', 'obj', 'value_type'))
+        if self.direct:
+            self._data_buff = (inlet.value_type * self.data.size).from_buffer(self.data)
+            self._ts_buff = (ctypes.c_double * max_samples).from_buffer(self.timestamps)
+            self._errcode = ctypes.c_int()
+
+    def pull(self, timeout):
+        max_samples = len(self.timestamps)
+        if self.direct:
+            n = self.inlet.do_pull_chunk(self.inlet.obj, ctypes.byref(self._data_buff), ctypes.byref(self._ts_buff),
+                                         self.data.size, max_samples, ctypes.c_double(timeout),
+                                         ctypes.byref(self._errcode))
+            if self._errcode.value == -2:
+                raise pylsl.LostError('the stream has been lost.')
+            if self._errcode.value < 0:
+                raise RuntimeError('pull_chunk failed with LSL error %d' % self._errcode.value)
+            return n // self.channels
+        if self.numeric:
+            _, timestamps = self.inlet.pull_chunk(timeout=timeout, max_samples=max_samples, dest_obj=self.data)
+        else:
+            samples, timestamps = self.inlet.pull_chunk(timeout=timeout, max_samples=max_samples)
+        n = len(timestamps)
+        if n:
+            self.timestamps[:n] = timestamps
+            if not self.numeric:
+                self.data[:n] = samples
+        return n
+
+
+def max_samples_for(nominal_srate, pull_timeout):
+    # Enough room for a couple of pull timeouts worth of samples
+    if nominal_srate <= 0:
+        return IRREGULAR_RATE_MAX_SAMPLES
+    return max(32, int(np.ceil(nominal_srate * pull_timeout * 2)))
+
+
+class InletReader(threading.Thread):
+    """Pulls one inlet into its StreamBuffer and queues drained chunks."""
+
+    def __init__(self, name, inlet, buffer, output, nominal_srate, pull_timeout=DEFAULT_PULL_TIMEOUT,
+                 corrector=None, preview=None):
+        super(InletReader, self).__init__(name='reader-' + name, daemon=True)
+        self.stream = name
+        self.inlet = inlet
+        self.buffer = buffer
+        self.output = output
+        self.pull_timeout = pull_timeout
+        self.nominal_srate = nominal_srate
+        self.puller = ChunkPuller(inlet, len(buffer.labels), buffer.dtype, max_samples_for(nominal_srate, pull_timeout))
+        self.samples = 0
+        self.last_sample = time.monotonic()
+        self.stats = StreamStats(nominal_srate)
+        self.corrector = corrector
+        self.preview = preview
+        self.stopping = threading.Event()
+
+    def silence(self, now=None):
+        """Seconds since the last sample (or since the reader was created)."""
+        return (time.monotonic() if now is None else now) - self.last_sample
+
+    def run(self):
+        puller = self.puller
+        try:
+            while not self.stopping.is_set():
+                n = puller.pull(self.pull_timeout)
+                if n:
+                    # Views into the pull arrays, copied once into the column buffer
+                    self.buffer.append(puller.data[:n], puller.timestamps[:n])
+                    self.samples += n
+                    self.last_sample = time.monotonic()
+                    self.stats.update(puller.timestamps[:n])
+                    if self.preview is not None:
+                        self.preview.update(self.stream, puller.data[:n], puller.timestamps[:n])
+                if self.buffer.due():
+                    self.output.put(self.drain())
+        except Exception:
+            logger.exception('Reader for %s stopped', self.stream)
+        finally:
+            if self.buffer.size:
+                self.output.put(self.drain())
+
+    def drain(self):
+        chunk = self.buffer.drain()
+        if self.corrector is not None:
+            chunk.corrected = self.corrector.correct(chunk.timestamps)
+        return chunk
+
+    def stop(self):
+        self.stopping.set()
+
+
+class WriterStage(threading.Thread):
+    """Writes chunks from the bounded ChunkQueue through the recorder's per-stream writers."""
+
+    def __init__(self, recorder, chunks):
+        super(WriterStage, self).__init__(name='writer', daemon=True)
+        self.recorder = recorder
+        self.chunks = chunks
+
+    def run(self):
+        while True:
+            chunk = self.chunks.get()
+            if chunk is None:
+                break
+            try:
+                self.recorder.write(chunk)
+                self.chunks.record_written(chunk_nbytes(chunk))
+            except Exception:
+                logger.exception('Could not write chunk for %s', chunk.stream)
+
+
+class AcquisitionEngine:
+    """One reader thread per inlet feeding a single writer thread; inlets can come and go while it runs."""
+
+    def __init__(self, recorder, pull_timeout=DEFAULT_PULL_TIMEOUT, queue_size=256, queue_policy='block',
+                 clock_correction=False, dejitter_seconds=0):
+        self.recorder = recorder
+        self.pull_timeout = pull_timeout
+        # Corrected timestamps need writers opened with corrected=True
+        self.clock_correction = clock_correction
+        self.dejitter_seconds = dejitter_seconds
+        self.chunks = ChunkQueue(queue_size, queue_policy)
+        self.readers = {}
+        self.lock = threading.Lock()
+        self.writer = WriterStage(recorder, self.chunks)
+        # Clock offsets are fetched off the reader threads
+        self.offsets = OffsetRefresher(self.correctors) if clock_correction else None
+        self.running = False
+
+    def add_inlet(self, inlet, meta):
+        """Start recording an inlet. Returns None if the stream already has a live reader."""
+        with self.lock:
+            if self.has_reader(meta.name):
+                return None
+            if meta.name in self.recorder.streams:
+                if self.recorder.streams[meta.name].labels != meta.labels:
+                    logger.warning('%s came back with different channels, not recording it', meta.name)
+                    return None
+                # Same file and buffer, but events should name the new outlet
+                self.recorder.streams[meta.name] = meta
+            else:
+                self.recorder.add_stream(meta)
+            corrector = None
+            if self.clock_correction or self.dejitter_seconds:
+                corrector = TimestampCorrector(inlet, meta.nominal_srate, self.dejitter_seconds, self.clock_correction)
+            reader = InletReader(meta.name, inlet, self.recorder.buffers[meta.name], self.chunks,
+                                 meta.nominal_srate, self.pull_timeout, corrector, self.recorder.preview)
+            self.readers[meta.name] = reader
+            if self.running:
+                reader.start()
+        self.recorder.log_event('attach', meta)
+        return reader
+
+    def has_reader(self, name):
+        reader = self.readers.get(name)
+        return reader is not None and (reader.is_alive() or not self.running)
+
+    def readers_matching(self, prefix):
+        with self.lock:
+            return [reader for name, reader in self.readers.items() if name.startswith(prefix)]
+
+    def retire(self, names):
+        """Stop the readers of the named streams; their files stay open for a later attach."""
+        with self.lock:
+            retired = [self.readers.pop(name) for name in names if name in self.readers]
+        for reader in retired:
+            reader.stop()
+            if reader.is_alive():
+                reader.join()
+            self.recorder.log_event('detach', self.recorder.streams[reader.stream])
+        return [reader.stream for reader in retired]
+
+    def retire_silent(self, max_silence):
+        """
+        Stop readers that have not produced a sample for max_silence seconds
+        (or whose thread died). Irregular-rate streams (markers) may be quiet
+        for any length of time, so silence alone never retires them.
+        """
+        now = time.monotonic()
+        with self.lock:
+            dead = [name for name, reader in self.readers.items()
+                    if not reader.is_alive()
+                    or (reader.nominal_srate > 0 and reader.silence(now) >= max_silence)]
+        return self.retire(dead)
+
+    def start(self):
+        self.running = True
+        self.writer.start()
+        with self.lock:
+            for reader in self.readers.values():
+                reader.start()
+        if self.offsets is not None:
+            self.offsets.start()
+
+    def sample_counts(self):
+        with self.lock:
+            return {name: reader.samples for name, reader in self.readers.items()}
+
+    def correctors(self):
+        return [reader.corrector for reader in self.reader_list() if reader.corrector is not None]
+
+    def reader_list(self):
+        with self.lock:
+            return list(self.readers.values())
+
+    def queue_stats(self):
+        return self.chunks.stats()
+
+    def stop(self):
+        if self.offsets is not None:
+            self.offsets.stop()
+        with self.lock:
+            readers = list(self.readers.values())
+        for reader in readers:
+            reader.stop()
+        for reader in readers:
+            if reader.is_alive():
+                reader.join()
+        # The writer empties the queue before get() reports it closed
+        self.chunks.close()
+        if self.writer.is_alive():
+            self.writer.join()
+        self.recorder.close()
+        self.running = False
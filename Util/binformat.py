@@ -0,0 +1,374 @@
+"""
+Append-only binary recording format for LSL streams.
+
+<prefix>_data.bin layout:
+    header  MAGIC, uint16 version, uint32 length, then that many bytes of JSON
+            ({"stream", "labels", "dtypes", "corrected"}), padded to 8 bytes
+    chunks  repeated frames of CHUNK_MAGIC, uint32 sample count, uint64 payload
+            length, uint32 CRC32 of the payload (version 2, padded to 24
+            bytes), followed by the payload: float64 LSL timestamps, float64
+            corrected timestamps if the header's "corrected" is true, and then
+            each channel column in its own dtype, every array padded to 8 bytes.
+            Text columns (dtype "|O") are stored as uint32 UTF-8 byte lengths
+            followed by the UTF-8 bytes, each part padded to 8 bytes
+
+<prefix>_data.idx holds one INDEX_DTYPE record per chunk (file offset of the
+frame, sample count, first and last timestamp), so a reader can memory-map the
+data file and go straight to the chunks overlapping a time window. Version 1
+files (frames without a CRC) are still read.
+"""
+
+import os
+import json
+import zlib
+import mmap
+import time
+import struct
+import numpy as np
+
+MAGIC = b'SPLSLBIN'
+VERSION = 2
+HEADER_STRUCT = struct.Struct('<8sHI')
+CHUNK_MAGIC = b'CHNK'
+CHUNK_STRUCT = struct.Struct('<4sIQI4x')
+CHUNK_STRUCT_V1 = struct.Struct('<4sIQ')
+INDEX_DTYPE = np.dtype([('offset', '<u8'), ('samples', '<u8'), ('t_start', '<f8'), ('t_end', '<f8')])
+
+
+def _padding(size):
+    return -size % 8
+
+
+def _column_bytes(column):
+    """The payload bytes of one column, padded to 8 bytes."""
+    if column.dtype.kind == 'O':
+        encoded = [str(value).encode('utf-8') for value in column]
+        lengths = np.array([len(value) for value in encoded], dtype='<u4')
+        text = b''.join(encoded)
+        return lengths.tobytes() + b'\0' * _padding(lengths.nbytes) + text + b'\0' * _padding(len(text))
+    column = np.ascontiguousarray(column)
+    return column.tobytes() + b'\0' * _padding(column.nbytes)
+
+
+def _read_column(buffer, dtype, n, offset):
+    """The column of n values at offset in buffer, and the offset after it."""
+    if dtype.kind != 'O':
+        column = np.frombuffer(buffer, dtype=dtype, count=n, offset=offset)
+        return column, offset + column.nbytes + _padding(column.nbytes)
+    lengths = np.frombuffer(buffer, dtype='<u4', count=n, offset=offset)
+    offset += lengths.nbytes + _padding(lengths.nbytes)
+    ends = np.cumsum(lengths, dtype=np.int64)
+    size = int(ends[-1]) if n else 0
+    text = bytes(buffer[offset:offset + size])
+    column = np.empty(n, dtype=object)
+    column[:] = [text[end - length:end].decode('utf-8') for end, length in zip(ends.tolist(), lengths.tolist())]
+    return column, offset + size + _padding(size)
+
+
+def index_file_name(file_name):
+    return os.path.splitext(file_name)[0] + '.idx'
+
+
+def chunk_struct(version):
+    return CHUNK_STRUCT_V1 if version == 1 else CHUNK_STRUCT
+
+
+def _unpack_frame(frame_struct, buffer, offset=0):
+    """magic, sample count, payload length and CRC (None in version 1 files) of a frame header."""
+    fields = frame_struct.unpack_from(buffer, offset)
+    return fields if len(fields) == 4 else fields + (None, )
+
+
+def frame_size(buffer, offset, frame_struct):
+    """Length of the frame at offset in buffer, 0 if it is incomplete, corrupt or not a frame."""
+    size = frame_struct.size
+    if offset + size > len(buffer):
+        return 0
+    magic, n, payload, crc = _unpack_frame(frame_struct, buffer, offset)
+    if magic != CHUNK_MAGIC or offset + size + payload > len(buffer):
+        return 0
+    if crc is not None and zlib.crc32(buffer[offset + size:offset + size + payload]) & 0xffffffff != crc:
+        return 0
+    return size + payload
+
+
+class BinaryStreamWriter:
+    """Appends chunks of one stream to <prefix>_data.bin and its index."""
+
+    def __init__(self, file_name, labels, buffer_bytes=1 << 20, flush_seconds=10, corrected=False, fsync_seconds=0):
+        self.file_name = file_name
+        self.labels = list(labels)
+        self.corrected = corrected
+        self.buffer_bytes = buffer_bytes
+        self.flush_seconds = flush_seconds
+        self.fsync_seconds = fsync_seconds
+        self.file = None
+        self.index = None
+        self.version = VERSION
+        self.offset = 0
+        self.pending = 0
+        self.bytes_written = 0
+        self.last_flush = self.last_sync = time.monotonic()
+
+    def _open(self, chunk):
+        dtypes = [column.dtype.str for column in chunk.columns]
+        exists = os.path.isfile(self.file_name) and os.path.getsize(self.file_name) > 0
+        if exists:
+            header = read_header(self.file_name)
+            if (header['labels'] != self.labels or header['dtypes'] != dtypes
+                    or header.get('corrected', False) != self.corrected):
+                raise ValueError('%s was recorded with a different channel layout' % self.file_name)
+            # Keep appending frames the way the file was started
+            self.version = header['version']
+        self.file = open(self.file_name, 'ab', buffering=self.buffer_bytes)
+        self.index = open(index_file_name(self.file_name), 'ab')
+        if not exists:
+            meta = json.dumps({'stream': chunk.stream, 'labels': self.labels, 'dtypes': dtypes,
+                               'corrected': self.corrected}).encode('utf-8')
+            meta += b' ' * _padding(HEADER_STRUCT.size + len(meta))
+            self.file.write(HEADER_STRUCT.pack(MAGIC, VERSION, len(meta)))
+            self.file.write(meta)
+        self.offset = self.file.tell()
+
+    def write(self, chunk):
+        n = len(chunk)
+        if n == 0:
+            return
+        if self.file is None:
+            self._open(chunk)
+        arrays = [np.ascontiguousarray(chunk.timestamps, dtype='<f8')]
+        if self.corrected:
+            corrected = chunk.corrected if chunk.corrected is not None else np.full(n, np.nan)
+            arrays.append(np.ascontiguousarray(corrected, dtype='<f8'))
+        arrays += list(chunk.columns)
+        data = b''.join(_column_bytes(array) for array in arrays)
+        if self.version == 1:
+            frame = CHUNK_STRUCT_V1.pack(CHUNK_MAGIC, n, len(data))
+        else:
+            frame = CHUNK_STRUCT.pack(CHUNK_MAGIC, n, len(data), zlib.crc32(data) & 0xffffffff)
+        self.file.write(frame)
+        self.file.write(data)
+        record = np.array([(self.offset, n, chunk.timestamps[0], chunk.timestamps[-1])], dtype=INDEX_DTYPE)
+        self.index.write(record.tobytes())
+        self.offset += len(frame) + len(data)
+        self.pending += len(frame) + len(data)
+        self.bytes_written = self.offset
+        now = time.monotonic()
+        if (self.pending >= self.buffer_bytes or now - self.last_flush >= self.flush_seconds
+                or (self.fsync_seconds and now - self.last_sync >= self.fsync_seconds)):
+            self.flush(now)
+
+    def flush(self, now=None):
+        now = time.monotonic() if now is None else now
+        if self.file is not None:
+            self.file.flush()
+            self.index.flush()
+            if self.fsync_seconds and now - self.last_sync >= self.fsync_seconds:
+                # Frames first; an index ahead of the data is rebuilt by the reader anyway
+                os.fsync(self.file.fileno())
+                os.fsync(self.index.fileno())
+                self.last_sync = now
+        self.pending = 0
+        self.last_flush = now
+
+    def close(self):
+        if self.file is not None and not self.file.closed:
+            self.file.flush()
+            self.index.flush()
+            if self.fsync_seconds:
+                os.fsync(self.file.fileno())
+                os.fsync(self.index.fileno())
+            self.file.close()
+            self.index.close()
+
+
+def _parse_header(buffer):
+    magic, version, length = HEADER_STRUCT.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError('Not a binary LSL recording')
+    if version not in (1, VERSION):
+        raise ValueError('Unsupported binary recording version %d' % version)
+    header = json.loads(bytes(buffer[HEADER_STRUCT.size:HEADER_STRUCT.size + length]).decode('utf-8'))
+    header['version'] = version
+    header['data_offset'] = HEADER_STRUCT.size + length
+    return header
+
+
+def read_header(file_name):
+    with open(file_name, 'rb') as f:
+        start = f.read(HEADER_STRUCT.size)
+        length = HEADER_STRUCT.unpack(start)[2]
+        return _parse_header(start + f.read(length))
+
+
+def _read_exact(f, size):
+    # Decompressing readers may return less than asked for
+    parts = []
+    while size > 0:
+        data = f.read(size)
+        if not data:
+            break
+        parts.append(data)
+        size -= len(data)
+    return b''.join(parts)
+
+
+def iter_file_chunks(f):
+    """
+    Read a recording sequentially from a binary file object (e.g. a compressed
+    segment from Util.segments.open_segment). Returns the header and a
+    generator of (timestamps, corrected, columns) per chunk; corrected is None
+    for files without corrected timestamps. Stops at the first incomplete
+    frame or, in version 2 files, the first frame whose CRC does not match.
+    """
+    start = _read_exact(f, HEADER_STRUCT.size)
+    length = HEADER_STRUCT.unpack(start)[2]
+    header = _parse_header(start + _read_exact(f, length))
+    dtypes = [np.dtype(dtype) for dtype in header['dtypes']]
+    corrected = header.get('corrected', False)
+    frame_struct = chunk_struct(header['version'])
+
+    def chunks():
+        while True:
+            frame = _read_exact(f, frame_struct.size)
+            if len(frame) < frame_struct.size:
+                return
+            magic, n, size, crc = _unpack_frame(frame_struct, frame)
+            if magic != CHUNK_MAGIC:
+                return
+            payload = _read_exact(f, size)
+            if len(payload) < size or (crc is not None and zlib.crc32(payload) & 0xffffffff != crc):
+                return
+            offset = 0
+            arrays = []
+            for dtype in [np.dtype('<f8')] * (2 if corrected else 1) + dtypes:
+                array, offset = _read_column(payload, dtype, n, offset)
+                arrays.append(array)
+            if corrected:
+                yield arrays[0], arrays[1], arrays[2:]
+            else:
+                yield arrays[0], None, arrays[1:]
+
+    return header, chunks()
+
+
+class BinaryStreamReader:
+    """Memory-maps a binary recording and reads chunks by index."""
+
+    def __init__(self, file_name):
+        self.file_name = file_name
+        self._file = open(file_name, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        header = _parse_header(self._map)
+        self.stream = header['stream']
+        self.labels = header['labels']
+        self.dtypes = [np.dtype(dtype) for dtype in header['dtypes']]
+        self.corrected = header.get('corrected', False)
+        self.version = header['version']
+        self.frame_struct = chunk_struct(self.version)
+        self.data_offset = header['data_offset']
+        self.index = self._load_index()
+
+    def _load_index(self):
+        index_name = index_file_name(self.file_name)
+        if os.path.isfile(index_name):
+            index = np.fromfile(index_name, dtype=INDEX_DTYPE)
+            end = self._frame_end(int(index['offset'][-1])) if len(index) else self.data_offset
+            # The index is flushed separately, so rebuild it unless it covers the data file exactly
+            if end == len(self._map):
+                return index
+        return self.scan()
+
+    def _frame_end(self, offset):
+        if offset + self.frame_struct.size > len(self._map):
+            return len(self._map) + 1
+        payload = _unpack_frame(self.frame_struct, self._map, offset)[2]
+        return offset + self.frame_struct.size + payload
+
+    def scan(self):
+        """Rebuild the index by walking the chunk frames, up to the first incomplete or corrupt one."""
+        records = []
+        offset = self.data_offset
+        while True:
+            size = frame_size(self._map, offset, self.frame_struct)
+            if not size:
+                break
+            n = _unpack_frame(self.frame_struct, self._map, offset)[1]
+            timestamps = np.frombuffer(self._map, dtype='<f8', count=n, offset=offset + self.frame_struct.size)
+            records.append((offset, n, timestamps[0], timestamps[-1]))
+            offset += size
+        return np.array(records, dtype=INDEX_DTYPE)
+
+    def __len__(self):
+        return len(self.index)
+
+    @property
+    def sample_count(self):
+        return int(self.index['samples'].sum())
+
+    def chunk(self, i, corrected=False):
+        """
+        Timestamps and channel columns of chunk i, as read-only views into the
+        file. With corrected=True the corrected timestamps are returned instead
+        of the raw ones.
+        """
+        if corrected and not self.corrected:
+            raise ValueError('%s has no corrected timestamps' % self.file_name)
+        offset = int(self.index['offset'][i]) + self.frame_struct.size
+        n = int(self.index['samples'][i])
+        timestamps = np.frombuffer(self._map, dtype='<f8', count=n, offset=offset)
+        offset += timestamps.nbytes + _padding(timestamps.nbytes)
+        if self.corrected:
+            corrected_timestamps = np.frombuffer(self._map, dtype='<f8', count=n, offset=offset)
+            offset += corrected_timestamps.nbytes + _padding(corrected_timestamps.nbytes)
+            if corrected:
+                timestamps = corrected_timestamps
+        columns = []
+        for dtype in self.dtypes:
+            column, offset = _read_column(self._map, dtype, n, offset)
+            columns.append(column)
+        return timestamps, columns
+
+    def chunks_between(self, t_start=None, t_end=None):
+        """Indices of the chunks that overlap [t_start, t_end]."""
+        first, last = 0, len(self.index)
+        if t_start is not None:
+            # Chunks are written in time order, so both bounds are sorted
+            first = int(np.searchsorted(self.index['t_end'], t_start, side='left'))
+        if t_end is not None:
+            last = int(np.searchsorted(self.index['t_start'], t_end, side='right'))
+        return range(first, max(first, last))
+
+    def read(self, t_start=None, t_end=None, corrected=False):
+        """
+        Timestamps and columns for the samples in [t_start, t_end] (raw LSL
+        time). With corrected=True the corrected timestamps are returned.
+        """
+        chunks = self.chunks_between(t_start, t_end)
+        if not len(chunks):
+            return np.empty(0, dtype='<f8'), [np.empty(0, dtype=dtype) for dtype in self.dtypes]
+        parts = [self.chunk(i) for i in chunks]
+        timestamps = np.concatenate([part[0] for part in parts])
+        columns = [np.concatenate([part[1][k] for part in parts]) for k in range(len(self.dtypes))]
+        keep = np.ones(len(timestamps), dtype=bool)
+        if t_start is not None:
+            keep &= timestamps >= t_start
+        if t_end is not None:
+            keep &= timestamps <= t_end
+        if corrected:
+            timestamps = np.concatenate([self.chunk(i, corrected=True)[0] for i in chunks])
+        return timestamps[keep], [column[keep] for column in columns]
+
+    def close(self):
+        try:
+            self._map.close()
+        except BufferError:
+            # Views returned by chunk() are still alive, the map goes away with them
+            pass
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,263 @@
+"""
+SQLite catalog of the recordings in a data directory.
+
+One row per data file (or segment): participant_name, participant_session
+and stream from its place in the [File Info] layout
+(<directory>/<participant_name>/<participant_session>/<stream>/), the channel
+list, sample count, first and last timestamp and, for capture_shapes.py
+trials, the trial_id and label. The Recorder and capture_shapes.py keep it up
+to date while they write, scan() catches up with files recorded without it,
+and find() answers from indexed columns without opening any data file.
+
+Recordings are timed in LSL seconds (clock 'lsl'), shape trials in Unix
+seconds (clock 'unix').
+"""
+
+import os
+import io
+import json
+import sqlite3
+import threading
+import numpy as np
+import pandas as pd
+from Util import binformat
+from Util.export import is_shapes_trial, SHAPES_STREAM, SHAPES_HEADER
+from Util.merge import recording_files, session_streams, is_binary, TIME_COLUMNS
+from Util.segments import read_manifest, open_segment, COMPRESSION_EXTENSIONS
+
+DEFAULT_CATALOG_FILE = 'catalog.sqlite'
+COLUMNS = ('path', 'participant_name', 'participant_session', 'stream', 'channels', 'samples', 't_start', 't_end',
+           'clock', 'trial_id', 'label', 'size', 'mtime')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    participant_name TEXT,
+    participant_session TEXT,
+    stream TEXT,
+    channels TEXT,
+    samples INTEGER,
+    t_start REAL,
+    t_end REAL,
+    clock TEXT,
+    trial_id TEXT,
+    label TEXT,
+    size INTEGER,
+    mtime REAL
+);
+CREATE INDEX IF NOT EXISTS files_participant ON files (participant_name, participant_session);
+CREATE INDEX IF NOT EXISTS files_stream ON files (stream, t_start);
+CREATE INDEX IF NOT EXISTS files_label ON files (label);
+CREATE INDEX IF NOT EXISTS files_time ON files (t_start, t_end);
+"""
+
+
+def _recorded_name(file_name):
+    # Segments are compressed after they are catalogued, so rows use the name they were recorded under
+    for extension in COMPRESSION_EXTENSIONS.values():
+        if file_name.endswith(extension):
+            return file_name[:-len(extension)]
+    return file_name
+
+
+def open_catalog(config):
+    """The Catalog set up in config's [File Info] (catalog, relative to directory); None if catalog is empty."""
+    fileInfo = config['File Info']
+    name = fileInfo.get('catalog', DEFAULT_CATALOG_FILE)
+    if not name:
+        return None
+    directory = fileInfo.get('directory', './data/')
+    os.makedirs(directory, exist_ok=True)
+    return Catalog(os.path.join(directory, name), directory)
+
+
+class Catalog:
+    """The catalog of one data directory, safe to share between threads."""
+
+    def __init__(self, file_name, directory):
+        self.file_name = file_name
+        self.directory = directory
+        self.lock = threading.Lock()
+        self.connection = sqlite3.connect(file_name, check_same_thread=False)
+        self.connection.row_factory = sqlite3.Row
+        with self.lock, self.connection:
+            self.connection.executescript(SCHEMA)
+
+    def relative_path(self, file_name):
+        """file_name relative to the data directory (absolute if it is outside), with / separators."""
+        path = os.path.abspath(_recorded_name(file_name))
+        try:
+            relative = os.path.relpath(path, os.path.abspath(self.directory))
+        except ValueError:
+            # Another drive on Windows
+            relative = os.pardir
+        if relative.startswith(os.pardir):
+            return path.replace(os.sep, '/')
+        return relative.replace(os.sep, '/')
+
+    def entry(self, file_name, stream=None, channels=(), samples=0, t_start=None, t_end=None, clock='lsl',
+              trial_id=None, label=None):
+        """A row for file_name; participant, session and (unless given) stream come from its path."""
+        path = self.relative_path(file_name)
+        parts = path.split('/')
+        inside = not os.path.isabs(path)
+        if stream is None and inside and len(parts) >= 4:
+            stream = parts[2]
+        exists = os.path.isfile(file_name)
+        return {
+            'path': path,
+            'participant_name': parts[0] if inside and len(parts) >= 3 else None,
+            'participant_session': parts[1] if inside and len(parts) >= 3 else None,
+            'stream': stream,
+            'channels': json.dumps(list(channels)),
+            'samples': int(samples),
+            't_start': None if t_start is None else float(t_start),
+            't_end': None if t_end is None else float(t_end),
+            'clock': clock,
+            'trial_id': trial_id,
+            'label': label,
+            'size': os.path.getsize(file_name) if exists else None,
+            'mtime': os.path.getmtime(file_name) if exists else None,
+        }
+
+    def update(self, entries):
+        """Insert or replace rows made by entry(), in one transaction."""
+        rows = [tuple(entry[column] for column in COLUMNS) for entry in entries]
+        if not rows:
+            return
+        with self.lock, self.connection:
+            self.connection.executemany('INSERT OR REPLACE INTO files (%s) VALUES (%s)'
+                                        % (', '.join(COLUMNS), ', '.join('?' * len(COLUMNS))), rows)
+
+    def get(self, file_name):
+        with self.lock:
+            row = self.connection.execute('SELECT * FROM files WHERE path = ?',
+                                          (self.relative_path(file_name), )).fetchone()
+        return _row_dict(row) if row is not None else None
+
+    def find(self, participant_name=None, participant_session=None, stream=None, label=None, trial_id=None,
+             t_start=None, t_end=None, clock=None):
+        """
+        Rows matching every given filter as dicts. stream matches the start of
+        the stream name; t_start/t_end select files that overlap that window.
+        """
+        conditions, values = [], []
+        for column, value in (('participant_name', participant_name), ('participant_session', participant_session),
+                              ('label', label), ('trial_id', trial_id), ('clock', clock)):
+            if value is not None:
+                conditions.append('%s = ?' % column)
+                values.append(value)
+        if stream is not None:
+            # A range instead of LIKE, so the stream index is used
+            conditions.append('stream >= ? AND stream < ?')
+            values += [stream, stream + '\uffff']
+        if t_start is not None:
+            conditions.append('t_end >= ?')
+            values.append(t_start)
+        if t_end is not None:
+            conditions.append('t_start <= ?')
+            values.append(t_end)
+        query = 'SELECT * FROM files'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+        with self.lock:
+            rows = self.connection.execute(query + ' ORDER BY participant_name, participant_session, stream, t_start',
+                                           values).fetchall()
+        return [_row_dict(row) for row in rows]
+
+    def scan(self, file_name_prefix):
+        """
+        Catalog every recording and shape trial in the data directory that is
+        new or changed since it was last catalogued. Returns the number of
+        rows written.
+        """
+        known = {}
+        with self.lock:
+            for path, size, mtime in self.connection.execute('SELECT path, size, mtime FROM files'):
+                known[path] = (size, mtime)
+        entries = []
+        for participant_name in sorted(os.listdir(self.directory)):
+            participant_dir = os.path.join(self.directory, participant_name)
+            if not os.path.isdir(participant_dir):
+                continue
+            for participant_session in sorted(os.listdir(participant_dir)):
+                session_dir = os.path.join(participant_dir, participant_session)
+                if os.path.isdir(session_dir):
+                    entries += self._scan_session(session_dir, file_name_prefix, known)
+        self.update(entries)
+        return len(entries)
+
+    def _changed(self, file_name, known):
+        return known.get(self.relative_path(file_name)) != (os.path.getsize(file_name), os.path.getmtime(file_name))
+
+    def _scan_session(self, session_dir, file_name_prefix, known):
+        entries = []
+        for stream in session_streams(session_dir, file_name_prefix):
+            stream_dir = os.path.join(session_dir, stream)
+            manifest = read_manifest(stream_dir, file_name_prefix) or {'segments': []}
+            segments = {segment['file']: segment for segment in manifest['segments']}
+            for file_name in recording_files(stream_dir, file_name_prefix):
+                if not self._changed(file_name, known):
+                    continue
+                segment = segments.get(os.path.basename(_recorded_name(file_name)))
+                if segment is not None and segment.get('complete'):
+                    # Finished segments are described by the manifest, no need to read them
+                    entries.append(self.entry(file_name, stream, manifest['labels'], segment['samples'],
+                                              segment['t_start'], segment['t_end']))
+                else:
+                    entries.append(self.entry(file_name, stream, *_describe_recording(file_name)))
+        for root, _, files in os.walk(session_dir):
+            for name in sorted(files):
+                file_name = os.path.join(root, name)
+                if name.endswith('.csv') and is_shapes_trial(file_name) and self._changed(file_name, known):
+                    entries.append(self.shapes_entry(file_name))
+        return entries
+
+    def shapes_entry(self, file_name):
+        """A row for a capture_shapes.py trial file, read from the file."""
+        with open(file_name, encoding='utf-8') as f:
+            channels = f.readline().strip().split(',')
+        frame = pd.read_csv(file_name, usecols=SHAPES_HEADER, dtype={'trial_id': str, 'label': str})
+        times = frame['timestamp_ns'].to_numpy() / 1e9
+        return self.entry(file_name, SHAPES_STREAM, channels[len(SHAPES_HEADER):], len(frame),
+                          times.min() if len(times) else None, times.max() if len(times) else None, 'unix',
+                          frame['trial_id'].iloc[0] if len(frame) else None,
+                          frame['label'].iloc[0] if len(frame) else None)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+def _row_dict(row):
+    row = dict(row)
+    row['channels'] = json.loads(row['channels']) if row['channels'] else []
+    return row
+
+
+def _describe_recording(file_name):
+    """Channels, sample count, first and last timestamp of one recording file."""
+    if is_binary(file_name) and _recorded_name(file_name) == file_name:
+        with binformat.BinaryStreamReader(file_name) as reader:
+            index = reader.index
+            if not len(index):
+                return reader.labels, 0, None, None
+            return reader.labels, int(index['samples'].sum()), float(index['t_start'][0]), float(index['t_end'][-1])
+    with open_segment(file_name) as f:
+        if is_binary(file_name):
+            header, chunks = binformat.iter_file_chunks(f)
+            samples, t_start, t_end = 0, None, None
+            for timestamps, _, _ in chunks:
+                samples += len(timestamps)
+                t_start = timestamps[0] if t_start is None else t_start
+                t_end = timestamps[-1]
+            return header['labels'], samples, t_start, t_end
+        text = io.TextIOWrapper(f, newline='', encoding='utf-8')
+        labels = [label for label in text.readline().rstrip('\r\n').split(',') if label not in TIME_COLUMNS]
+        samples, t_start, t_end = 0, None, None
+        for frame in pd.read_csv(text, header=None, usecols=[0], chunksize=100000):
+            timestamps = frame[0].to_numpy(dtype=np.float64)
+            samples += len(timestamps)
+            t_start = timestamps.min() if t_start is None else min(t_start, timestamps.min())
+            t_end = timestamps.max() if t_end is None else max(t_end, timestamps.max())
+        return labels, samples, t_start, t_end
@@ -0,0 +1,135 @@
+"""
+Stream discovery and cached stream metadata.
+
+open_stream() creates the one inlet used for recording and parses its XML
+description once into a StreamMeta that the reader and the writers share.
+StreamWatcher attaches every stream that is on the network or appears while
+the recording runs; the Supervisor hands it the streams of the devices it
+starts as soon as they are resolved.
+"""
+
+import logging
+import threading
+import pylsl
+from Util import util
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_INFO_TIMEOUT = 5.0
+
+
+class StreamMeta:
+    """The parts of a stream's info the recorder uses, read once."""
+
+    def __init__(self, name, labels, nominal_srate, channel_format=pylsl.cf_float32, type='', source_id='',
+                 uid='', hostname='', units=None):
+        self.name = name
+        self.labels = list(labels)
+        self.nominal_srate = nominal_srate
+        self.channel_format = channel_format
+        self.type = type
+        self.source_id = source_id
+        self.uid = uid
+        self.hostname = hostname
+        self.units = list(units) if units is not None else [''] * len(self.labels)
+
+    @property
+    def channel_count(self):
+        return len(self.labels)
+
+    @property
+    def dtype(self):
+        return util.channel_format_dtype(self.channel_format)
+
+    @classmethod
+    def from_info(cls, info):
+        labels, units = util.read_channel_descriptions(info)
+        return cls(info.name(), labels, info.nominal_srate(), info.channel_format(), info.type(), info.source_id(),
+                   info.uid(), info.hostname(), units)
+
+    def __repr__(self):
+        return 'StreamMeta(%r, %d channels @ %g Hz)' % (self.name, self.channel_count, self.nominal_srate)
+
+
+def open_stream(info, timeout=DEFAULT_INFO_TIMEOUT):
+    """Create the recording inlet for a resolved stream and read its metadata once."""
+    inlet = pylsl.StreamInlet(info)
+    # Resolved infos carry no <desc>; the full description comes from the inlet
+    return inlet, StreamMeta.from_info(inlet.info(timeout))
+
+
+def name_predicate(prefix):
+    return "starts-with(name,'%s')" % prefix.replace("'", '')
+
+
+class StreamWatcher(threading.Thread):
+    """
+    Keeps resolving in the background and attaches streams that appear while
+    recording (late or restarted devices) to a running AcquisitionEngine.
+
+    Readers of regular-rate streams that stay silent for retire_after seconds
+    are retired, and their outlet is forgotten so it is attached again as long
+    as the resolver still sees it. An outlet is also attached again once the
+    resolver has forgotten it and sees it anew, so a device that drops off the
+    network and comes back is recorded again.
+    Inlets reconnect to a restarted outlet with the same source_id on their
+    own; the watcher covers outlets that are new or only show up after
+    recording started.
+    """
+
+    def __init__(self, engine, known_uids=(), poll_interval=2.0, retire_after=30.0, forget_after=5.0,
+                 ignore_names=()):
+        super(StreamWatcher, self).__init__(name='stream-watcher', daemon=True)
+        self.engine = engine
+        self.known = set(known_uids)
+        # uid of the outlet each attached stream was opened from
+        self.uids = {}
+        self.ignore_names = set(ignore_names)
+        self.lock = threading.Lock()
+        self.poll_interval = poll_interval
+        self.retire_after = retire_after
+        self.resolver = pylsl.ContinuousResolver(forget_after=forget_after)
+        self.stopping = threading.Event()
+
+    def attach(self, info):
+        """Record a resolved stream unless it is already known or recorded. Also called by the Supervisor."""
+        uid = info.uid()
+        with self.lock:
+            if uid in self.known or info.name() in self.ignore_names or self.engine.has_reader(info.name()):
+                return False
+            self.known.add(uid)
+            self.uids[info.name()] = uid
+        try:
+            inlet, meta = open_stream(info)
+            reader = self.engine.add_inlet(inlet, meta)
+        except Exception:
+            logger.exception('Could not open %s', info.name())
+            return False
+        if reader is None:
+            return False
+        logger.info('Attached %s', meta.name)
+        return True
+
+    def poll(self):
+        results = self.resolver.results()
+        # Forget outlets the resolver no longer sees, so one that comes back is attached again
+        with self.lock:
+            self.known &= set(info.uid() for info in results)
+        for info in results:
+            self.attach(info)
+        for name in self.engine.retire_silent(self.retire_after):
+            with self.lock:
+                self.known.discard(self.uids.pop(name, None))
+            logger.info('Retired %s', name)
+
+    def run(self):
+        while not self.stopping.wait(self.poll_interval):
+            try:
+                self.poll()
+            except Exception:
+                logger.exception('Stream watcher poll failed')
+
+    def stop(self):
+        self.stopping.set()
+        if self.is_alive():
+            self.join()
@@ -0,0 +1,230 @@
+"""
+Parquet export of a data/ tree.
+
+Every recording under <directory>/<participant_name>/<participant_session>/
+(the [File Info] layout of config.ini) becomes a Parquet file in a hive
+partitioned dataset:
+
+    <out>/participant_name=<p>/participant_session=<s>/stream=<stream>/<file>.parquet
+
+One Parquet file is written per recording file (or segment), so running the
+export again only converts files that are new or changed since. Columns keep
+their recorded types (binary recordings) or the types pandas reads from the
+CSV, Device_Time becomes a real timestamp column, and row groups are kept
+small with statistics and a page index on every column, so a reader that
+filters on Timestamp only reads the row groups of the window it asked for.
+
+Shape trials saved by capture_shapes.py inside a session directory go to the
+same dataset as stream=shapes, typed and with their trial_id and label.
+
+pyarrow is only needed for the export and read_window().
+"""
+
+import io
+import os
+import glob
+import logging
+import numpy as np
+import pandas as pd
+from Util import binformat, util
+from Util.merge import recording_files, session_streams, is_binary
+from Util.segments import open_segment, COMPRESSION_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+DEFAULT_ROW_GROUP_ROWS = 32768
+SHAPES_STREAM = 'shapes'
+SHAPES_HEADER = ['trial_id', 'label', 'timestamp_ns']
+PARTITIONS = ('participant_name', 'participant_session', 'stream')
+
+
+def _require_pyarrow():
+    if pa is None:
+        raise ValueError('Parquet export needs the pyarrow package')
+
+
+def _partition_dir(out_dir, participant_name, participant_session, stream):
+    return os.path.join(out_dir, *('%s=%s' % (key, value) for key, value
+                                   in zip(PARTITIONS, (participant_name, participant_session, stream))))
+
+
+def _target_name(partition_dir, file_name):
+    name = os.path.basename(file_name)
+    for extension in COMPRESSION_EXTENSIONS.values():
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+    return os.path.join(partition_dir, os.path.splitext(name)[0] + '.parquet')
+
+
+def _up_to_date(target, source):
+    return os.path.isfile(target) and os.path.getmtime(target) >= os.path.getmtime(source)
+
+
+def _binary_tables(file_name, row_group_rows):
+    with open_segment(file_name) as f:
+        header, chunks = binformat.iter_file_chunks(f)
+        names = ['Timestamp'] + (['Corrected_Timestamp'] if header.get('corrected') else []) + header['labels']
+        parts = []
+        rows = 0
+        for timestamps, corrected, columns in chunks:
+            # Device_Time as the CSV writer computes it, but as a timestamp instead of text
+            device_time = timestamps if corrected is None else np.where(np.isnan(corrected), timestamps, corrected)
+            arrays = [timestamps] + ([] if corrected is None else [corrected]) + list(columns)
+            parts.append(arrays + [util.lsl_to_datetime64(device_time)])
+            rows += len(timestamps)
+            if rows >= row_group_rows:
+                yield _concat_table(names + ['Device_Time'], parts)
+                parts, rows = [], 0
+        if parts:
+            yield _concat_table(names + ['Device_Time'], parts)
+
+
+def _concat_table(names, parts):
+    columns = [np.concatenate([part[k] for part in parts]) for k in range(len(names))]
+    return pa.table([pa.array(column) for column in columns], names=names)
+
+
+def _csv_tables(file_name, row_group_rows, dtypes=None):
+    with open_segment(file_name) as f:
+        reader = pd.read_csv(io.TextIOWrapper(f, newline='', encoding='utf-8'), chunksize=row_group_rows,
+                             dtype=dtypes)
+        schema = None
+        for frame in reader:
+            if 'Device_Time' in frame:
+                frame['Device_Time'] = pd.to_datetime(frame['Device_Time'])
+            table = pa.Table.from_pandas(frame, preserve_index=False)
+            if schema is None:
+                # The first block decides the types, later ones (e.g. with empty cells) are cast to them
+                schema = table.schema
+                if 'Device_Time' in frame:
+                    index = schema.get_field_index('Device_Time')
+                    schema = schema.set(index, pa.field('Device_Time', pa.timestamp('us')))
+            yield table.cast(schema)
+
+
+def _write_parquet(target, tables, row_group_rows, compression):
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    temp = target + '.tmp'
+    if os.path.isfile(temp):
+        # Left behind by an interrupted run
+        os.remove(temp)
+    writer = None
+    rows = 0
+    try:
+        for table in tables:
+            if writer is None:
+                writer = pq.ParquetWriter(temp, table.schema, compression=compression,
+                                          write_statistics=True, write_page_index=True)
+            writer.write_table(table, row_group_size=row_group_rows)
+            rows += table.num_rows
+    except Exception:
+        # No partial Parquet file in the dataset
+        if writer is not None:
+            writer.close()
+        if os.path.isfile(temp):
+            os.remove(temp)
+        raise
+    if writer is not None:
+        writer.close()
+        os.replace(temp, target)
+    return rows
+
+
+def is_shapes_trial(file_name):
+    """True for a trial CSV saved by capture_shapes.py."""
+    with open(file_name, encoding='utf-8', errors='replace') as f:
+        return f.readline().strip().split(',')[:len(SHAPES_HEADER)] == SHAPES_HEADER
+
+
+def _shapes_tables(file_name, row_group_rows):
+    dtypes = {'trial_id': str, 'label': str, 'timestamp_ns': np.int64, 'pen_state': np.int8}
+    dtypes.update(('emg%d' % (k + 1), np.float32) for k in range(8))
+    # x and y are empty until the pen first moves
+    dtypes.update(x='Int32', y='Int32')
+    return _csv_tables(file_name, row_group_rows, dtypes)
+
+
+def export_session(session_dir, file_name_prefix, out_dir, participant_name, participant_session,
+                   row_group_rows=DEFAULT_ROW_GROUP_ROWS, compression='zstd', force=False):
+    """Export one session directory; returns {target file: rows} for the files that were written."""
+    _require_pyarrow()
+    written = {}
+    for stream in session_streams(session_dir, file_name_prefix):
+        partition = _partition_dir(out_dir, participant_name, participant_session, stream)
+        for file_name in recording_files(os.path.join(session_dir, stream), file_name_prefix):
+            target = _target_name(partition, file_name)
+            if not force and _up_to_date(target, file_name):
+                continue
+            if is_binary(file_name):
+                tables = _binary_tables(file_name, row_group_rows)
+            else:
+                tables = _csv_tables(file_name, row_group_rows)
+            try:
+                written[target] = _write_parquet(target, tables, row_group_rows, compression)
+            except (ValueError, pa.ArrowException) as e:
+                logger.error('Could not export %s: %s', file_name, e)
+    partition = _partition_dir(out_dir, participant_name, participant_session, SHAPES_STREAM)
+    for root, _, files in os.walk(session_dir):
+        for name in sorted(files):
+            file_name = os.path.join(root, name)
+            if not name.endswith('.csv') or not is_shapes_trial(file_name):
+                continue
+            target = _target_name(partition, file_name)
+            if not force and _up_to_date(target, file_name):
+                continue
+            try:
+                written[target] = _write_parquet(target, _shapes_tables(file_name, row_group_rows), row_group_rows,
+                                                 compression)
+            except (ValueError, pa.ArrowException) as e:
+                logger.error('Could not export %s: %s', file_name, e)
+    return written
+
+
+def export_tree(directory, file_name_prefix, out_dir, row_group_rows=DEFAULT_ROW_GROUP_ROWS, compression='zstd',
+                force=False):
+    """Export every <participant_name>/<participant_session> directory below directory."""
+    _require_pyarrow()
+    written = {}
+    for participant_name in sorted(os.listdir(directory)):
+        participant_dir = os.path.join(directory, participant_name)
+        if not os.path.isdir(participant_dir):
+            continue
+        for participant_session in sorted(os.listdir(participant_dir)):
+            session_dir = os.path.join(participant_dir, participant_session)
+            if os.path.isdir(session_dir):
+                written.update(export_session(session_dir, file_name_prefix, out_dir, participant_name,
+                                              participant_session, row_group_rows, compression, force))
+    return written
+
+
+def read_window(out_dir, stream, columns=None, t_start=None, t_end=None, participant_name=None,
+                participant_session=None, time_column='Timestamp'):
+    """
+    Load columns of one stream from an exported dataset as a DataFrame,
+    limited to [t_start, t_end] of time_column. Only the matching partitions
+    and row groups are read.
+    """
+    _require_pyarrow()
+    # Streams have different columns, so only this stream's files make up the dataset
+    partition = _partition_dir(out_dir, participant_name or '*', participant_session or '*', stream)
+    files = sorted(glob.glob(os.path.join(glob.escape(out_dir), os.path.relpath(partition, out_dir), '*.parquet')))
+    if not files:
+        raise ValueError('No exported files for %s in %s' % (stream, out_dir))
+    partitioning = ds.partitioning(pa.schema([(key, pa.string()) for key in PARTITIONS]), flavor='hive')
+    dataset = ds.dataset(files, format='parquet', partitioning=partitioning, partition_base_dir=out_dir)
+    condition = None
+    if t_start is not None:
+        condition = ds.field(time_column) >= t_start
+    if t_end is not None:
+        before = ds.field(time_column) <= t_end
+        condition = before if condition is None else condition & before
+    if columns is not None:
+        columns = [time_column] + [column for column in columns if column != time_column]
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
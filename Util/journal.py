@@ -0,0 +1,73 @@
+"""
+Commit journal for CSV recordings.
+
+Every chunk appended to a CSV data file gets a fixed-size record in
+<file>.journal once its rows are written: the byte range it occupies, its
+sample count and time range, and a CRC32 of its bytes. After a crash,
+Util.recovery checks each record against the data file, so committed rows
+that did not make it to disk (or came back as garbage) are found and their
+exact time range reported.
+"""
+
+import os
+import zlib
+import struct
+
+JOURNAL_MAGIC = b'CMIT'
+# magic, start offset, end offset, samples, first and last timestamp, CRC32 of the bytes
+JOURNAL_STRUCT = struct.Struct('<4sQQIddI')
+
+
+def journal_file_name(file_name):
+    return file_name + '.journal'
+
+
+def checksum(data):
+    return zlib.crc32(data) & 0xffffffff
+
+
+class CommitJournal:
+    """Appends commit records; sync() makes them durable after the data they describe."""
+
+    def __init__(self, file_name):
+        self.file_name = journal_file_name(file_name)
+        self.file = open(self.file_name, 'ab')
+
+    def commit(self, start, end, samples, t_start, t_end, crc):
+        self.file.write(JOURNAL_STRUCT.pack(JOURNAL_MAGIC, start, end, samples, t_start, t_end, crc))
+
+    def flush(self):
+        self.file.flush()
+
+    def sync(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def read_journal(file_name):
+    """The commit records of a data file as a list of tuples; stops at the first incomplete or invalid record."""
+    name = journal_file_name(file_name)
+    if not os.path.isfile(name):
+        return []
+    with open(name, 'rb') as f:
+        data = f.read()
+    records = []
+    for offset in range(0, len(data) - JOURNAL_STRUCT.size + 1, JOURNAL_STRUCT.size):
+        record = JOURNAL_STRUCT.unpack_from(data, offset)
+        if record[0] != JOURNAL_MAGIC:
+            break
+        records.append(record[1:])
+    return records
+
+
+def write_journal(file_name, records):
+    """Replace a data file's journal with records (used after recovery)."""
+    name = journal_file_name(file_name)
+    with open(name + '.tmp', 'wb') as f:
+        for record in records:
+            f.write(JOURNAL_STRUCT.pack(JOURNAL_MAGIC, *record))
+    os.replace(name + '.tmp', name)
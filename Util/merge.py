@@ -0,0 +1,249 @@
+"""
+Offline time-aligned merge of the streams recorded in one session.
+
+Every stream directory is read chunk by chunk (single CSV or binary files,
+rolled segments listed in a manifest, compressed or not). The streams are
+then merged block by block: each step takes the samples up to the earliest
+"last buffered timestamp" among the streams, the horizon up to which every
+stream is known, writes those rows and moves on. Memory use depends on the
+chunk size and the number of streams, not on the session length.
+
+Two output modes:
+    rate=None   one row per sample of any stream (the union of all
+                timestamps), the other streams forward-filled, like
+                pandas.merge_asof over every stream
+    rate=R      one row every 1/R seconds; each stream's value is its last
+                sample (method='ffill') or linearly interpolated between its
+                neighbouring samples (method='linear', numeric channels only)
+tolerance drops values older than that many seconds to empty cells.
+"""
+
+import io
+import os
+import logging
+import numpy as np
+import pandas as pd
+from Util import binformat
+from Util.segments import read_manifest, open_segment, COMPRESSION_EXTENSIONS
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_ROWS = 50000
+TIME_COLUMNS = ('Timestamp', 'Corrected_Timestamp', 'Device_Time')
+METHODS = ('ffill', 'linear')
+
+
+def recording_files(stream_dir, file_name_prefix):
+    """The stream's data files in recording order, from the manifest if it was segmented."""
+    manifest = read_manifest(stream_dir, file_name_prefix)
+    if manifest is not None:
+        files = []
+        for segment in manifest['segments']:
+            file_name = os.path.join(stream_dir, segment['file'])
+            if not os.path.isfile(file_name):
+                # Compression may have finished after the manifest was last written (or the other way round)
+                candidates = [file_name + extension for extension in COMPRESSION_EXTENSIONS.values()]
+                candidates.append(os.path.splitext(file_name)[0])
+                file_name = next((name for name in candidates if os.path.isfile(name)), None)
+            if file_name is None:
+                logger.warning('Segment %s of %s is missing', segment['file'], stream_dir)
+                continue
+            files.append(file_name)
+        return files
+    for extension in ('.csv', '.bin'):
+        file_name = os.path.join(stream_dir, file_name_prefix + '_data' + extension)
+        if os.path.isfile(file_name):
+            return [file_name]
+    return []
+
+
+def session_streams(session_dir, file_name_prefix):
+    """Names of the stream directories in a session that hold recordings for file_name_prefix."""
+    return sorted(name for name in os.listdir(session_dir)
+                  if os.path.isdir(os.path.join(session_dir, name))
+                  and recording_files(os.path.join(session_dir, name), file_name_prefix))
+
+
+def is_binary(file_name):
+    name = file_name
+    for extension in COMPRESSION_EXTENSIONS.values():
+        if name.endswith(extension):
+            name = name[:-len(extension)]
+    return name.endswith('.bin')
+
+
+class StreamSource:
+    """Reads one recorded stream as (timestamps, columns) chunks, whatever files it was written to."""
+
+    def __init__(self, stream_dir, file_name_prefix, timestamps='auto', chunk_rows=DEFAULT_CHUNK_ROWS):
+        if timestamps not in ('auto', 'raw', 'corrected'):
+            raise ValueError('timestamps must be auto, raw or corrected')
+        self.name = os.path.basename(os.path.normpath(stream_dir))
+        self.files = recording_files(stream_dir, file_name_prefix)
+        if not self.files:
+            raise ValueError('No recording for %s in %s' % (file_name_prefix, stream_dir))
+        self.timestamps = timestamps
+        self.chunk_rows = chunk_rows
+        self.labels = self._read_labels(self.files[0])
+
+    def _read_labels(self, file_name):
+        with open_segment(file_name) as f:
+            if is_binary(file_name):
+                header, _ = binformat.iter_file_chunks(f)
+                return header['labels']
+            header = io.TextIOWrapper(f, newline='').readline().rstrip('\r\n').split(',')
+            return [label for label in header if label not in TIME_COLUMNS]
+
+    def _pick(self, raw, corrected):
+        if self.timestamps == 'raw' or corrected is None:
+            if self.timestamps == 'corrected':
+                raise ValueError('%s has no corrected timestamps' % self.name)
+            return raw
+        # Chunks written without a corrector carry NaN
+        return np.where(np.isnan(corrected), raw, corrected)
+
+    def _file_chunks(self, file_name):
+        with open_segment(file_name) as f:
+            if is_binary(file_name):
+                _, chunks = binformat.iter_file_chunks(f)
+                for raw, corrected, columns in chunks:
+                    yield self._pick(raw, corrected), columns
+                return
+            reader = pd.read_csv(io.TextIOWrapper(f, newline=''), chunksize=self.chunk_rows)
+            for frame in reader:
+                corrected = frame['Corrected_Timestamp'].to_numpy() if 'Corrected_Timestamp' in frame else None
+                timestamps = self._pick(frame['Timestamp'].to_numpy(), corrected)
+                yield timestamps, [frame[label].to_numpy() for label in self.labels]
+
+    def chunks(self):
+        for file_name in self.files:
+            for timestamps, columns in self._file_chunks(file_name):
+                if len(timestamps):
+                    yield np.asarray(timestamps, dtype=np.float64), columns
+
+
+def _column(values):
+    # Numeric channels become float64 so missing values can be NaN
+    values = np.asarray(values)
+    if values.dtype.kind in 'OSU':
+        return values.astype(object)
+    return values.astype(np.float64)
+
+
+class _Cursor:
+    """Read position in one StreamSource plus the last sample already merged."""
+
+    def __init__(self, source):
+        self.source = source
+        self.chunks = source.chunks()
+        self.timestamps = np.empty(0)
+        self.columns = []
+        self.done = False
+        self.carry_time = -np.inf
+        self.carry = None
+
+    def fill(self):
+        while not self.done and len(self.timestamps) == 0:
+            try:
+                timestamps, columns = next(self.chunks)
+            except StopIteration:
+                self.done = True
+                return
+            columns = [_column(column) for column in columns]
+            if self.carry is None:
+                self.carry = [None if column.dtype == object else np.nan for column in columns]
+            if np.any(np.diff(timestamps) < 0):
+                order = np.argsort(timestamps, kind='stable')
+                timestamps = timestamps[order]
+                columns = [column[order] for column in columns]
+            self.timestamps = timestamps
+            self.columns = columns
+
+    @property
+    def active(self):
+        return len(self.timestamps) > 0
+
+    def sample(self, times, method='ffill', tolerance=None):
+        """The stream's values at times (all at or before the merge horizon)."""
+        labels = self.source.labels
+        if self.carry is None:
+            return [np.full(len(times), np.nan) for _ in labels]
+        known_times = np.concatenate([[self.carry_time], self.timestamps])
+        previous = np.searchsorted(known_times, times, side='right') - 1
+        stale = known_times[previous] == -np.inf
+        if tolerance is not None:
+            stale |= times - known_times[previous] > tolerance
+        out = []
+        for k, column in enumerate(self.columns or [np.empty(0)] * len(labels)):
+            known = np.concatenate([np.array([self.carry[k]], dtype=column.dtype), column])
+            if method == 'linear' and column.dtype != object:
+                valid = known_times > -np.inf
+                values = np.interp(times, known_times[valid], known[valid], left=np.nan, right=np.nan)
+            else:
+                values = known[previous]
+            if stale.any():
+                values = values.copy()
+                values[stale] = None if column.dtype == object else np.nan
+            out.append(values)
+        return out
+
+    def consume(self, horizon):
+        k = int(np.searchsorted(self.timestamps, horizon, side='right'))
+        if k:
+            self.carry_time = self.timestamps[k - 1]
+            self.carry = [column[k - 1] for column in self.columns]
+            self.timestamps = self.timestamps[k:]
+            self.columns = [column[k:] for column in self.columns]
+        self.fill()
+
+
+def merge_blocks(sources, rate=None, method='ffill', tolerance=None):
+    """Yield the merged table as DataFrames of consecutive rows."""
+    if method not in METHODS:
+        raise ValueError('Unknown method %r, expected one of %s' % (method, ', '.join(METHODS)))
+    if method == 'linear' and not rate:
+        raise ValueError('Linear interpolation needs a resampling rate')
+    cursors = [_Cursor(source) for source in sources]
+    for cursor in cursors:
+        cursor.fill()
+    names = ['%s/%s' % (cursor.source.name, label) for cursor in cursors for label in cursor.source.labels]
+    starts = [cursor.timestamps[0] for cursor in cursors if cursor.active]
+    if not starts:
+        return
+    t0 = min(starts)
+    next_tick = 0
+    while True:
+        active = [cursor for cursor in cursors if cursor.active]
+        if not active:
+            break
+        # Every stream is known up to the earliest end of the buffered chunks
+        horizon = min(cursor.timestamps[-1] for cursor in active)
+        if rate:
+            last_tick = int(np.floor((horizon - t0) * rate + 1e-9))
+            times = t0 + np.arange(next_tick, last_tick + 1) / rate
+            next_tick = max(next_tick, last_tick + 1)
+        else:
+            times = np.unique(np.concatenate([cursor.timestamps[:np.searchsorted(cursor.timestamps, horizon, 'right')]
+                                              for cursor in active]))
+        if len(times):
+            columns = [column for cursor in cursors for column in cursor.sample(times, method, tolerance)]
+            block = pd.DataFrame(dict(zip(names, columns)), columns=names)
+            block.insert(0, 'Timestamp', np.round(times, 6))
+            yield block
+        for cursor in active:
+            cursor.consume(horizon)
+
+
+def merge_session(session_dir, file_name_prefix, output, streams=None, rate=None, method='ffill', tolerance=None,
+                  timestamps='auto', chunk_rows=DEFAULT_CHUNK_ROWS):
+    """Merge a session's streams into one CSV file; returns the number of rows written."""
+    if streams is None:
+        streams = session_streams(session_dir, file_name_prefix)
+    sources = [StreamSource(os.path.join(session_dir, name), file_name_prefix, timestamps, chunk_rows)
+               for name in streams]
+    rows = 0
+    with open(output, 'w', newline='') as f:
+        for block in merge_blocks(sources, rate, method, tolerance):
+            block.to_csv(f, header=rows == 0, index=False)
+            rows += len(block)
+    return rows
@@ -0,0 +1,291 @@
+"""
+Live preview of the streams being recorded.
+
+Every reader thread hands the samples it pulls to a LivePreview, which folds
+them into a min/max decimation ring per stream. Level 0 holds the last `points` samples
+as they are; every further level holds `points` buckets of `factor` times as
+many samples (the minimum and maximum of each channel over the bucket), up to
+the level that covers window_seconds. A whole stream therefore needs a few
+levels of `points` values per channel however long the window is, and a
+viewer always gets at most about `points` values per channel whatever span it
+asks for.
+
+PreviewServer serves the rings over HTTP on localhost from its own threads:
+    /                      a small viewer page that polls /data and draws each channel
+    /streams               JSON list of streams with their labels and nominal rate
+    /data?stream=S&seconds=60[&channels=a,b][&points=1000]
+                           JSON {t, min, max, bucket} for the last `seconds` of S
+A stream's ring is updated by its reader after every pull, under the ring's
+lock, so the preview is as fresh as the pulls rather than the writer's flush
+period.
+"""
+
+import json
+import logging
+import threading
+import numpy as np
+from urllib.parse import urlparse, parse_qs
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_POINTS = 2048
+DEFAULT_FACTOR = 4
+IRREGULAR_RATE_GUESS = 10.0  # Samples per second assumed when sizing the levels of irregular streams
+
+
+class MinMaxLevel:
+    """A ring of buckets with their start time and each channel's minimum and maximum."""
+
+    def __init__(self, channels, capacity, bucket):
+        self.bucket = bucket
+        self.capacity = capacity
+        self.times = np.empty(capacity, dtype=np.float64)
+        self.low = np.empty((channels, capacity), dtype=np.float32)
+        self.high = np.empty((channels, capacity), dtype=np.float32)
+        self.head = 0
+        self.count = 0
+        # Entries of the level below that do not fill a bucket yet
+        self.pending = None
+
+    def write(self, times, low, high):
+        n = len(times)
+        if n > self.capacity:
+            times, low, high = times[-self.capacity:], low[:, -self.capacity:], high[:, -self.capacity:]
+            n = self.capacity
+        positions = (self.head + np.arange(n)) % self.capacity
+        self.times[positions] = times
+        self.low[:, positions] = low
+        self.high[:, positions] = high
+        self.head = (self.head + n) % self.capacity
+        self.count = min(self.capacity, self.count + n)
+
+    def group(self, times, low, high, factor):
+        """Whole buckets made of the pending entries and these ones; the rest stays pending."""
+        if self.pending is not None:
+            times = np.concatenate([self.pending[0], times])
+            low = np.concatenate([self.pending[1], low], axis=1)
+            high = np.concatenate([self.pending[2], high], axis=1)
+        full = len(times) // factor * factor
+        self.pending = (times[full:], low[:, full:], high[:, full:])
+        channels = low.shape[0]
+        # fmin/fmax skip NaN (e.g. empty corrected cells) unless the whole bucket is NaN
+        return (times[:full:factor], np.fmin.reduce(low[:, :full].reshape(channels, -1, factor), axis=2),
+                np.fmax.reduce(high[:, :full].reshape(channels, -1, factor), axis=2))
+
+    def full(self):
+        return self.count == self.capacity
+
+    def span(self):
+        if self.count == 0:
+            return 0.0
+        return self.times[(self.head - 1) % self.capacity] - self.times[(self.head - self.count) % self.capacity]
+
+    def read(self, since=None):
+        order = (self.head - self.count + np.arange(self.count)) % self.capacity
+        times = self.times[order]
+        first = 0 if since is None else int(np.searchsorted(times, since, side='left'))
+        return times[first:], self.low[:, order[first:]], self.high[:, order[first:]]
+
+
+class DecimationRing:
+    """The min/max levels of one stream."""
+
+    def __init__(self, labels, nominal_srate, window_seconds=600, points=DEFAULT_POINTS, factor=DEFAULT_FACTOR):
+        self.labels = list(labels)
+        self.nominal_srate = nominal_srate
+        self.factor = factor
+        self.lock = threading.Lock()
+        self.levels = []
+        samples = window_seconds * (nominal_srate if nominal_srate > 0 else IRREGULAR_RATE_GUESS)
+        bucket = 1
+        while True:
+            self.levels.append(MinMaxLevel(len(self.labels), points, bucket))
+            if points * bucket >= samples:
+                break
+            bucket *= factor
+
+    def append(self, timestamps, columns):
+        if len(timestamps) == 0:
+            return
+        data = np.empty((len(columns), len(timestamps)), dtype=np.float32)
+        for k, column in enumerate(columns):
+            # Text channels have nothing to plot
+            data[k] = np.nan if column.dtype.kind in 'OSU' else column
+        times, low, high = np.asarray(timestamps, dtype=np.float64), data, data
+        with self.lock:
+            for level in self.levels:
+                if level.bucket > 1:
+                    times, low, high = level.group(times, low, high, self.factor)
+                if len(times) == 0:
+                    break
+                level.write(times, low, high)
+
+    def snapshot(self, seconds, channels=None, points=None):
+        """The finest level that covers the last `seconds` (with at most `points` buckets), as plain arrays."""
+        indices = range(len(self.labels)) if channels is None else [self.labels.index(label) for label in channels]
+        with self.lock:
+            level = self.levels[-1]
+            for candidate in self.levels:
+                if not candidate.full() or candidate.span() >= seconds:
+                    level = candidate
+                    break
+            latest = level.times[(level.head - 1) % level.capacity] if level.count else 0.0
+            times, low, high = level.read(latest - seconds)
+            low, high = low[indices], high[indices]
+        if points and len(times) > points:
+            # Coarser still: merge neighbouring buckets
+            step = int(np.ceil(len(times) / float(points)))
+            cut = len(times) % step
+            times, low, high = times[cut:], low[:, cut:], high[:, cut:]
+            channels_count = low.shape[0]
+            low = np.fmin.reduce(low.reshape(channels_count, -1, step), axis=2)
+            high = np.fmax.reduce(high.reshape(channels_count, -1, step), axis=2)
+            times = times[::step]
+            bucket = level.bucket * step
+        else:
+            bucket = level.bucket
+        return {'labels': [self.labels[k] for k in indices], 't': times, 'min': low, 'max': high, 'bucket': bucket}
+
+
+class LivePreview:
+    """Decimation rings for every recorded stream, fed by the InletReaders."""
+
+    def __init__(self, window_seconds=600, points=DEFAULT_POINTS, factor=DEFAULT_FACTOR):
+        self.window_seconds = window_seconds
+        self.points = points
+        self.factor = factor
+        self.rings = {}
+
+    def add_stream(self, name, labels, nominal_srate):
+        self.rings[name] = DecimationRing(labels, nominal_srate, self.window_seconds, self.points, self.factor)
+
+    def update(self, name, samples, timestamps):
+        """Fold pulled samples (one row per sample) into the stream's ring."""
+        ring = self.rings.get(name)
+        if ring is not None:
+            ring.append(timestamps, samples.T)
+
+    def streams(self):
+        return [{'name': name, 'labels': ring.labels, 'nominal_srate': ring.nominal_srate}
+                for name, ring in sorted(self.rings.items())]
+
+    def snapshot(self, name, seconds, channels=None, points=None):
+        return self.rings[name].snapshot(seconds, channels, points)
+
+
+def _json_values(array):
+    # NaN is not valid JSON
+    values = array.astype(object)
+    values[np.isnan(array)] = None
+    return values.tolist()
+
+
+class PreviewHandler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        try:
+            if url.path == '/':
+                self.send(VIEWER_PAGE.encode('utf-8'), 'text/html; charset=utf-8')
+            elif url.path == '/streams':
+                self.send_json(self.server.preview.streams())
+            elif url.path == '/data':
+                channels = query['channels'][0].split(',') if 'channels' in query else None
+                points = int(query['points'][0]) if 'points' in query else None
+                snapshot = self.server.preview.snapshot(query['stream'][0], float(query.get('seconds', ['60'])[0]),
+                                                        channels, points)
+                self.send_json({'labels': snapshot['labels'], 'bucket': snapshot['bucket'],
+                                't': snapshot['t'].tolist(), 'min': _json_values(snapshot['min']),
+                                'max': _json_values(snapshot['max'])})
+            else:
+                self.send_error(404)
+        except (KeyError, ValueError) as e:
+            self.send_error(400, str(e))
+
+    def send_json(self, value):
+        self.send(json.dumps(value).encode('utf-8'), 'application/json')
+
+    def send(self, body, content_type):
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('Cache-Control', 'no-store')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(format, *args)
+
+
+class PreviewServer(threading.Thread):
+    """Serves a LivePreview on http://host:port/ until stop()."""
+
+    def __init__(self, preview, host='127.0.0.1', port=8765):
+        super(PreviewServer, self).__init__(name='preview', daemon=True)
+        self.server = ThreadingHTTPServer((host, port), PreviewHandler)
+        self.server.daemon_threads = True
+        self.server.preview = preview
+
+    @property
+    def url(self):
+        host, port = self.server.server_address[:2]
+        return 'http://%s:%d/' % (host, port)
+
+    def run(self):
+        self.server.serve_forever(poll_interval=0.5)
+
+    def stop(self):
+        if self.is_alive():
+            self.server.shutdown()
+            self.join()
+        self.server.server_close()
+
+
+VIEWER_PAGE = """<!DOCTYPE html>
+<html><head><title>Live preview</title>
+<style>body{font-family:sans-serif;margin:8px}canvas{width:100%;border:1px solid #ccc}</style></head>
+<body>
+<select id="stream"></select>
+<select id="seconds"><option>10</option><option selected>60</option><option>300</option><option>600</option></select> s
+<span id="info"></span>
+<canvas id="plot"></canvas>
+<script>
+const stream = document.getElementById('stream'), seconds = document.getElementById('seconds');
+const canvas = document.getElementById('plot'), info = document.getElementById('info');
+fetch('/streams').then(r => r.json()).then(list => {
+  for (const s of list) stream.add(new Option(s.name + ' (' + s.labels.length + ' ch)', s.name));
+  draw();
+});
+async function draw() {
+  if (stream.value) {
+    const width = canvas.clientWidth;
+    const d = await (await fetch('/data?stream=' + encodeURIComponent(stream.value) + '&seconds=' + seconds.value +
+                                 '&points=' + width)).json();
+    const rows = d.labels.length, rowHeight = 60;
+    canvas.width = width; canvas.height = rows * rowHeight;
+    const g = canvas.getContext('2d');
+    const t0 = d.t.length ? d.t[d.t.length - 1] - seconds.value : 0;
+    for (let c = 0; c < rows; c++) {
+      const low = d.min[c].filter(v => v !== null), high = d.max[c].filter(v => v !== null);
+      const lo = Math.min(...low), hi = Math.max(...high), scale = hi > lo ? (rowHeight - 4) / (hi - lo) : 0;
+      const top = c * rowHeight + rowHeight - 2;
+      g.strokeStyle = '#1f77b4';
+      g.beginPath();
+      for (let i = 0; i < d.t.length; i++) {
+        if (d.min[c][i] === null) continue;
+        const x = (d.t[i] - t0) / seconds.value * width;
+        g.moveTo(x, top - (d.min[c][i] - lo) * scale);
+        g.lineTo(x, top - (d.max[c][i] - lo) * scale - 1);
+      }
+      g.stroke();
+      g.fillText(d.labels[c] + ' [' + lo.toFixed(2) + ', ' + hi.toFixed(2) + ']', 4, c * rowHeight + 12);
+    }
+    info.textContent = d.t.length + ' points, ' + d.bucket + ' samples each';
+  }
+  setTimeout(draw, 500);
+}
+</script>
+</body></html>
+"""
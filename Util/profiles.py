@@ -0,0 +1,178 @@
+"""
+Per-stream recording profiles: which channels to keep and how to store them.
+
+A profile is a [Profile ...] section in config.ini. Its stream key is the
+start of the stream names it applies to; every other key is a channel label
+(case-insensitive, * and ? wildcards allowed) and the value says how the
+channel is stored:
+    int8 / int16 / int32 / int64 / float32 / float64 / bool
+                    keep it, cast to that type
+    drop            do not record it
+    changes:<type>  record only the samples where the value changes, as
+                    rows of <prefix>_state_changes.csv in the stream directory
+Channels the profile does not mention are stored unchanged.
+"""
+
+import os
+import time
+import fnmatch
+import numpy as np
+from Util import util
+from Util.writers import csv_quote
+
+PROFILE_SECTION_PREFIX = 'Profile'
+CHANGES_PREFIX = 'changes:'
+DTYPES = {
+    'int8': np.int8,
+    'int16': np.int16,
+    'int32': np.int32,
+    'int64': np.int64,
+    'float32': np.float32,
+    'float64': np.float64,
+    'bool': np.bool_,
+}
+
+
+def _parse_rule(value):
+    value = value.strip().lower()
+    if value == 'drop':
+        return 'drop', None
+    kind = 'keep'
+    if value.startswith(CHANGES_PREFIX):
+        kind, value = 'changes', value[len(CHANGES_PREFIX):].strip()
+    if value not in DTYPES:
+        raise ValueError('Unknown channel type %r, expected drop, one of %s or changes:<type>'
+                         % (value, ', '.join(DTYPES)))
+    return kind, np.dtype(DTYPES[value])
+
+
+def cast_column(column, dtype):
+    """column in dtype; numbers are rounded and clipped to the range of integer types."""
+    if column.dtype == dtype:
+        return column
+    if dtype.kind == 'b':
+        return np.asarray(column, dtype=np.float64) != 0
+    if dtype.kind in 'iu':
+        info = np.iinfo(dtype)
+        values = np.rint(np.nan_to_num(np.asarray(column, dtype=np.float64)))
+        return np.clip(values, info.min, info.max).astype(dtype)
+    return column.astype(dtype)
+
+
+class StreamProfile:
+    """One [Profile ...] section."""
+
+    def __init__(self, name, stream_prefix, rules):
+        self.name = name
+        self.stream_prefix = stream_prefix
+        # (pattern, kind, dtype) in the order they were written
+        self.rules = rules
+
+    @classmethod
+    def from_section(cls, name, section):
+        rules = [(key.lower(), ) + _parse_rule(value) for key, value in section.items() if key.lower() != 'stream']
+        return cls(name, section['stream'], rules)
+
+    def matches(self, stream_name):
+        return stream_name.startswith(self.stream_prefix)
+
+    def rule_for(self, label):
+        label = label.lower()
+        for pattern, kind, dtype in self.rules:
+            if pattern == label:
+                return kind, dtype
+        for pattern, kind, dtype in self.rules:
+            if fnmatch.fnmatchcase(label, pattern):
+                return kind, dtype
+        return 'keep', None
+
+    def projection(self, labels):
+        return Projection(labels, [self.rule_for(label) for label in labels])
+
+
+class Projection:
+    """Applies a profile to the chunks of one stream; keeps the last value of every change channel."""
+
+    def __init__(self, labels, rules):
+        self.keep = [(index, label, dtype) for index, (label, (kind, dtype)) in enumerate(zip(labels, rules))
+                     if kind == 'keep']
+        self.changes = [(index, label, dtype) for index, (label, (kind, dtype)) in enumerate(zip(labels, rules))
+                        if kind == 'changes']
+        self.last_values = [None] * len(self.changes)
+
+    @property
+    def labels(self):
+        return [label for _, label, _ in self.keep]
+
+    def apply(self, chunk):
+        """The chunk with only the kept channels, and (positions, labels, values) for the changes."""
+        columns = [chunk.columns[index] if dtype is None else cast_column(chunk.columns[index], dtype)
+                   for index, _, dtype in self.keep]
+        kept = type(chunk)(chunk.stream, chunk.timestamps, columns, chunk.corrected)
+        events = []
+        for k, (index, label, dtype) in enumerate(self.changes):
+            column = chunk.columns[index] if dtype is None else cast_column(chunk.columns[index], dtype)
+            if len(column) == 0:
+                continue
+            changed = np.empty(len(column), dtype=bool)
+            changed[0] = self.last_values[k] is None or column[0] != self.last_values[k]
+            changed[1:] = column[1:] != column[:-1]
+            self.last_values[k] = column[-1]
+            positions = np.flatnonzero(changed)
+            if len(positions):
+                events.append((positions, label, column[positions]))
+        return kept, events
+
+
+class StateChangeWriter:
+    """Appends state channel changes of one stream to <prefix>_state_changes.csv."""
+
+    def __init__(self, file_name, corrected=False, flush_seconds=10):
+        self.corrected = corrected
+        self.flush_seconds = flush_seconds
+        header = not os.path.isfile(file_name) or os.path.getsize(file_name) == 0
+        self.file = open(file_name, 'a', newline='')
+        if header:
+            timestamps = ['Timestamp', 'Corrected_Timestamp'] if corrected else ['Timestamp']
+            self.file.write(','.join(timestamps + ['Channel', 'Value', 'Device_Time']) + '\n')
+        self.last_flush = time.monotonic()
+
+    def write(self, chunk, events):
+        if not events:
+            return
+        lines = []
+        for positions, label, values in events:
+            timestamps = chunk.timestamps[positions]
+            corrected = chunk.corrected[positions] if chunk.corrected is not None else np.full(len(positions), np.nan)
+            device_time = util.lsl_to_device_time(corrected if chunk.corrected is not None else timestamps)
+            values = values.astype(np.int64) if values.dtype.kind == 'b' else values
+            values = [csv_quote(value) for value in values.tolist()] if values.dtype.kind in 'OSU' else values.tolist()
+            for row in zip(timestamps.tolist(), corrected.tolist(), values, device_time.tolist()):
+                if self.corrected:
+                    lines.append((row[0], '%.6f,%.6f,%s,%s,%s\n' % (row[0], row[1], label, row[2], row[3])))
+                else:
+                    lines.append((row[0], '%.6f,%s,%s,%s\n' % (row[0], label, row[2], row[3])))
+        # Rows of different channels interleave in time order
+        lines.sort(key=lambda line: line[0])
+        self.file.write(''.join(line for _, line in lines))
+        now = time.monotonic()
+        if now - self.last_flush >= self.flush_seconds:
+            self.flush(now)
+
+    def flush(self, now=None):
+        self.file.flush()
+        self.last_flush = time.monotonic() if now is None else now
+
+    def close(self):
+        if not self.file.closed:
+            self.file.close()
+
+
+def load_profiles(config):
+    """StreamProfiles from every [Profile ...] section of a ConfigParser."""
+    return [StreamProfile.from_section(name, config[name]) for name in config.sections()
+            if name.split()[0] == PROFILE_SECTION_PREFIX]
+
+
+def profile_for(profiles, stream_name):
+    return next((profile for profile in profiles or () if profile.matches(stream_name)), None)
@@ -0,0 +1,232 @@
+"""
+Columnar recording core for LSL streams.
+
+Every stream gets a preallocated set of NumPy column buffers (one float64
+timestamp column plus one column per channel). Chunks from pull_chunk() are
+copied straight into those columns and handed to the stream's writer in bulk,
+so no pandas objects are created while recording.
+"""
+
+import os
+import time
+import numpy as np
+import pylsl
+from datetime import datetime
+from Util.writers import open_writer
+from Util.segments import SegmentCompressor
+from Util.profiles import profile_for, StateChangeWriter
+
+IRREGULAR_RATE_CAPACITY = 1024  # Buffer size for streams without a nominal rate
+
+
+class Chunk:
+    """
+    A block of samples for one stream, stored column by column. corrected
+    optionally holds clock-corrected, dejittered timestamps (see Util.timesync).
+    """
+    __slots__ = ('stream', 'timestamps', 'columns', 'corrected')
+
+    def __init__(self, stream, timestamps, columns, corrected=None):
+        self.stream = stream
+        self.timestamps = timestamps
+        self.columns = columns
+        self.corrected = corrected
+
+    def __len__(self):
+        return len(self.timestamps)
+
+
+class StreamBuffer:
+    """Preallocated per-stream column buffers that are drained in bulk."""
+
+    def __init__(self, name, labels, nominal_srate, dtype=np.float32, flush_seconds=5):
+        self.name = name
+        self.labels = list(labels)
+        self.dtype = np.dtype(dtype)
+        self.flush_seconds = flush_seconds
+        if nominal_srate > 0:
+            # Room for two flush periods so a late flush does not have to grow the buffer
+            capacity = int(np.ceil(nominal_srate * flush_seconds)) * 2
+        else:
+            capacity = IRREGULAR_RATE_CAPACITY
+        self.timestamps = np.empty(capacity, dtype=np.float64)
+        self.data = np.empty((len(self.labels), capacity), dtype=self.dtype)
+        self.size = 0
+        self.last_flush = time.monotonic()
+
+    @property
+    def capacity(self):
+        return len(self.timestamps)
+
+    def _grow(self, needed):
+        capacity = self.capacity
+        while capacity < needed:
+            capacity *= 2
+        timestamps = np.empty(capacity, dtype=np.float64)
+        timestamps[:self.size] = self.timestamps[:self.size]
+        data = np.empty((len(self.labels), capacity), dtype=self.dtype)
+        data[:, :self.size] = self.data[:, :self.size]
+        self.timestamps = timestamps
+        self.data = data
+
+    def append(self, samples, timestamps):
+        n = len(timestamps)
+        if n == 0:
+            return
+        end = self.size + n
+        if end > self.capacity:
+            self._grow(end)
+        self.timestamps[self.size:end] = timestamps
+        # A transposed view, so an array of the right dtype is copied without a temporary
+        self.data[:, self.size:end] = np.asarray(samples, dtype=self.dtype).T
+        self.size = end
+
+    def due(self, now=None):
+        if self.size == 0:
+            return False
+        if now is None:
+            now = time.monotonic()
+        return self.size * 2 >= self.capacity or now - self.last_flush >= self.flush_seconds
+
+    def drain(self):
+        """Return the buffered samples as a Chunk and reset the buffer."""
+        n = self.size
+        chunk = Chunk(self.name, self.timestamps[:n].copy(), list(self.data[:, :n].copy()))
+        self.size = 0
+        self.last_flush = time.monotonic()
+        return chunk
+
+
+class Recorder:
+    """Buffers samples per stream and hands them to the stream's writer every flush period."""
+
+    def __init__(self, path, file_name_prefix, flush_seconds=5, writer_options=None, compression=None, profiles=None,
+                 catalog=None, preview=None):
+        self.path = path
+        self.file_name_prefix = file_name_prefix
+        self.flush_seconds = flush_seconds
+        self.writer_options = dict(writer_options or {})
+        # Finished segments are compressed on one background thread shared by all streams
+        self.compressor = SegmentCompressor(compression)
+        self.writer_options['compressor'] = self.compressor
+        # Recording profiles (Util.profiles) select and narrow channels per stream
+        self.profiles = profiles or []
+        self.streams = {}
+        self.buffers = {}
+        self.writers = {}
+        self.projections = {}
+        self.state_writers = {}
+        self.labels = {}
+        self.events = None
+        # Util.catalog.Catalog updated with every file's sample count and time range each flush period
+        self.catalog = catalog
+        self.catalog_files = {}
+        self.last_catalog = time.monotonic()
+        # Util.preview.LivePreview with a ring per stream, fed by the readers as they pull
+        self.preview = preview
+
+    def add_stream(self, meta):
+        """Set up the column buffer and writer for a stream described by a StreamMeta."""
+        name = meta.name
+        stream_dir = os.path.join(self.path, name)
+        labels = meta.labels
+        profile = profile_for(self.profiles, name)
+        projection = profile.projection(meta.labels) if profile is not None else None
+        if projection is not None:
+            labels = projection.labels
+        # First, so a file of another layout (ValueError) leaves the stream unregistered
+        writer = open_writer(stream_dir, self.file_name_prefix, labels, **self.writer_options)
+        if projection is not None:
+            self.projections[name] = projection
+            if projection.changes:
+                os.makedirs(stream_dir, exist_ok=True)
+                self.state_writers[name] = StateChangeWriter(
+                    os.path.join(stream_dir, self.file_name_prefix + '_state_changes.csv'),
+                    self.writer_options.get('corrected', False))
+        self.streams[name] = meta
+        self.buffers[name] = StreamBuffer(name, meta.labels, meta.nominal_srate, meta.dtype, self.flush_seconds)
+        self.labels[name] = labels
+        if self.preview is not None:
+            self.preview.add_stream(name, meta.labels, meta.nominal_srate)
+        self.writers[name] = writer
+
+    def push(self, name, samples, timestamps):
+        buffer = self.buffers[name]
+        buffer.append(samples, timestamps)
+        if buffer.due():
+            return self.flush_stream(name)
+        return 0
+
+    def flush_stream(self, name):
+        buffer = self.buffers[name]
+        if buffer.size == 0:
+            return 0
+        chunk = buffer.drain()
+        self.write(chunk)
+        return len(chunk)
+
+    def write(self, chunk):
+        projection = self.projections.get(chunk.stream)
+        if projection is not None:
+            chunk, events = projection.apply(chunk)
+            if events:
+                self.state_writers[chunk.stream].write(chunk, events)
+        self.writers[chunk.stream].write(chunk)
+        if self.catalog is not None:
+            self.catalog_chunk(chunk)
+
+    def catalog_chunk(self, chunk):
+        file_name = self.writers[chunk.stream].file_name
+        entry = self.catalog_files.get(file_name)
+        if entry is None:
+            # The file may have been started earlier in the session
+            row = self.catalog.get(file_name)
+            entry = {'samples': row['samples'] if row else 0,
+                     't_start': row['t_start'] if row else float(chunk.timestamps[0])}
+            self.catalog_files[file_name] = entry
+        entry['samples'] += len(chunk)
+        entry['t_end'] = float(chunk.timestamps[-1])
+        entry['stream'] = chunk.stream
+        entry['dirty'] = True
+        now = time.monotonic()
+        if now - self.last_catalog >= self.flush_seconds:
+            self.update_catalog(now)
+
+    def update_catalog(self, now=None):
+        entries = []
+        for file_name, entry in self.catalog_files.items():
+            if entry['dirty']:
+                entries.append(self.catalog.entry(file_name, entry['stream'], self.labels[entry['stream']],
+                                                  entry['samples'], entry['t_start'], entry['t_end']))
+                entry['dirty'] = False
+        self.catalog.update(entries)
+        self.last_catalog = time.monotonic() if now is None else now
+
+    def flush(self):
+        for name in list(self.buffers):
+            self.flush_stream(name)
+
+    def log_event(self, event, meta):
+        """Append a session event (e.g. a stream attaching or detaching) to <prefix>_events.csv."""
+        if self.events is None:
+            os.makedirs(self.path, exist_ok=True)
+            file_name = os.path.join(self.path, self.file_name_prefix + '_events.csv')
+            header = not os.path.isfile(file_name)
+            self.events = open(file_name, 'a', newline='')
+            if header:
+                self.events.write('Timestamp,Wall_Time,Event,Stream,Source_ID,UID\n')
+        self.events.write('%.6f,%s,%s,%s,%s,%s\n' % (pylsl.local_clock(), datetime.now(), event, meta.name,
+                                                     meta.source_id, meta.uid))
+        self.events.flush()
+
+    def close(self):
+        self.flush()
+        for writer in self.writers.values():
+            writer.close()
+        for writer in self.state_writers.values():
+            writer.close()
+        if self.catalog is not None:
+            self.update_catalog()
+        self.compressor.close()
+        if self.events is not None:
+            self.events.close()
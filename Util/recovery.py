@@ -0,0 +1,309 @@
+"""
+Repair of recordings left behind by a crash.
+
+A data file is cut into pieces: the committed chunks (journal records for
+CSV files, CRC-checked frames for binary files) and whatever follows the last
+commit. Pieces that check out are kept, complete CSV rows of a chunk torn by
+the crash and after the last commit are kept too, and everything else (a
+half-written row or frame, chunks whose bytes never reached the disk) is cut
+out. The file is truncated when only its tail is damaged and rewritten
+otherwise, and the journal or index is rebuilt to match.
+
+Every piece that is cut out is reported as a lost time range. The range is
+exact when the journal or index recorded the chunk; otherwise it is bounded
+by the neighbouring samples that were kept (t_start/t_end None at the ends).
+"""
+
+import os
+import csv
+import json
+import mmap
+import logging
+import numpy as np
+from Util import binformat
+from Util.journal import read_journal, write_journal, checksum
+from Util.segments import read_manifest, manifest_file_name
+from Util.merge import recording_files, session_streams
+
+logger = logging.getLogger(__name__)
+
+CSV_EXTENSION = '.csv'
+BINARY_EXTENSION = '.bin'
+
+
+class Piece:
+    """A byte range of a data file, what it holds and whether it is kept."""
+
+    def __init__(self, start, end, samples, t_start, t_end, good, exact=True):
+        self.start = start
+        self.end = end
+        self.samples = samples
+        self.t_start = t_start
+        self.t_end = t_end
+        self.good = good
+        self.exact = exact
+
+
+def _map_file(file_name):
+    with open(file_name, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return b''
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _record_end(data, offset):
+    """Index of the newline that ends the CSV record at offset (not one inside quotes), -1 if there is none."""
+    end = data.find(b'\n', offset)
+    if end < 0 or data.find(b'"', offset, end) < 0:
+        return end
+    while end >= 0 and bytes(data[offset:end]).count(b'"') % 2:
+        end = data.find(b'\n', end + 1)
+    return end
+
+
+def _csv_fields(line):
+    if b'"' not in line:
+        return line.split(b',')
+    try:
+        return next(csv.reader([line.decode('utf-8')]))
+    except (UnicodeDecodeError, csv.Error, StopIteration):
+        return []
+
+
+def _csv_rows(data, start, columns, stop=None):
+    """Pieces for the complete, well-formed rows of data[start:stop], and where they stop."""
+    pieces = []
+    offset = start
+    stop = len(data) if stop is None else stop
+    while offset < stop:
+        end = _record_end(data, offset)
+        if end < 0 or end >= stop:
+            break
+        line = bytes(data[offset:end])
+        fields = _csv_fields(line)
+        try:
+            timestamp = float(fields[0])
+        except (ValueError, IndexError):
+            break
+        if len(fields) != columns:
+            break
+        pieces.append(Piece(offset, end + 1, 1, timestamp, timestamp, True))
+        offset = end + 1
+    return pieces, offset
+
+
+def _csv_pieces(file_name, data):
+    header_end = data.find(b'\n') + 1
+    if header_end == 0:
+        raise ValueError('%s has no complete header line' % file_name)
+    columns = data[:header_end].count(b',') + 1
+    pieces = []
+    offset = header_end
+    records = read_journal(file_name)
+    for k, (start, end, samples, t_start, t_end, crc) in enumerate(records):
+        if start != offset:
+            # Records follow each other; anything else means the journal itself is damaged
+            break
+        good = end <= len(data) and checksum(data[start:end]) == crc
+        if not good and (end >= len(data) or k == len(records) - 1):
+            # The chunk being written at the crash: keep its complete rows, cut from the first torn one
+            stop = min(end, len(data))
+            rows, offset = _csv_rows(data, start, columns, stop)
+            if rows:
+                pieces.append(Piece(start, offset, len(rows), rows[0].t_start, rows[-1].t_end, True))
+            if offset < stop or len(rows) < samples:
+                pieces.append(Piece(offset, stop, samples - len(rows), rows[-1].t_end if rows else t_start, t_end,
+                                    False, exact=not rows))
+            offset = end
+            continue
+        pieces.append(Piece(start, min(end, len(data)), samples, t_start, t_end, good))
+        offset = end
+    # Rows written after the last journal record that reached the disk
+    rows, offset = _csv_rows(data, min(offset, len(data)), columns)
+    if rows:
+        pieces.append(Piece(rows[0].start, rows[-1].end, len(rows), rows[0].t_start, rows[-1].t_end, True))
+    if offset < len(data):
+        pieces.append(Piece(offset, len(data), None, None, None, False, exact=False))
+    return header_end, pieces, len(records)
+
+
+def _binary_pieces(file_name, data):
+    if len(data) < binformat.HEADER_STRUCT.size:
+        raise ValueError('%s has no complete header' % file_name)
+    header = binformat.read_header(file_name)
+    frame_struct = binformat.chunk_struct(header['version'])
+    index_name = binformat.index_file_name(file_name)
+    index = {}
+    indexed = 0
+    if os.path.isfile(index_name):
+        # A partly written record makes this a fraction, so the index gets rewritten
+        indexed = os.path.getsize(index_name) / binformat.INDEX_DTYPE.itemsize
+        count = int(indexed)
+        for record in np.fromfile(index_name, dtype=binformat.INDEX_DTYPE, count=count):
+            index[int(record['offset'])] = record
+    pieces = []
+    offset = header['data_offset']
+    while offset < len(data):
+        size = binformat.frame_size(data, offset, frame_struct)
+        if size:
+            n = frame_struct.unpack_from(data, offset)[1]
+            timestamps = np.frombuffer(data, dtype='<f8', count=n, offset=offset + frame_struct.size)
+            pieces.append(Piece(offset, offset + size, n, float(timestamps[0]), float(timestamps[-1]), True))
+            offset += size
+            continue
+        # Frames start on 8 byte boundaries; skip to the next one that checks out
+        end = offset + 8
+        while end < len(data):
+            end = data.find(binformat.CHUNK_MAGIC, end)
+            if end < 0:
+                end = len(data)
+            elif end % 8 or not binformat.frame_size(data, end, frame_struct):
+                end += 1
+                continue
+            break
+        end = min(end, len(data))
+        lost = [index[key] for key in sorted(index) if offset <= key < end]
+        if lost:
+            pieces.append(Piece(offset, end, int(sum(record['samples'] for record in lost)),
+                                float(lost[0]['t_start']), float(lost[-1]['t_end']), False))
+        else:
+            pieces.append(Piece(offset, end, None, None, None, False, exact=False))
+        offset = end
+    # Chunks the index knows about that never made it into the file at all
+    lost = [index[key] for key in sorted(index) if key >= len(data)]
+    if lost:
+        pieces.append(Piece(len(data), len(data), int(sum(record['samples'] for record in lost)),
+                            float(lost[0]['t_start']), float(lost[-1]['t_end']), False))
+    return header['data_offset'], pieces, indexed
+
+
+def _write_csv_journal(file_name, data, pieces, offsets):
+    records = [(offset, offset + piece.end - piece.start, piece.samples, piece.t_start, piece.t_end,
+                checksum(data[piece.start:piece.end])) for piece, offset in zip(pieces, offsets)]
+    write_journal(file_name, records)
+
+
+def _write_binary_index(file_name, pieces, offsets):
+    records = np.array([(offset, piece.samples, piece.t_start, piece.t_end) for piece, offset in zip(pieces, offsets)],
+                       dtype=binformat.INDEX_DTYPE)
+    index_name = binformat.index_file_name(file_name)
+    records.tofile(index_name + '.tmp')
+    os.replace(index_name + '.tmp', index_name)
+
+
+def lost_ranges(pieces):
+    """Merge consecutive cut out pieces into lost time ranges, bounded by the kept neighbours where unknown."""
+    ranges = []
+    previous_end = None
+    k = 0
+    while k < len(pieces):
+        if pieces[k].good:
+            previous_end = pieces[k].t_end
+            k += 1
+            continue
+        run = []
+        while k < len(pieces) and not pieces[k].good:
+            run.append(pieces[k])
+            k += 1
+        following = pieces[k].t_start if k < len(pieces) else None
+        known = [piece for piece in run if piece.t_start is not None]
+        exact = all(piece.exact for piece in run)
+        ranges.append({
+            't_start': known[0].t_start if exact else previous_end,
+            't_end': known[-1].t_end if exact else (following if following is not None else
+                                                    (known[-1].t_end if known else None)),
+            'samples': sum(piece.samples for piece in run) if exact else None,
+            'exact': exact,
+            'bytes': sum(piece.end - piece.start for piece in run),
+        })
+    return ranges
+
+
+def recover_file(file_name, dry_run=False):
+    """
+    Check one uncompressed .csv or .bin recording and, unless dry_run, cut
+    out what is damaged. Returns a report: samples and bytes kept, first and
+    last timestamp kept, the lost ranges and whether the file was changed.
+    """
+    binary = file_name.endswith(BINARY_EXTENSION)
+    data = _map_file(file_name)
+    try:
+        header_end, pieces, indexed = (_binary_pieces if binary else _csv_pieces)(file_name, data)
+        good = [piece for piece in pieces if piece.good]
+        offsets = []
+        offset = header_end
+        for piece in good:
+            offsets.append(offset)
+            offset += piece.end - piece.start
+        # Damage only at the end can simply be truncated away
+        contiguous = all(piece.start == new for piece, new in zip(good, offsets))
+        changed = offset != len(data)
+        report = {
+            'file': file_name,
+            'samples': sum(piece.samples for piece in good),
+            'bytes': offset,
+            't_start': good[0].t_start if good else None,
+            't_end': good[-1].t_end if good else None,
+            'lost': lost_ranges(pieces),
+            'changed': changed,
+        }
+        if dry_run or not (changed or report['lost'] or indexed != len(good)):
+            return report
+        if changed and not contiguous:
+            with open(file_name + '.tmp', 'wb') as f:
+                f.write(data[:header_end])
+                for piece in good:
+                    f.write(data[piece.start:piece.end])
+        if binary:
+            _write_binary_index(file_name, good, offsets)
+        else:
+            _write_csv_journal(file_name, data, good, offsets)
+    finally:
+        if isinstance(data, mmap.mmap):
+            data.close()
+    if changed and not contiguous:
+        os.replace(file_name + '.tmp', file_name)
+    elif changed:
+        with open(file_name, 'r+b') as f:
+            f.truncate(offset)
+    return report
+
+
+def _update_manifest(stream_dir, file_name_prefix, reports):
+    manifest = read_manifest(stream_dir, file_name_prefix)
+    if manifest is None:
+        return
+    for segment in manifest['segments']:
+        report = reports.get(segment['file'])
+        if report is None:
+            continue
+        segment.update(samples=report['samples'], bytes=report['bytes'], complete=True)
+        if report['t_start'] is not None:
+            segment.update(t_start=report['t_start'], t_end=report['t_end'])
+    file_name = manifest_file_name(stream_dir, file_name_prefix)
+    with open(file_name + '.tmp', 'w') as f:
+        json.dump(manifest, f, indent=1)
+    os.replace(file_name + '.tmp', file_name)
+
+
+def recover_session(session_dir, file_name_prefix, dry_run=False):
+    """
+    recover_file() every uncompressed recording of a session (compressed
+    segments were finished before they were compressed) and bring segment
+    manifests up to date. Returns {stream: [report, ...]}.
+    """
+    results = {}
+    for stream in session_streams(session_dir, file_name_prefix):
+        stream_dir = os.path.join(session_dir, stream)
+        reports = {}
+        for file_name in recording_files(stream_dir, file_name_prefix):
+            if not file_name.endswith((CSV_EXTENSION, BINARY_EXTENSION)):
+                continue
+            try:
+                reports[os.path.basename(file_name)] = recover_file(file_name, dry_run)
+            except (ValueError, OSError) as e:
+                logger.error('Could not recover %s: %s', file_name, e)
+        if reports and not dry_run:
+            _update_manifest(stream_dir, file_name_prefix, reports)
+        results[stream] = list(reports.values())
+    return results
@@ -0,0 +1,215 @@
+"""
+Rolling segment files for long recordings.
+
+SegmentedWriter starts a new <prefix>_data.NNN.<ext> file whenever the current
+one reaches a size or duration limit. Finished segments are compressed on a
+background thread with the best codec installed (zstd, lz4, then gzip), and
+<prefix>_manifest.json lists every segment with its sample count and LSL time
+range so a reader can open only the segments it needs.
+"""
+
+import os
+import json
+import gzip
+import shutil
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+COMPRESSION_EXTENSIONS = {'gzip': '.gz', 'zstd': '.zst', 'lz4': '.lz4'}
+
+
+def resolve_compression(method='auto'):
+    """The codec to use for 'auto' (or a named codec), None for no compression."""
+    if method in (None, '', 'none'):
+        return None
+    if method == 'auto':
+        if zstandard is not None:
+            return 'zstd'
+        if lz4 is not None:
+            return 'lz4'
+        return 'gzip'
+    if method == 'zstd' and zstandard is None:
+        raise ValueError('zstd compression needs the zstandard package')
+    if method == 'lz4' and lz4 is None:
+        raise ValueError('lz4 compression needs the lz4 package')
+    if method not in COMPRESSION_EXTENSIONS:
+        raise ValueError('Unknown compression %r' % method)
+    return method
+
+
+def compress_file(file_name, method):
+    """Compress file_name next to itself, remove the original and return the new name."""
+    target = file_name + COMPRESSION_EXTENSIONS[method]
+    with open(file_name, 'rb') as source:
+        if method == 'zstd':
+            with open(target, 'wb') as f:
+                zstandard.ZstdCompressor().copy_stream(source, f)
+        elif method == 'lz4':
+            with lz4.frame.open(target, 'wb') as f:
+                shutil.copyfileobj(source, f, 1 << 20)
+        else:
+            with gzip.open(target, 'wb', compresslevel=6) as f:
+                shutil.copyfileobj(source, f, 1 << 20)
+    os.remove(file_name)
+    return target
+
+
+def open_segment(file_name):
+    """Open a segment for binary reading, decompressing by file extension."""
+    if file_name.endswith('.zst'):
+        if zstandard is None:
+            raise ValueError('%s needs the zstandard package' % file_name)
+        return zstandard.ZstdDecompressor().stream_reader(open(file_name, 'rb'), closefd=True)
+    if file_name.endswith('.lz4'):
+        if lz4 is None:
+            raise ValueError('%s needs the lz4 package' % file_name)
+        return lz4.frame.open(file_name, 'rb')
+    if file_name.endswith('.gz'):
+        return gzip.open(file_name, 'rb')
+    return open(file_name, 'rb')
+
+
+def manifest_file_name(stream_dir, file_name_prefix):
+    return os.path.join(stream_dir, file_name_prefix + '_manifest.json')
+
+
+def read_manifest(stream_dir, file_name_prefix):
+    file_name = manifest_file_name(stream_dir, file_name_prefix)
+    if not os.path.isfile(file_name):
+        return None
+    with open(file_name) as f:
+        return json.load(f)
+
+
+class SegmentCompressor:
+    """Single background thread that compresses finished segments."""
+
+    def __init__(self, method='auto'):
+        self.method = resolve_compression(method)
+        self.executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='compress') if self.method else None
+
+    def submit(self, file_name, done):
+        if self.executor is None:
+            return
+        self.executor.submit(self._compress, file_name, done)
+
+    def _compress(self, file_name, done):
+        try:
+            done(compress_file(file_name, self.method))
+        except Exception:
+            logger.exception('Could not compress %s', file_name)
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+
+
+class SegmentedWriter:
+    """Writes a stream as a series of size/duration limited segments plus a manifest."""
+
+    def __init__(self, stream_dir, file_name_prefix, labels, file_format, extension, writer_class,
+                 max_bytes=0, max_seconds=0, compressor=None, buffer_bytes=1 << 20, flush_seconds=10, corrected=False,
+                 fsync_seconds=0):
+        self.stream_dir = stream_dir
+        self.file_name_prefix = file_name_prefix
+        self.labels = list(labels)
+        self.extension = extension
+        self.writer_class = writer_class
+        self.max_bytes = max_bytes
+        self.max_seconds = max_seconds
+        self.compressor = compressor
+        self.buffer_bytes = buffer_bytes
+        self.flush_seconds = flush_seconds
+        self.corrected = corrected
+        self.fsync_seconds = fsync_seconds
+        self.lock = threading.Lock()
+        self.manifest = read_manifest(stream_dir, file_name_prefix) or {
+            'stream': os.path.basename(os.path.normpath(stream_dir)),
+            'labels': self.labels,
+            'format': file_format,
+            'segments': [],
+        }
+        self.writer = None
+        self.segment = None
+
+    def _open_segment(self, t_start):
+        number = len(self.manifest['segments'])
+        file_name = '%s_data.%03d%s' % (self.file_name_prefix, number, self.extension)
+        self.writer = self.writer_class(os.path.join(self.stream_dir, file_name), self.labels,
+                                        self.buffer_bytes, self.flush_seconds, self.corrected, self.fsync_seconds)
+        self.segment = {'file': file_name, 't_start': t_start, 't_end': t_start, 'samples': 0,
+                        'bytes': 0, 'complete': False}
+        with self.lock:
+            self.manifest['segments'].append(self.segment)
+            self._save_manifest()
+
+    def _close_segment(self):
+        segment = self.segment
+        self.writer.close()
+        self.writer = None
+        self.segment = None
+        with self.lock:
+            segment['bytes'] = os.path.getsize(os.path.join(self.stream_dir, segment['file']))
+            segment['complete'] = True
+            self._save_manifest()
+        if self.compressor is not None:
+            self.compressor.submit(os.path.join(self.stream_dir, segment['file']),
+                                   lambda compressed: self._compressed(segment, compressed))
+
+    def _compressed(self, segment, file_name):
+        with self.lock:
+            segment['file'] = os.path.basename(file_name)
+            segment['compression'] = self.compressor.method
+            segment['compressed_bytes'] = os.path.getsize(file_name)
+            self._save_manifest()
+
+    def _save_manifest(self):
+        file_name = manifest_file_name(self.stream_dir, self.file_name_prefix)
+        with open(file_name + '.tmp', 'w') as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(file_name + '.tmp', file_name)
+
+    @property
+    def file_name(self):
+        """Path of the segment being written, None between segments."""
+        return None if self.segment is None else os.path.join(self.stream_dir, self.segment['file'])
+
+    def _full(self):
+        if self.max_bytes and self.writer.bytes_written >= self.max_bytes:
+            return True
+        return bool(self.max_seconds) and self.segment['t_end'] - self.segment['t_start'] >= self.max_seconds
+
+    def write(self, chunk):
+        if len(chunk) == 0:
+            return
+        if self.writer is not None and self._full():
+            self._close_segment()
+        if self.writer is None:
+            self._open_segment(float(chunk.timestamps[0]))
+        self.writer.write(chunk)
+        self.segment['t_end'] = float(chunk.timestamps[-1])
+        self.segment['samples'] += len(chunk)
+
+    def flush(self, now=None):
+        if self.writer is not None:
+            self.writer.flush(now)
+            with self.lock:
+                self.segment['bytes'] = self.writer.bytes_written
+                self._save_manifest()
+
+    def close(self):
+        if self.writer is not None:
+            self._close_segment()
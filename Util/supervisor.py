@@ -0,0 +1,149 @@
+"""
+Supervised device collector processes.
+
+Each device script (Zephyr, decibel meter, Myo) runs as a child process that
+the Supervisor keeps an eye on. Its stream is attached to the recording as
+soon as the outlet shows up, and the process counts as healthy while that
+stream's reader keeps receiving samples. A collector that exits, never
+brings up its outlet, or stops sending is restarted, waiting 1, 2, 4, ...
+seconds (up to max_backoff) between attempts; the wait resets once the
+device has been healthy for a while.
+"""
+
+import time
+import logging
+import threading
+import subprocess
+import pylsl
+from Util import discovery
+
+logger = logging.getLogger(__name__)
+
+TERMINATE_TIMEOUT = 5.0
+
+
+class DeviceProcess:
+    """One collector script, the LSL stream name prefix it publishes and its restart state."""
+
+    def __init__(self, name, command, stream_prefix):
+        self.name = name
+        self.command = list(command)
+        self.stream_prefix = stream_prefix
+        self.process = None
+        self.state = 'stopped'
+        self.started = None
+        self.healthy_since = None
+        self.restart_at = None
+        self.failures = 0
+        self.restarts = 0
+        self.resolver = None
+
+    def launch(self):
+        self.process = subprocess.Popen(self.command)
+        self.state = 'starting'
+        self.started = time.monotonic()
+        self.healthy_since = None
+        self.restart_at = None
+
+    def alive(self):
+        return self.process is not None and self.process.poll() is None
+
+    def terminate(self):
+        if not self.alive():
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(TERMINATE_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+
+class Supervisor(threading.Thread):
+    """Starts the device processes, attaches their streams as soon as they appear and restarts them when unhealthy."""
+
+    def __init__(self, engine, watcher, poll_interval=0.5, startup_timeout=30.0, stall_after=15.0, backoff=1.0,
+                 max_backoff=60.0, healthy_after=60.0):
+        super(Supervisor, self).__init__(name='supervisor', daemon=True)
+        self.engine = engine
+        self.watcher = watcher
+        self.poll_interval = poll_interval
+        self.startup_timeout = startup_timeout
+        self.stall_after = stall_after
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.healthy_after = healthy_after
+        self.devices = []
+        self.stopping = threading.Event()
+
+    def add(self, name, command, stream_prefix):
+        device = DeviceProcess(name, command, stream_prefix)
+        # Resolves just this device's outlet, so it is attached the moment it is on the network
+        device.resolver = pylsl.ContinuousResolver(pred=discovery.name_predicate(stream_prefix))
+        self.devices.append(device)
+        return device
+
+    def schedule_restart(self, device, now, reason):
+        device.terminate()
+        # Readers of the old outlet would keep the restarted one from being attached
+        self.engine.retire([reader.stream for reader in self.engine.readers_matching(device.stream_prefix)])
+        delay = min(self.max_backoff, self.backoff * 2 ** device.failures)
+        device.failures += 1
+        device.restarts += 1
+        device.restart_at = now + delay
+        device.state = 'backoff'
+        logger.warning('%s %s, restarting in %g s', device.name, reason, delay)
+
+    def check(self, device, now):
+        if device.restart_at is not None:
+            if now >= device.restart_at:
+                logger.info('Restarting %s (attempt %d)', device.name, device.restarts)
+                device.launch()
+            return
+        if not device.alive():
+            self.schedule_restart(device, now, 'exited with code %s' % device.process.returncode)
+            return
+        for info in device.resolver.results():
+            self.watcher.attach(info)
+        readers = [reader for reader in self.engine.readers_matching(device.stream_prefix) if reader.is_alive()]
+        if readers and min(reader.silence(now) for reader in readers) < self.stall_after:
+            if device.state != 'running':
+                logger.info('%s is recording', device.name)
+                device.state = 'running'
+                device.healthy_since = now
+            elif now - device.healthy_since >= self.healthy_after:
+                device.failures = 0
+            return
+        if readers and now - device.started >= self.stall_after:
+            self.schedule_restart(device, now, 'stopped sending samples')
+        elif not readers and now - device.started >= self.startup_timeout:
+            self.schedule_restart(device, now, 'has no LSL stream after %g s' % self.startup_timeout)
+
+    def poll(self):
+        now = time.monotonic()
+        for device in self.devices:
+            try:
+                self.check(device, now)
+            except Exception:
+                logger.exception('Could not check %s', device.name)
+
+    def status(self):
+        return {device.name: device.state for device in self.devices}
+
+    def start(self):
+        for device in self.devices:
+            logger.info('Starting %s', device.name)
+            device.launch()
+        super(Supervisor, self).start()
+
+    def run(self):
+        while not self.stopping.wait(self.poll_interval):
+            self.poll()
+
+    def stop(self):
+        self.stopping.set()
+        if self.is_alive():
+            self.join()
+        for device in self.devices:
+            device.terminate()
+            device.state = 'stopped'
@@ -0,0 +1,185 @@
+"""
+Per-stream acquisition telemetry.
+
+Each InletReader feeds a StreamStats with the timestamps of every pull. A
+TelemetryPublisher thread takes a snapshot of all readers every few seconds
+and appends one JSON line per stream to <prefix>_telemetry.jsonl (and
+optionally pushes the same JSON on an LSL metrics stream):
+    effective_srate   samples per wall-clock second vs nominal_srate
+    chunk_samples     min / median / p95 / max samples per pull
+    interval_ms       mean and standard deviation (jitter) of the time between samples
+    gaps              intervals longer than GAP_FACTOR nominal sample periods
+    latency_ms        local clock at pull time minus the corrected sample timestamp
+    time_correction   the inlet's latest LSL clock offset in seconds
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+from collections import deque
+import numpy as np
+import pylsl
+
+logger = logging.getLogger(__name__)
+
+GAP_FACTOR = 3.0  # An interval this many nominal periods long counts as a gap
+DEGRADED_RATE = 0.9  # Warn when a stream delivers less than this fraction of its nominal rate
+TIME_CORRECTION_TIMEOUT = 1.0
+METRICS_STREAM_NAME = 'SmartpenTelemetry'
+
+
+class StreamStats:
+    """Accumulates one reader's pull statistics between snapshots."""
+
+    def __init__(self, nominal_srate):
+        self.nominal_srate = nominal_srate
+        self.lock = threading.Lock()
+        self.time_correction = 0.0
+        self.total_samples = 0
+        self.last_timestamp = None
+        self._reset(time.monotonic())
+
+    def _reset(self, now):
+        self.window_start = now
+        self.samples = 0
+        self.chunk_sizes = deque(maxlen=4096)
+        self.intervals = 0
+        self.interval_sum = 0.0
+        self.interval_sumsq = 0.0
+        self.gaps = 0
+        self.gap_seconds = 0.0
+        self.longest_gap = 0.0
+        self.latency_sum = 0.0
+        self.latency_max = 0.0
+        self.latency_count = 0
+
+    def update(self, timestamps):
+        """Record one pull; timestamps are the pulled samples' LSL timestamps."""
+        arrival = pylsl.local_clock()
+        n = len(timestamps)
+        with self.lock:
+            if self.last_timestamp is not None:
+                intervals = np.diff(timestamps, prepend=self.last_timestamp)
+            else:
+                intervals = np.diff(timestamps)
+            self.last_timestamp = float(timestamps[-1])
+            self.samples += n
+            self.total_samples += n
+            self.chunk_sizes.append(n)
+            if len(intervals):
+                self.intervals += len(intervals)
+                self.interval_sum += float(intervals.sum())
+                self.interval_sumsq += float(np.dot(intervals, intervals))
+                if self.nominal_srate > 0:
+                    period = 1.0 / self.nominal_srate
+                    gaps = intervals[intervals > GAP_FACTOR * period]
+                    if len(gaps):
+                        self.gaps += len(gaps)
+                        self.gap_seconds += float(gaps.sum()) - len(gaps) * period
+                        self.longest_gap = max(self.longest_gap, float(gaps.max()))
+            latency = arrival - (self.last_timestamp + self.time_correction)
+            self.latency_sum += latency
+            self.latency_max = max(self.latency_max, latency)
+            self.latency_count += 1
+
+    def snapshot(self, now=None):
+        """Statistics since the previous snapshot, as a JSON-friendly dict."""
+        now = time.monotonic() if now is None else now
+        with self.lock:
+            elapsed = max(now - self.window_start, 1e-9)
+            if self.intervals:
+                mean = self.interval_sum / self.intervals
+                jitter = np.sqrt(max(self.interval_sumsq / self.intervals - mean * mean, 0.0))
+            else:
+                mean = jitter = 0.0
+            sizes = np.array(self.chunk_sizes) if self.chunk_sizes else np.zeros(1)
+            stats = {
+                'nominal_srate': self.nominal_srate,
+                'effective_srate': round(self.samples / elapsed, 3),
+                'samples': self.samples,
+                'total_samples': self.total_samples,
+                'chunks': len(self.chunk_sizes),
+                'chunk_samples': {'min': int(sizes.min()), 'median': float(np.median(sizes)),
+                                  'p95': float(np.percentile(sizes, 95)), 'max': int(sizes.max())},
+                'interval_ms': {'mean': round(mean * 1000, 4), 'jitter': round(jitter * 1000, 4)},
+                'gaps': {'count': self.gaps, 'seconds': round(self.gap_seconds, 4),
+                         'longest': round(self.longest_gap, 4)},
+                'latency_ms': {'mean': round(self.latency_sum / max(self.latency_count, 1) * 1000, 3),
+                               'max': round(self.latency_max * 1000, 3)},
+                'time_correction': self.time_correction,
+            }
+            self._reset(now)
+        return stats
+
+
+def degraded(stats):
+    """True if a stream delivered noticeably less than its nominal rate or had gaps."""
+    if stats['nominal_srate'] <= 0:
+        return False
+    return stats['effective_srate'] < DEGRADED_RATE * stats['nominal_srate'] or stats['gaps']['count'] > 0
+
+
+class TelemetryPublisher(threading.Thread):
+    """Periodically writes every reader's StreamStats to a JSON line file and, optionally, an LSL outlet."""
+
+    def __init__(self, engine, file_name, interval=10.0, lsl_outlet=False):
+        super(TelemetryPublisher, self).__init__(name='telemetry', daemon=True)
+        self.engine = engine
+        self.file_name = file_name
+        self.interval = interval
+        self.outlet = None
+        if lsl_outlet:
+            info = pylsl.StreamInfo(METRICS_STREAM_NAME, 'Metrics', 1, pylsl.IRREGULAR_RATE, pylsl.cf_string,
+                                    'smartpen-telemetry')
+            self.outlet = pylsl.StreamOutlet(info)
+        self.stopping = threading.Event()
+
+    def update_time_corrections(self, readers):
+        for reader in readers:
+            if reader.corrector is not None and reader.corrector.clock_correction:
+                # The engine's OffsetRefresher already asks these inlets
+                reader.stats.time_correction = reader.corrector.offset
+                continue
+            try:
+                reader.stats.time_correction = reader.inlet.time_correction(TIME_CORRECTION_TIMEOUT)
+            except Exception:
+                # Keep the last known offset if the outlet does not answer in time
+                pass
+
+    def publish(self):
+        readers = self.engine.reader_list()
+        self.update_time_corrections(readers)
+        now = time.monotonic()
+        lines = []
+        for reader in readers:
+            stats = reader.stats.snapshot(now)
+            if degraded(stats):
+                logger.warning('%s is degraded: %.1f of %g Hz, %d gaps', reader.stream, stats['effective_srate'],
+                               stats['nominal_srate'], stats['gaps']['count'])
+            record = {'timestamp': pylsl.local_clock(), 'stream': reader.stream}
+            record.update(stats)
+            lines.append(json.dumps(record))
+        if not lines:
+            return
+        os.makedirs(os.path.dirname(self.file_name) or '.', exist_ok=True)
+        with open(self.file_name, 'a') as f:
+            f.write('\n'.join(lines) + '\n')
+        if self.outlet is not None:
+            for line in lines:
+                self.outlet.push_sample([line])
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            try:
+                self.publish()
+            except Exception:
+                logger.exception('Could not publish telemetry')
+
+    def stop(self):
+        self.stopping.set()
+        if self.is_alive():
+            self.join()
+        # Last partial window
+        self.publish()
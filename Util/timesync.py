@@ -0,0 +1,127 @@
+"""
+Clock-offset correction and dejittering of LSL timestamps.
+
+A TimestampCorrector belongs to one inlet reader and turns each drained
+chunk's raw timestamps into a corrected float64 column that is written next
+to the raw one:
+    - the inlet's time_correction() offset moves the timestamps into the
+      local LSL clock, so streams from different machines line up. An
+      OffsetRefresher thread asks for it every few seconds and correct()
+      only reads the last answer, so a slow or missing outlet never holds
+      up the reader
+    - for regular-rate streams, a least-squares line of timestamp against
+      sample number over the last window_seconds of samples replaces the
+      network jitter with the stream's actual sample clock; the fit restarts
+      after a gap so dropouts are not smoothed over
+Everything is computed with NumPy over the whole chunk.
+"""
+
+import logging
+import threading
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# An interval of GAP_FACTOR nominal periods, and at least MIN_GAP_SECONDS, restarts the dejitter fit;
+# the floor keeps ordinary network jitter from counting as a gap
+GAP_FACTOR = 3.0
+MIN_GAP_SECONDS = 0.1
+OFFSET_REFRESH_SECONDS = 5.0
+TIME_CORRECTION_TIMEOUT = 0.5
+
+
+class TimestampCorrector:
+    """Per-stream clock offset plus sliding-window linear-regression dejitter."""
+
+    def __init__(self, inlet, nominal_srate, window_seconds=10.0, clock_correction=True):
+        self.inlet = inlet
+        self.nominal_srate = nominal_srate
+        self.clock_correction = clock_correction
+        self.window = int(np.ceil(nominal_srate * window_seconds)) if nominal_srate > 0 else 0
+        self.offset = 0.0
+        self.last_timestamp = None
+        self._reset()
+
+    def _reset(self):
+        self.sample_number = 0
+        self.history_x = np.empty(0, dtype=np.float64)
+        self.history_t = np.empty(0, dtype=np.float64)
+
+    def refresh_offset(self):
+        """Ask the inlet for its clock offset; blocks up to TIME_CORRECTION_TIMEOUT, so not on the reader thread."""
+        if not self.clock_correction:
+            return
+        try:
+            self.offset = self.inlet.time_correction(TIME_CORRECTION_TIMEOUT)
+        except Exception:
+            # No estimate yet (or the outlet is gone); keep the last one and try again later
+            pass
+
+    def _fit(self, timestamps):
+        n = len(timestamps)
+        x = self.sample_number + np.arange(n, dtype=np.float64)
+        self.sample_number += n
+        self.history_x = np.concatenate([self.history_x, x])[-self.window:]
+        self.history_t = np.concatenate([self.history_t, timestamps])[-self.window:]
+        if len(self.history_x) < 2:
+            return timestamps.copy()
+        # Relative to the window start to keep the float64 precision
+        x0, t0 = self.history_x[0], self.history_t[0]
+        hx = self.history_x - x0
+        ht = self.history_t - t0
+        mx, mt = hx.mean(), ht.mean()
+        slope = np.dot(hx - mx, ht - mt) / np.dot(hx - mx, hx - mx)
+        return t0 + mt + slope * (x - x0 - mx)
+
+    def dejitter(self, timestamps):
+        if self.window < 2:
+            return timestamps.copy()
+        gap = max(GAP_FACTOR / self.nominal_srate, MIN_GAP_SECONDS)
+        previous = timestamps[0] if self.last_timestamp is None else self.last_timestamp
+        intervals = np.diff(timestamps, prepend=previous)
+        breaks = np.flatnonzero(intervals > gap).tolist() + [len(timestamps)]
+        out = np.empty(len(timestamps), dtype=np.float64)
+        start = 0
+        for end in breaks:
+            if end > start:
+                out[start:end] = self._fit(timestamps[start:end])
+            if end < len(timestamps):
+                self._reset()
+            start = end
+        return out
+
+    def correct(self, timestamps):
+        """Corrected float64 timestamps for one chunk of raw LSL timestamps."""
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        if len(timestamps) == 0:
+            return timestamps.copy()
+        corrected = self.dejitter(timestamps)
+        self.last_timestamp = float(timestamps[-1])
+        corrected += self.offset
+        return corrected
+
+
+class OffsetRefresher(threading.Thread):
+    """Refreshes the clock offset of every corrector returned by correctors() every interval seconds."""
+
+    def __init__(self, correctors, interval=OFFSET_REFRESH_SECONDS):
+        super(OffsetRefresher, self).__init__(name='time-correction', daemon=True)
+        self.correctors = correctors
+        self.interval = interval
+        self.stopping = threading.Event()
+
+    def run(self):
+        while not self.stopping.is_set():
+            for corrector in self.correctors():
+                if self.stopping.is_set():
+                    break
+                try:
+                    corrector.refresh_offset()
+                except Exception:
+                    logger.exception('Could not refresh a clock offset')
+            self.stopping.wait(self.interval)
+
+    def stop(self):
+        self.stopping.set()
+        if self.is_alive():
+            self.join()
@@ -1,34 +1,91 @@
 
 
 
+import pylsl
 from pylsl import StreamInlet
+import numpy as np
 import pandas as pd
 from pandas import Timestamp
-from datetime import datetime
+from datetime import datetime, timezone
 
 
-def obtain_stream_channel_names(stream):
-    header = []
-    inlet = StreamInlet(stream)
-    info = inlet.info()
+# NumPy type for each LSL channel format; string streams are kept as Python objects
+CHANNEL_FORMAT_DTYPES = {
+    pylsl.cf_float32: np.dtype(np.float32),
+    pylsl.cf_double64: np.dtype(np.float64),
+    pylsl.cf_string: np.dtype(object),
+    pylsl.cf_int32: np.dtype(np.int32),
+    pylsl.cf_int16: np.dtype(np.int16),
+    pylsl.cf_int8: np.dtype(np.int8),
+    pylsl.cf_int64: np.dtype(np.int64),
+}
+
+
+def channel_format_dtype(channel_format):
+    return CHANNEL_FORMAT_DTYPES.get(channel_format, np.dtype(np.float64))
+
+
+def read_channel_descriptions(info):
+    # Channel labels and units from a full stream info (one that came from inlet.info())
+    labels = []
+    units = []
     ch = info.desc().child("channels").child("channel")
     for k in range(info.channel_count()):
-        #print("  " + ch.child_value("label"))
-        header.append(ch.child_value("label"))
+        label = ch.child_value("label")
+        labels.append(label if label else 'Channel_%d' % (k + 1))
+        units.append(ch.child_value("unit"))
         ch = ch.next_sibling()
-    return header
+    return labels, units
+
+
+def obtain_stream_channel_names(stream):
+    inlet = StreamInlet(stream)
+    return read_channel_descriptions(inlet.info())[0]
+
+
+def chunk_to_arrays(samples, timestamps, dtype=None, channels=0):
+    # One pull_chunk() result as a float64 timestamp column and an (n, channels) sample array
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if len(timestamps) == 0:
+        # An empty pull has no samples to take the channel count from
+        return timestamps, np.empty((0, channels), dtype=dtype if dtype is not None else np.float64)
+    data = np.asarray(samples, dtype=dtype)
+    if data.ndim == 1:
+        data = data.reshape(len(timestamps), -1)
+    return timestamps, data
 
 
 def format_data_into_dataframe(samples, timestamps, header):
+    if len(timestamps) == 0:
+        return pd.DataFrame(np.empty((0, len(header))), index=pd.DatetimeIndex([]), columns=list(header))
+    timestamps, data = chunk_to_arrays(samples, timestamps)
+    channels = data.shape[1]
     if len(header) > 0:
-        df = pd.DataFrame(columns=header)
+        # header is the channel labels followed by the Device_Time column
+        columns = list(header[:channels])
+        time_column = header[channels] if len(header) > channels else 'Device_Time'
     else:
-        df = pd.DataFrame()
-    for sample, timestamp in zip(samples, timestamps):
-        converted_time = datetime.fromtimestamp(timestamp)
-        current_time = Timestamp(0).now()
-        sample.append(converted_time)
-        df.at[current_time] = sample
+        columns = list(range(channels))
+        time_column = channels
+    # One now() per chunk, offset by a nanosecond per row so the index stays unique
+    index = pd.DatetimeIndex(Timestamp.now().value + np.arange(len(timestamps), dtype=np.int64))
+    df = pd.DataFrame(data, index=index, columns=columns)
+    df[time_column] = lsl_to_datetime64(timestamps)
     return df
 
 
+def lsl_to_datetime64(timestamps):
+    # Local time like datetime.fromtimestamp(t), converted for a whole chunk at once
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if len(timestamps) == 0:
+        return np.empty(0, dtype='datetime64[us]')
+    t0 = float(timestamps[0])
+    offset = datetime.fromtimestamp(t0) - datetime.fromtimestamp(t0, timezone.utc).replace(tzinfo=None)
+    micros = np.round(timestamps * 1e6).astype(np.int64) + int(offset.total_seconds() * 1e6)
+    return micros.astype('datetime64[us]')
+
+
+def lsl_to_device_time(timestamps):
+    # Same text as str(datetime.fromtimestamp(t))
+    text = np.datetime_as_string(lsl_to_datetime64(timestamps), unit='us')
+    return np.char.replace(text, 'T', ' ')
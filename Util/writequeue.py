@@ -0,0 +1,188 @@
+"""
+Bounded chunk queue between the inlet readers and the writer thread.
+
+When the writer falls behind and the queue is full, the configured policy
+decides what happens to the next chunk:
+    block        the reader waits (LSL keeps buffering on the inlet side)
+    drop_oldest  the oldest queued chunk is discarded
+    spill        the chunk is pickled to a temporary file and read back in
+                 order once the writer catches up; the files are written and
+                 read outside the queue's lock, so readers never wait on them
+
+stats() reports queue depth, high-water mark, time readers spent blocked,
+dropped and spilled chunks, and the writer's throughput over the last
+rate_seconds window. The queue has a single consumer (the writer thread).
+"""
+
+import os
+import time
+import pickle
+import tempfile
+import threading
+from collections import deque
+
+POLICIES = ('block', 'drop_oldest', 'spill')
+DEFAULT_RATE_SECONDS = 5.0
+
+
+def chunk_nbytes(chunk):
+    return chunk.timestamps.nbytes + sum(column.nbytes for column in chunk.columns)
+
+
+class _SpillSlot:
+    """Place of one spilled chunk in the queue; file_name is None while the file is being written."""
+    __slots__ = ('file_name',)
+
+    def __init__(self):
+        self.file_name = None
+
+
+class ChunkQueue:
+    """FIFO of Chunks with a size limit, a full-queue policy and metrics."""
+
+    def __init__(self, maxsize=256, policy='block', spill_dir=None, rate_seconds=DEFAULT_RATE_SECONDS):
+        if policy not in POLICIES:
+            raise ValueError('Unknown queue policy %r, expected one of %s' % (policy, ', '.join(POLICIES)))
+        self.maxsize = maxsize
+        self.policy = policy
+        self.spill_dir = spill_dir
+        self._items = deque()
+        # A _SpillSlot per spilled chunk, in order
+        self._spilled = deque()
+        # Spilled chunks being read back by get(), which go before anything put meanwhile
+        self._unspilling = 0
+        self._cond = threading.Condition()
+        self._closed = False
+        self.high_water = 0
+        self.blocked_seconds = 0.0
+        self.dropped_chunks = 0
+        self.dropped_samples = 0
+        self.spilled_chunks = 0
+        self.bytes_written = 0
+        self.rate_seconds = rate_seconds
+        self.bytes_per_second = 0
+        self._rate_mark = (time.monotonic(), 0)
+
+    def __len__(self):
+        with self._cond:
+            return len(self._items) + len(self._spilled) + self._unspilling
+
+    def put(self, chunk):
+        with self._cond:
+            if self._spilled or self._unspilling or len(self._items) >= self.maxsize:
+                if self.policy == 'block':
+                    start = time.monotonic()
+                    while len(self._items) >= self.maxsize and not self._closed:
+                        self._cond.wait()
+                    self.blocked_seconds += time.monotonic() - start
+                elif self.policy == 'drop_oldest':
+                    oldest = self._items.popleft()
+                    self.dropped_chunks += 1
+                    self.dropped_samples += len(oldest)
+                else:
+                    # Once spilling, keep spilling until the backlog is read back so order is kept
+                    slot = _SpillSlot()
+                    self._spilled.append(slot)
+                    self.spilled_chunks += 1
+                    self.high_water = max(self.high_water, len(self._items) + len(self._spilled))
+                    self._spill_into(slot, chunk)
+                    return
+            self._items.append(chunk)
+            self.high_water = max(self.high_water, len(self._items) + len(self._spilled))
+            self._cond.notify_all()
+
+    def _spill_into(self, slot, chunk):
+        # Called with the lock held; writes the file without it
+        self._cond.release()
+        try:
+            file_name = self._spill(chunk)
+        except Exception:
+            self._cond.acquire()
+            self._spilled.remove(slot)
+            self.spilled_chunks -= 1
+            self.dropped_chunks += 1
+            self.dropped_samples += len(chunk)
+            self._cond.notify_all()
+            raise
+        self._cond.acquire()
+        slot.file_name = file_name
+        self._cond.notify_all()
+
+    def _spill_ready(self):
+        return bool(self._spilled) and self._spilled[0].file_name is not None
+
+    def get(self):
+        """Next chunk in order, or None once the queue is closed and empty."""
+        with self._cond:
+            while not self._items and not self._spill_ready():
+                if self._closed and not self._spilled:
+                    return None
+                self._cond.wait()
+            chunk = self._items.popleft() if self._items else None
+            # Refill from the spill files as room frees up
+            names = []
+            room = max(self.maxsize // 2 - len(self._items), 1 if chunk is None else 0)
+            while len(names) < room and self._spill_ready():
+                names.append(self._spilled.popleft().file_name)
+            self._unspilling += len(names)
+            self._cond.notify_all()
+        if not names:
+            return chunk
+        try:
+            chunks = [self._unspill(name) for name in names]
+        except Exception:
+            with self._cond:
+                self._unspilling -= len(names)
+                self._cond.notify_all()
+            raise
+        with self._cond:
+            if chunk is None:
+                chunk = chunks.pop(0)
+            self._items.extend(chunks)
+            self._unspilling -= len(names)
+            self._cond.notify_all()
+        return chunk
+
+    def close(self):
+        """Let get() return None after the remaining chunks and release readers blocked in put()."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+
+    def record_written(self, nbytes):
+        with self._cond:
+            self.bytes_written += nbytes
+            self._update_rate(time.monotonic())
+
+    def _update_rate(self, now):
+        then, written = self._rate_mark
+        if now - then >= self.rate_seconds:
+            self.bytes_per_second = round((self.bytes_written - written) / (now - then))
+            self._rate_mark = (now, self.bytes_written)
+
+    def _spill(self, chunk):
+        fd, file_name = tempfile.mkstemp(prefix='lsl-spill-', suffix='.pkl', dir=self.spill_dir)
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(chunk, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return file_name
+
+    def _unspill(self, file_name):
+        with open(file_name, 'rb') as f:
+            chunk = pickle.load(f)
+        os.remove(file_name)
+        return chunk
+
+    def stats(self):
+        """Snapshot of the queue metrics; bytes_per_second covers the last full rate_seconds window."""
+        with self._cond:
+            self._update_rate(time.monotonic())
+            return {
+                'depth': len(self._items) + len(self._spilled) + self._unspilling,
+                'high_water': self.high_water,
+                'blocked_seconds': round(self.blocked_seconds, 3),
+                'dropped_chunks': self.dropped_chunks,
+                'dropped_samples': self.dropped_samples,
+                'spilled_chunks': self.spilled_chunks,
+                'bytes_written': self.bytes_written,
+                'bytes_per_second': self.bytes_per_second,
+            }
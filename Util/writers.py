@@ -0,0 +1,164 @@
+"""
+Per-stream file writers for the recorder.
+
+Each writer opens its file once, writes the header once and keeps a large
+write buffer that is flushed on a size/time policy instead of reopening the
+file for every chunk. Every chunk is committed with a checksum (a journal
+record for CSV, the frame header for binary files) and, with fsync_seconds,
+the files are fsynced in batches so a crash loses at most that much data.
+"""
+
+import os
+import time
+import numpy as np
+from Util import util
+from Util.journal import CommitJournal, checksum
+from Util.binformat import BinaryStreamWriter
+from Util.segments import SegmentedWriter
+
+DEFAULT_BUFFER_BYTES = 1 << 20  # 1 MiB
+DEFAULT_FLUSH_SECONDS = 10
+DEFAULT_FSYNC_SECONDS = 0  # 0 leaves syncing to the operating system
+
+
+def csv_format(dtype):
+    dtype = np.dtype(dtype)
+    if dtype.kind in 'OSU':
+        return '%s'
+    if dtype.kind in 'iub':
+        return '%d'
+    # Enough digits to round-trip the stored precision
+    return '%.9g' if dtype.itemsize <= 4 else '%.17g'
+
+
+def csv_quote(value):
+    """value as a CSV field, quoted like the csv module's QUOTE_MINIMAL when it holds , " or a line break."""
+    text = str(value)
+    if ',' in text or '"' in text or '\n' in text or '\r' in text:
+        return '"' + text.replace('"', '""') + '"'
+    return text
+
+
+def _column_values(column):
+    # Text (e.g. marker) samples may hold separators, so they are quoted
+    if column.dtype.kind in 'OSU':
+        return [csv_quote(value) for value in column.tolist()]
+    return column.tolist()
+
+
+def corrected_timestamps(chunk):
+    # NaN for chunks that did not go through a TimestampCorrector
+    if chunk.corrected is not None:
+        return chunk.corrected
+    return np.full(len(chunk), np.nan)
+
+
+def format_csv_rows(chunk, corrected=False):
+    # Timestamp, [Corrected_Timestamp], channels..., Device_Time
+    columns = [chunk.timestamps.tolist()]
+    formats = ['%.6f']
+    device_time = chunk.timestamps
+    if corrected:
+        columns.append(corrected_timestamps(chunk).tolist())
+        formats.append('%.6f')
+        if chunk.corrected is not None:
+            device_time = chunk.corrected
+    columns += [_column_values(column) for column in chunk.columns]
+    formats += [csv_format(column.dtype) for column in chunk.columns]
+    rows = zip(*columns, util.lsl_to_device_time(device_time).tolist())
+    row_format = ','.join(formats + ['%s'])
+    return ''.join(row_format % row + '\n' for row in rows)
+
+
+class CsvStreamWriter:
+    """
+    Appends chunks of one stream to <prefix>_data.csv through a single open
+    file and records every chunk in <prefix>_data.csv.journal.
+    """
+
+    def __init__(self, file_name, labels, buffer_bytes=DEFAULT_BUFFER_BYTES, flush_seconds=DEFAULT_FLUSH_SECONDS,
+                 corrected=False, fsync_seconds=DEFAULT_FSYNC_SECONDS):
+        self.file_name = file_name
+        self.corrected = corrected
+        self.buffer_bytes = buffer_bytes
+        self.flush_seconds = flush_seconds
+        self.fsync_seconds = fsync_seconds
+        header = not os.path.isfile(file_name) or os.path.getsize(file_name) == 0
+        timestamps = ['Timestamp', 'Corrected_Timestamp'] if corrected else ['Timestamp']
+        header_line = (','.join(timestamps + list(labels) + ['Device_Time']) + '\n').encode('utf-8')
+        if not header:
+            # Appending rows of another layout would corrupt the file
+            with open(file_name, 'rb') as f:
+                if f.readline() != header_line:
+                    raise ValueError('%s was recorded with a different channel layout' % file_name)
+        # Binary mode so the journal offsets are byte offsets
+        self.file = open(file_name, 'ab', buffering=buffer_bytes)
+        self.journal = CommitJournal(file_name)
+        self.bytes_written = 0 if header else os.path.getsize(file_name)
+        if header:
+            self.file.write(header_line)
+            self.bytes_written += len(header_line)
+        self.pending = 0
+        self.last_flush = self.last_sync = time.monotonic()
+
+    def write(self, chunk):
+        if len(chunk) == 0:
+            return
+        data = format_csv_rows(chunk, self.corrected).encode('utf-8')
+        self.file.write(data)
+        start = self.bytes_written
+        self.bytes_written += len(data)
+        self.journal.commit(start, self.bytes_written, len(chunk), chunk.timestamps[0], chunk.timestamps[-1],
+                            checksum(data))
+        self.pending += len(data)
+        now = time.monotonic()
+        if (self.pending >= self.buffer_bytes or now - self.last_flush >= self.flush_seconds
+                or (self.fsync_seconds and now - self.last_sync >= self.fsync_seconds)):
+            self.flush(now)
+
+    def flush(self, now=None):
+        now = time.monotonic() if now is None else now
+        # Data before the journal records that describe it
+        self.file.flush()
+        if self.fsync_seconds and now - self.last_sync >= self.fsync_seconds:
+            os.fsync(self.file.fileno())
+            self.journal.sync()
+            self.last_sync = now
+        else:
+            self.journal.flush()
+        self.pending = 0
+        self.last_flush = now
+
+    def close(self):
+        if not self.file.closed:
+            self.file.flush()
+            if self.fsync_seconds:
+                os.fsync(self.file.fileno())
+            self.file.close()
+            self.journal.close()
+
+
+WRITERS = {
+    'csv': ('.csv', CsvStreamWriter),
+    'binary': ('.bin', BinaryStreamWriter),
+}
+
+
+def open_writer(path, file_name_prefix, labels, file_format='csv', buffer_bytes=DEFAULT_BUFFER_BYTES,
+                flush_seconds=DEFAULT_FLUSH_SECONDS, segment_max_bytes=0, segment_max_seconds=0, compressor=None,
+                corrected=False, fsync_seconds=DEFAULT_FSYNC_SECONDS):
+    """
+    Writer for one stream directory. With a segment size or duration limit the
+    stream is split into <prefix>_data.NNN files listed in <prefix>_manifest.json,
+    otherwise it goes to a single <prefix>_data file. corrected adds a
+    Corrected_Timestamp column next to the raw LSL timestamps; fsync_seconds
+    is the longest time written chunks may wait before they are fsynced.
+    """
+    extension, writer_class = WRITERS[file_format]
+    os.makedirs(path, exist_ok=True)
+    if segment_max_bytes or segment_max_seconds:
+        return SegmentedWriter(path, file_name_prefix, labels, file_format, extension, writer_class,
+                               segment_max_bytes, segment_max_seconds, compressor, buffer_bytes, flush_seconds, corrected,
+                               fsync_seconds)
+    file_name = os.path.join(path, file_name_prefix + '_data' + extension)
+    return writer_class(file_name, labels, buffer_bytes, flush_seconds, corrected, fsync_seconds)
@@ -0,0 +1,195 @@
+"""
+Per-event cost of publishing Myo samples on LSL, before and after MyoState
+keeps the sample as a float32 array.
+
+Replays synthetic Myo events the way the SDK delivers them (EMG at 200 Hz,
+orientation, acceleration and gyroscope at 50 Hz) through both versions of the
+Listener's state handling and reports microseconds per EMG event:
+    before   update the dict based state, format it as CSV text, split it and
+             parse it back with format_list(), push_sample() the list
+    after    update MyoState.values in place, push_values() the array
+    batched  as after, but stamped from the device timestamps by DeviceClock
+             and pushed --batch-samples at a time with SampleBatch
+Without --outlet the samples are only prepared, not pushed:
+    python benchmarks/myo_state_benchmark.py --events 200000 --outlet --batch-samples 10
+"""
+
+import os
+import sys
+import time
+import argparse
+from datetime import datetime
+import numpy as np
+import pylsl
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'Myo'))
+from lsl_layout import MYO_MAKE_MODEL, lsl_units, myo_stream_info  # NOQA
+from myo_state import MyoState, TIMESTAMP, push_values  # NOQA
+from lsl_batching import DeviceClock, SampleBatch  # NOQA
+
+IMU_EVERY = 4  # EMG events per IMU event
+
+
+class Vector:
+    """Stand-in for the SDK's Vector and Quaternion."""
+
+    def __init__(self, x, y, z, w=0.0):
+        self.x, self.y, self.z, self.w = x, y, z, w
+        self.roll, self.pitch, self.yaw = x * 2, y * 2, z * 2
+
+
+class OldMotionData:
+    # MyoMotionData as it was in myo_data_collection.py
+
+    def __init__(self):
+        self.orientation = {'w': 0, 'x': 0, 'y': 0, 'z': 0}
+        self.acceleration = {'x': 0, 'y': 0, 'z': 0}
+        self.gyroscope = {'x': 0, 'y': 0, 'z': 0}
+        self.pose = 'rest'
+        self.locked = False
+        self.rssi = 0
+        self.emg = [0, 0, 0, 0, 0, 0, 0, 0]
+        self.roll = 0
+        self.pitch = 0
+        self.yaw = 0
+        self.time = None
+
+    def toCSV(self):
+        csv_ori = ','.join(str(v) for v in self.orientation.values()) + ','
+        csv_acc = ','.join(str(v) for v in self.acceleration.values()) + ','
+        csv_gyro = ','.join(str(v) for v in self.gyroscope.values()) + ','
+        csv_emg = ','.join(str(v) for v in self.emg) + ','
+        csv_time = str(self.time) + ','
+        csv_pose = str(self.pose) + ','
+        csv_lock = str(self.locked) + ','
+        csv_rssi = str(self.rssi) + ','
+        csv_roll = str(self.roll) + ','
+        csv_pitch = str(self.pitch) + ','
+        csv_yaw = str(self.yaw) + '\n'
+        return csv_time + csv_ori + csv_acc + csv_gyro + csv_pose + csv_emg + csv_lock + csv_rssi + csv_roll + \
+            csv_pitch + csv_yaw
+
+
+class OldState:
+
+    def __init__(self, device_id):
+        self.device_id = device_id
+        self.device_make_model = MYO_MAKE_MODEL
+        self.motiondata = OldMotionData()
+        self.warm = 'unknown'
+        self.arm = 'unknown'
+        self.sync = None
+
+    def toList(self):
+        temp = [str(self.device_id), str(self.warm), str(self.sync), str(self.arm)]
+        temp.extend(self.motiondata.toCSV().split(','))
+        return temp
+
+
+def format_list(unformattedList):
+    formmattedList = []
+    for item, unit in zip(unformattedList, lsl_units):
+        if unit is None:
+            formmattedList.append(item == 'True')
+        elif unit == 'Arm':
+            formmattedList.append({'right': 0, 'left': 1}.get(item, -1))
+        elif unit == 'Time':
+            formmattedList.append(pylsl.local_clock())
+        elif unit == 'Pose':
+            formmattedList.append(-1)
+        else:
+            formmattedList.append(float(item))
+    return formmattedList
+
+
+def make_events(count, seed=0):
+    rng = np.random.default_rng(seed)
+    emg = rng.integers(-128, 128, size=(count, 8)).tolist()
+    imu = [(Vector(*rng.random(3), w=rng.random()), Vector(*rng.random(3)), Vector(*rng.random(3)))
+           for _ in range(count // IMU_EVERY + 1)]
+    return emg, imu
+
+
+def run_before(emg, imu, push):
+    state = OldState(0)
+    data = state.motiondata
+    start = time.perf_counter()
+    for k, sample in enumerate(emg):
+        if k % IMU_EVERY == 0:
+            orientation, acceleration, gyroscope = imu[k // IMU_EVERY]
+            data.orientation = {'w': orientation.w, 'x': orientation.x, 'y': orientation.y, 'z': orientation.z}
+            data.roll, data.pitch, data.yaw = orientation.roll, orientation.pitch, orientation.yaw
+            data.time = datetime.now().strftime('%Y-%m-%d %H:%M:%S %f')
+            data.acceleration = {'x': acceleration.x, 'y': acceleration.y, 'z': acceleration.z}
+            data.time = datetime.now().strftime('%Y-%m-%d %H:%M:%S %f')
+            data.gyroscope = {'x': gyroscope.x, 'y': gyroscope.y, 'z': gyroscope.z}
+        data.emg = sample
+        data.time = datetime.now().strftime('%Y-%m-%d %H:%M:%S %f')
+        values = format_list(state.toList())
+        if push is not None:
+            push.push_sample(values, pylsl.local_clock())
+    return time.perf_counter() - start
+
+
+def run_after(emg, imu, push):
+    state = MyoState(0)
+    start = time.perf_counter()
+    for k, sample in enumerate(emg):
+        if k % IMU_EVERY == 0:
+            orientation, acceleration, gyroscope = imu[k // IMU_EVERY]
+            state.set_orientation(orientation)
+            state.set_acceleration(acceleration)
+            state.set_gyroscope(gyroscope)
+        state.set_emg(sample)
+        lsl_stamp = pylsl.local_clock()
+        state.values[TIMESTAMP] = lsl_stamp
+        if push is not None:
+            push_values(push, state.values, lsl_stamp)
+    return time.perf_counter() - start
+
+
+def run_batched(emg, imu, outlet, batch_samples):
+    state = MyoState(0)
+    clock = DeviceClock()
+    batch = SampleBatch(outlet, len(state.values), batch_samples) if outlet is not None else None
+    start = time.perf_counter()
+    for k, sample in enumerate(emg):
+        if k % IMU_EVERY == 0:
+            orientation, acceleration, gyroscope = imu[k // IMU_EVERY]
+            state.set_orientation(orientation)
+            state.set_acceleration(acceleration)
+            state.set_gyroscope(gyroscope)
+        state.set_emg(sample)
+        now = pylsl.local_clock()
+        # Device timestamps 5 ms apart, as the armband stamps its 200 Hz EMG
+        sample_stamp = clock.to_lsl(k * 5000, now)
+        state.values[TIMESTAMP] = sample_stamp
+        if batch is not None:
+            batch.add(state.values, sample_stamp, now)
+    if batch is not None:
+        batch.flush()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--events', type=int, default=100000, help='EMG events to replay')
+    parser.add_argument('--repeat', type=int, default=3, help='Runs of each version, the fastest is reported')
+    parser.add_argument('--outlet', action='store_true', help='Push every sample to a local LSL outlet')
+    parser.add_argument('--batch-samples', type=int, default=10, help='Samples per push_chunk() when batched')
+    args = parser.parse_args()
+
+    emg, imu = make_events(args.events)
+    outlet = pylsl.StreamOutlet(myo_stream_info('Benchmark Myo', 'benchmark-myo')) if args.outlet else None
+    before = min(run_before(emg, imu, outlet) for _ in range(args.repeat))
+    after = min(run_after(emg, imu, outlet) for _ in range(args.repeat))
+    batched = min(run_batched(emg, imu, outlet, args.batch_samples) for _ in range(args.repeat))
+    print('%d EMG events, %s' % (args.events, 'pushed to an outlet' if outlet is not None else 'not pushed'))
+    print('before  %7.2f us/event' % (before / args.events * 1e6))
+    print('after   %7.2f us/event' % (after / args.events * 1e6))
+    print('batched %7.2f us/event (%d samples per chunk)' % (batched / args.events * 1e6, args.batch_samples))
+    print('speedup %7.1fx, %.1fx batched' % (before / after, before / batched))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+"""
+Throughput of the live recording path against a farm of synthetic LSL outlets.
+
+A separate process starts N local pylsl outlets with the Myo channel layout
+(lsl_header / lsl_units) and pushes random samples at the given rate. This
+process records them the way main.py does (StreamWatcher attaching each
+outlet as it is resolved, AcquisitionEngine, Recorder) and reports, for every
+outlet count:
+    samples/s     samples written per second, against the rate that was pushed
+    CPU %         CPU time of the recording process over wall time (100 = one core)
+    peak RSS      largest resident set size seen while recording
+    latency       age of a chunk's oldest sample when its write returned (p50/p95/max)
+    dropped       samples pushed but never written (queue drops and lost samples)
+A run "keeps up" when nothing is dropped and the write latency stays within
+the flush period plus a second. Pass several outlet counts to find where it
+stops keeping up:
+    python benchmarks/outlet_farm_benchmark.py --outlets 1 4 16 32 --seconds 20
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import threading
+import multiprocessing
+import numpy as np
+import pylsl
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from Util import discovery  # NOQA
+from Util.recorder import Recorder  # NOQA
+from Util.acquisition import AcquisitionEngine  # NOQA
+from Myo.lsl_layout import lsl_header, lsl_units, myo_stream_info  # NOQA
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+STREAM_PREFIX = 'Farm Myo'
+
+
+def farm_layout(channels):
+    # The Myo layout, cut down or padded with extra channels
+    header = (lsl_header + ['Extra_%d' % k for k in range(max(0, channels - len(lsl_header)))])[:channels]
+    units = (lsl_units + ['Number'] * max(0, channels - len(lsl_units)))[:channels]
+    return header, units
+
+
+def run_farm(outlets, rate, channels, chunk, seconds, ready, release, pushed):
+    """Producer process: push chunks to every outlet at rate, report the counts, wait to be released."""
+    header, units = farm_layout(channels)
+    farm = [pylsl.StreamOutlet(myo_stream_info('%s %d' % (STREAM_PREFIX, k), 'farm-%d' % k, rate,
+                                               header=header, units=units))
+            for k in range(outlets)]
+    block = np.random.default_rng(0).normal(size=(chunk, channels)).astype(np.float32)
+    ready.wait()
+    counts = [0] * outlets
+    start = time.perf_counter()
+    tick = 0
+    while True:
+        due = start + tick * chunk / rate
+        if due - start >= seconds:
+            break
+        delay = due - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        for k, outlet in enumerate(farm):
+            outlet.push_chunk(block)
+            counts[k] += chunk
+        tick += 1
+    pushed.put((counts, time.perf_counter() - start))
+    # Keep the outlets up until the recorder has read everything
+    release.wait()
+
+
+class ResourceMonitor(threading.Thread):
+    """Samples the recording process's RSS while it runs."""
+
+    def __init__(self, interval=0.2):
+        super(ResourceMonitor, self).__init__(daemon=True)
+        self.interval = interval
+        self.peak_rss = 0
+        self.stopping = threading.Event()
+
+    def rss(self):
+        if psutil is not None:
+            return psutil.Process().memory_info().rss
+        if resource is not None:
+            # Peak for the whole process; kilobytes on Linux, bytes on macOS
+            peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            return peak if sys.platform == 'darwin' else peak * 1024
+        return 0
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            self.peak_rss = max(self.peak_rss, self.rss())
+
+    def stop(self):
+        self.stopping.set()
+        self.join()
+        self.peak_rss = max(self.peak_rss, self.rss())
+
+
+def timed_writes(recorder, latencies, written):
+    # Wrap the writer stage's call to record when each chunk hit the writer
+    write = recorder.write
+
+    def write_and_time(chunk):
+        write(chunk)
+        latencies.append(pylsl.local_clock() - chunk.timestamps[0])
+        written[0] += len(chunk)
+    recorder.write = write_and_time
+
+
+def run(outlets, args):
+    ctx = multiprocessing.get_context('spawn')
+    ready, release, pushed = ctx.Event(), ctx.Event(), ctx.Queue()
+    farm = ctx.Process(target=run_farm, args=(outlets, args.rate, args.channels, args.chunk, args.seconds,
+                                              ready, release, pushed))
+    farm.start()
+    path = tempfile.mkdtemp()
+    try:
+        recorder = Recorder(path, 'realtime', flush_seconds=args.flush_seconds,
+                            writer_options={'file_format': args.format})
+        latencies, written = [], [0]
+        timed_writes(recorder, latencies, written)
+        engine = AcquisitionEngine(recorder, queue_size=args.queue_size, queue_policy=args.queue_policy)
+        # Attached the way the Supervisor hands main.py's watcher the streams it resolves
+        watcher = discovery.StreamWatcher(engine)
+        deadline = time.monotonic() + 30
+        while len(engine.reader_list()) < outlets and time.monotonic() < deadline:
+            for info in watcher.resolver.results():
+                if info.name().startswith(STREAM_PREFIX):
+                    watcher.attach(info)
+            time.sleep(0.1)
+        streams = engine.reader_list()
+        for reader in streams:
+            # Connect the data channel now, samples pushed before that would count as dropped
+            reader.inlet.open_stream(10)
+        monitor = ResourceMonitor()
+        monitor.start()
+        engine.start()
+        cpu_start, wall_start = time.process_time(), time.perf_counter()
+        ready.set()
+        counts, push_seconds = pushed.get()
+        total = sum(counts)
+        # Give the readers time to pull what is still in flight
+        deadline = time.perf_counter() + args.pull_timeout + 2.0
+        while sum(engine.sample_counts().values()) < total and time.perf_counter() < deadline:
+            time.sleep(0.05)
+        wall = time.perf_counter() - wall_start
+        queue = engine.queue_stats()
+        engine.stop()
+        cpu = time.process_time() - cpu_start
+        monitor.stop()
+    finally:
+        release.set()
+        farm.join()
+        shutil.rmtree(path)
+    latencies = np.array(latencies) if latencies else np.zeros(1)
+    dropped = total - written[0]
+    p95 = np.percentile(latencies, 95)
+    return {
+        'outlets': len(streams),
+        'pushed_rate': total / push_seconds,
+        'written_rate': written[0] / wall,
+        'cpu': 100.0 * cpu / wall,
+        'peak_rss_mb': monitor.peak_rss / 2.0 ** 20,
+        'latency': (np.median(latencies), p95, latencies.max()),
+        'dropped': dropped,
+        'queue_dropped': queue['dropped_samples'],
+        'keeps_up': dropped <= 0 and p95 <= args.flush_seconds + 1.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--outlets', type=int, nargs='+', default=[1, 4, 16], help='Outlet counts to run')
+    parser.add_argument('--seconds', type=float, default=20, help='How long each run pushes samples')
+    parser.add_argument('--rate', type=float, default=200, help='Nominal sample rate of every outlet')
+    parser.add_argument('--channels', type=int, default=len(lsl_header), help='Channels per outlet')
+    parser.add_argument('--chunk', type=int, default=10, help='Samples per push_chunk()')
+    parser.add_argument('--format', choices=['csv', 'binary'], default='csv', help='Recording file format')
+    parser.add_argument('--flush-seconds', type=float, default=1.0, help='Recorder flush period')
+    parser.add_argument('--queue-size', type=int, default=256, help='Writer queue size in chunks')
+    parser.add_argument('--queue-policy', choices=['block', 'drop_oldest', 'spill'], default='block')
+    parser.add_argument('--pull-timeout', type=float, default=0.2)
+    args = parser.parse_args()
+
+    print('%g Hz x %d channels, %d-sample chunks, %s files, %g s per run'
+          % (args.rate, args.channels, args.chunk, args.format, args.seconds))
+    print('%7s %12s %12s %7s %9s %24s %9s  %s' % ('outlets', 'pushed/s', 'written/s', 'CPU %', 'RSS MB',
+                                                  'latency ms p50/p95/max', 'dropped', 'keeps up'))
+    for outlets in args.outlets:
+        result = run(outlets, args)
+        latency = '/'.join('%.0f' % (value * 1000) for value in result['latency'])
+        print('%7d %12.0f %12.0f %7.1f %9.1f %24s %9d  %s'
+              % (result['outlets'], result['pushed_rate'], result['written_rate'], result['cpu'],
+                 result['peak_rss_mb'], latency, result['dropped'], 'yes' if result['keeps_up'] else 'NO'))
+        if result['outlets'] != outlets:
+            print('        only %d of %d outlets were found' % (result['outlets'], outlets))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,104 @@
+"""
+CPU cost of the recording path, per 1000 samples.
+
+Feeds synthetic chunks shaped like the 29-channel Myo stream (200 Hz, pulled
+roughly 20 times a second) through the old per-chunk DataFrame path and the
+columnar Recorder, and reports process CPU time for each.
+
+Run from the repository root:
+    python benchmarks/recorder_benchmark.py --seconds 60
+"""
+
+import os
+import sys
+import time
+import shutil
+import argparse
+import tempfile
+import numpy as np
+import pandas as pd
+from pandas import Timestamp
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from Util.recorder import Recorder  # NOQA
+from Util.discovery import StreamMeta  # NOQA
+
+parser = argparse.ArgumentParser()
+parser.add_argument('--seconds', type=float, default=60, help='Length of the simulated recording')
+parser.add_argument('--rate', type=float, default=200, help='Nominal sample rate of the stream')
+parser.add_argument('--channels', type=int, default=29, help='Channels per sample')
+parser.add_argument('--chunk', type=int, default=10, help='Samples per pull_chunk() result')
+args = parser.parse_args()
+
+STREAM_NAME = 'Thalmic Labs Myo 1Myo'
+
+
+def make_chunks():
+    labels = ['Channel_%d' % (i + 1) for i in range(args.channels)]
+    total = int(args.seconds * args.rate)
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=(total, args.channels)).astype(np.float32)
+    stamps = time.time() + np.arange(total) / args.rate
+    chunks = []
+    for start in range(0, total, args.chunk):
+        # pull_chunk() hands back plain lists of lists
+        chunks.append((values[start:start + args.chunk].tolist(), stamps[start:start + args.chunk].tolist()))
+    return labels, chunks, total
+
+
+def legacy_format_data_into_dataframe(samples, timestamps, header):
+    # util.format_data_into_dataframe as it was before the Recorder. Newer
+    # pandas refuses a list in df.at[], so the row is enlarged with .loc.
+    df = pd.DataFrame(columns=header)
+    for sample, timestamp in zip(samples, timestamps):
+        converted_time = datetime.fromtimestamp(timestamp)
+        current_time = Timestamp(0).now()
+        sample.append(converted_time)
+        df.loc[current_time] = sample
+    return df
+
+
+def run_dataframe(path, labels, chunks):
+    # The pre-Recorder loop body from main.py
+    header = labels + ['Device_Time']
+    current_df = pd.DataFrame(columns=header)
+    file_name = os.path.join(path, 'realtime_data.csv')
+    for samples, timestamps in chunks:
+        df_temp = legacy_format_data_into_dataframe(samples, timestamps, current_df.columns.values.tolist())
+        if hasattr(current_df, 'append'):
+            current_df = current_df.append(df_temp)
+        else:
+            current_df = pd.concat([current_df, df_temp])
+        hdr = False if os.path.isfile(file_name) else True
+        current_df.to_csv(file_name, mode='a', index_label='Timestamp', header=hdr)
+        current_df = pd.DataFrame(columns=header)
+
+
+def run_recorder(path, labels, chunks):
+    recorder = Recorder(path, 'realtime')
+    recorder.add_stream(StreamMeta(STREAM_NAME, labels, args.rate))
+    for samples, timestamps in chunks:
+        recorder.push(STREAM_NAME, samples, timestamps)
+    recorder.close()
+
+
+def measure(name, function):
+    # Fresh chunks every run, the old path appends Device_Time to the sample lists
+    labels, chunks, total = make_chunks()
+    path = tempfile.mkdtemp()
+    try:
+        start = time.process_time()
+        function(path, labels, chunks)
+        cpu = time.process_time() - start
+    finally:
+        shutil.rmtree(path)
+    print('%-10s %10.2f ms CPU per 1000 samples' % (name, cpu * 1000 / total * 1000))
+    return cpu
+
+
+if __name__ == '__main__':
+    print('%d samples x %d channels in chunks of %d' % (int(args.seconds * args.rate), args.channels, args.chunk))
+    before = measure('DataFrame', run_dataframe)
+    after = measure('Recorder', run_recorder)
+    print('speed-up: %.1fx' % (before / after))
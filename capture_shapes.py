@@ -17,6 +17,18 @@ except Exception as e:
     myo_available = False
     print("[WARN] myo-python not available; EMG will be disabled:", e)
 
+# --- Saved trials go into the data catalog (Util.catalog) when config.ini sets one up. ---
+catalog = None
+try:
+    from configparser import ConfigParser
+    from Util.catalog import open_catalog
+    _config = ConfigParser()
+    _config.read("config.ini")
+    if _config.has_section("File Info"):
+        catalog = open_catalog(_config)
+except Exception as e:
+    print("[WARN] Data catalog not available; trials will not be catalogued:", e)
+
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 
@@ -352,6 +364,7 @@ class CaptureApp:
                 w = csv.writer(f)
                 w.writerow(headers)
                 w.writerows(rows)
+            self._catalog_trial(path)
 
             messagebox.showinfo(
                 "Saved",
@@ -365,6 +378,14 @@ class CaptureApp:
             messagebox.showerror("Save failed", str(e))
             print("[ERROR] Save failed:", e)
 
+    def _catalog_trial(self, path):
+        if catalog is None:
+            return
+        try:
+            catalog.update([catalog.shapes_entry(path)])
+        except Exception as e:
+            print("[WARN] Could not add the trial to the catalog:", e)
+
     def _do_cancel(self):
         if not self.capturing:
             return
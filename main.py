@@ -12,14 +12,19 @@ It illustrates the following use cases:
 #Chirayu Trial
 
 
-import pylsl
-import asyncio
 import logging
-from Util import util
+from Util import discovery
+from Util.recorder import Recorder
+from Util.acquisition import AcquisitionEngine
+from Util.telemetry import TelemetryPublisher, METRICS_STREAM_NAME
+from Util.supervisor import Supervisor
+from Util.profiles import load_profiles
+from Util.catalog import open_catalog
+from Util.preview import LivePreview, PreviewServer
 import time
 import subprocess
-import pandas as pd
 import os
+import argparse
 from configparser import ConfigParser
 
 configObject = ConfigParser()
@@ -28,102 +33,132 @@ fileInfo = configObject['File Info']
 zephyrInfo = configObject['ZephyrInfo']
 deviceInfo = configObject['Devices']
 reedInfo = configObject['ReedInfo']
+recordingInfo = configObject['Recording']
+streamNameInfo = configObject['StreamNames']
+supervisorInfo = configObject['Supervisor']
+previewInfo = configObject['Preview']
 
 
 data_save_rate = 5 # Rate to save data in seconds
 
 logger = logging.getLogger(__name__)
 
-def start_BioHarness():
+def start_BioHarness(supervisor):
     # Start Zephyr BioHarness
     macAddress = zephyrInfo['macAddress']
     if ':' in macAddress:
-        subprocess.Popen(["python", "Zephyr/zephy.py", "--address", macAddress])
+        supervisor.add('BioHarness', ["python", "Zephyr/zephy.py", "--address", macAddress], streamNameInfo['BioHarness'])
     else:
-        subprocess.Popen(["python", "Zephyr/zephy.py"])
+        supervisor.add('BioHarness', ["python", "Zephyr/zephy.py"], streamNameInfo['BioHarness'])
 
-def start_DecibalMeter():
-    # Start Decibel Meter
+def start_DecibalMeter(supervisor):
+    # Start Decibel Meter; the R8080 application itself is not supervised
     subprocess.Popen([reedInfo['applicationPath']])
-    subprocess.Popen(["python", "ReedDecibalReader/decibel.py"])
+    supervisor.add('Decibel', ["python", "ReedDecibalReader/decibel.py"], streamNameInfo['Decibel'])
 
-def start_Myo():
+def start_Myo(supervisor):
     # Start Myo Collection
-    subprocess.Popen(["python", "Myo/myo_data_collection.py"])
+    supervisor.add('Myo', ["python", "Myo/myo_data_collection.py"], streamNameInfo['Myo'])
 
 
-def start_devices():
+def start_devices(engine, watcher):
+    # Each collector is restarted if it exits or its stream goes quiet
+    supervisor = Supervisor(engine, watcher, poll_interval=supervisorInfo.getfloat('poll_interval'),
+                            startup_timeout=supervisorInfo.getfloat('startup_timeout'),
+                            stall_after=supervisorInfo.getfloat('stall_after'),
+                            backoff=supervisorInfo.getfloat('restart_backoff'),
+                            max_backoff=supervisorInfo.getfloat('max_restart_backoff'))
     if deviceInfo['BioHarness'] == 'True':
-        start_BioHarness()
+        start_BioHarness(supervisor)
     if deviceInfo['Decibel'] == 'True':
-        start_DecibalMeter()
+        start_DecibalMeter(supervisor)
     if deviceInfo['Myo'] == 'True':
-        start_Myo()
+        start_Myo(supervisor)
+    supervisor.start()
+    return supervisor
+
+
+def start_preview():
+    # Live min/max view of the recorded streams, served from its own threads
+    if not previewInfo.getboolean('enabled'):
+        return None, None
+    preview = LivePreview(window_seconds=previewInfo.getfloat('window_seconds'), points=previewInfo.getint('points'))
+    server = PreviewServer(preview, port=previewInfo.getint('port'))
+    server.start()
+    logger.info('Live preview on %s', server.url)
+    return preview, server
 
 
 def get_file_info_from_config():
     return fileInfo['directory'], fileInfo['participant_name'], fileInfo['participant_session'], fileInfo['file_name_prefix']
 
-def main():
-    start_devices() # Start labstream scripts
-    directory, participant_name, participant_session, file_name_prefix = get_file_info_from_config()
-    time.sleep(10) # Wait for devices to be initialized
-    # Initialize Variables
-    stream_names = []
-    print("looking for streams")
-    streams = pylsl.resolve_streams()
-    for stream in streams:
-        stream_names.append(stream.name())
-        print(stream.name())
-        print(util.obtain_stream_channel_names(stream))
-
-    # Initialize Inlets and Dataframes
-    inlets = []
-    df_dict = {}
-    path = os.path.join(directory, participant_name, participant_session)
-    for stream in streams:
-        inlets.append(pylsl.StreamInlet(stream))
-        header = util.obtain_stream_channel_names(stream)
-        header.append('Device_Time')
-        df_dict[stream.name()] = pd.DataFrame(columns=header)
-        # Create directory for files
-        try:
-            os.makedirs(os.path.join(path, stream.name()))
-        except:
-            logger.info('Directory ', os.path.join(path, stream.name()),  'already exists')
-    while True:
-        # get a new sample (you can also omit the timestamp part if you're not
-        # interested in it)
-        for inlet in inlets:
-            samples, timestamps = inlet.pull_chunk()
-            if timestamps:
-                inlet_name = inlet.info().name()
-                #print(inlet_name)
-                current_df = df_dict[inlet_name]
-                df_temp = util.format_data_into_dataframe(samples, timestamps, current_df.columns.values.tolist())
-                current_df = current_df.append(df_temp)
-                df_dict[inlet_name] = current_df
-                file_name = os.path.join(path, inlet_name, file_name_prefix + '_data.csv')
-                hdr = False if os.path.isfile(file_name) else True
-                current_df.to_csv(file_name, mode='a', index_label='Timestamp', header=hdr)
-                col_names = [i for i in current_df.columns]
-                df_dict[inlet_name] = pd.DataFrame(columns=col_names)
-                # if inlet_name == 'ZephyrGeneral':
-                #     print(current_df[['heart_rate', 'battery_percent']])
-                #     print('----------------------')
-                if inlet_name == 'Thalmic Labs Myo 1Myo':
-                    print(current_df.tail())
-
+def get_writer_options_from_config(file_format='csv'):
+    return {'file_format': file_format,
+            'buffer_bytes': recordingInfo.getint('write_buffer_bytes'),
+            'flush_seconds': recordingInfo.getfloat('flush_interval'),
+            'segment_max_bytes': recordingInfo.getint('segment_max_bytes'),
+            'segment_max_seconds': recordingInfo.getfloat('segment_max_seconds'),
+            'fsync_seconds': recordingInfo.getfloat('fsync_interval'),
+            'corrected': timestamps_corrected()}
 
+def timestamps_corrected():
+    return recordingInfo.getboolean('clock_correction') or recordingInfo.getfloat('dejitter_window') > 0
 
+def main(file_format='csv'):
+    directory, participant_name, participant_session, file_name_prefix = get_file_info_from_config()
 
-if __name__ == '__main__':
-    asyncio.ensure_future(main())
-    loop = asyncio.get_event_loop()
+    # One reader thread per inlet, all feeding a single writer thread
+    path = os.path.join(directory, participant_name, participant_session)
+    catalog = open_catalog(configObject)
+    preview, preview_server = start_preview()
+    recorder = Recorder(path, file_name_prefix, flush_seconds=data_save_rate,
+                        writer_options=get_writer_options_from_config(file_format),
+                        compression=recordingInfo['compression'],
+                        profiles=load_profiles(configObject), catalog=catalog, preview=preview)
+    engine = AcquisitionEngine(recorder, queue_size=recordingInfo.getint('queue_size'),
+                               queue_policy=recordingInfo['queue_full_policy'],
+                               clock_correction=recordingInfo.getboolean('clock_correction'),
+                               dejitter_seconds=recordingInfo.getfloat('dejitter_window'))
+    engine.start()
+    # Rate, jitter, gaps and latency per stream, written to <file_name_prefix>_telemetry.jsonl
+    telemetry = TelemetryPublisher(engine, os.path.join(path, file_name_prefix + '_telemetry.jsonl'),
+                                   interval=recordingInfo.getfloat('telemetry_interval'),
+                                   lsl_outlet=recordingInfo.getboolean('telemetry_lsl_stream'))
+    telemetry.start()
+    # Attach any other streams that are on the network or show up later in the session
+    watcher = discovery.StreamWatcher(engine, poll_interval=recordingInfo.getfloat('hotplug_interval'),
+                                      retire_after=recordingInfo.getfloat('retire_after'),
+                                      ignore_names=[METRICS_STREAM_NAME])
+    watcher.start()
+    # Start labstream scripts; each device is recorded as soon as its stream is up
+    supervisor = start_devices(engine, watcher)
     try:
-        loop.run_forever()
+        while True:
+            time.sleep(data_save_rate)
+            devices = ', '.join('%s %s' % item for item in sorted(supervisor.status().items()))
+            samples = ', '.join('%s %d' % item for item in sorted(engine.sample_counts().items()))
+            queue = engine.queue_stats()
+            logger.info('Devices: %s | Samples: %s | Queue: %d chunks (high water %d), %d dropped, %d spilled, '
+                        '%.0f kB/s written', devices or 'none', samples or 'none', queue['depth'],
+                        queue['high_water'], queue['dropped_chunks'], queue['spilled_chunks'],
+                        queue['bytes_per_second'] / 1000.0)
     except KeyboardInterrupt:
         logger.info("Ctrl-C pressed.")
     finally:
-        loop.close()
+        supervisor.stop()
+        watcher.stop()
+        telemetry.stop()
+        engine.stop()
+        if preview_server is not None:
+            preview_server.stop()
+        if catalog is not None:
+            catalog.close()
 
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('-f', '--format', choices=['csv', 'binary'], default='csv',
+                        help='File format for the recorded streams')
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+    main(args.format)
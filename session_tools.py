@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+"""
+Offline tools for recorded sessions.
+
+    python session_tools.py merge [session_dir] -o merged.csv [--rate 100] [--method ffill|linear]
+    python session_tools.py recover [session_dir] [--dry-run]
+    python session_tools.py export [data_dir] -o dataset/ [--row-group-rows 32768]
+    python session_tools.py catalog [--scan] [--participant P] [--stream S] [--label L] [--start T] [--end T]
+
+Without a session directory the one configured in config.ini ([File Info]) is
+used; export converts the whole data directory ([File Info] directory).
+"""
+
+import os
+import sys
+import logging
+import argparse
+from configparser import ConfigParser
+from Util import merge, recovery, export
+from Util.catalog import open_catalog
+
+configObject = ConfigParser()
+configObject.read("config.ini")
+
+
+def file_info():
+    return configObject['File Info'] if configObject.has_section('File Info') else {}
+
+
+def default_session():
+    fileInfo = file_info()
+    directory = fileInfo.get('directory', './data/')
+    session_dir = os.path.join(directory, fileInfo.get('participant_name', ''), fileInfo.get('participant_session', ''))
+    return session_dir, fileInfo.get('file_name_prefix', 'realtime')
+
+
+def merge_command(args):
+    rows = merge.merge_session(args.session_dir, args.prefix, args.output, streams=args.streams, rate=args.rate,
+                               method=args.method, tolerance=args.tolerance, timestamps=args.timestamps,
+                               chunk_rows=args.chunk_rows)
+    print('Wrote %d rows to %s' % (rows, args.output))
+
+
+def format_time(t):
+    return '?' if t is None else '%.3f' % t
+
+
+def recover_command(args):
+    results = recovery.recover_session(args.session_dir, args.prefix, dry_run=args.dry_run)
+    ends = [report['t_end'] for reports in results.values() for report in reports if report['t_end'] is not None]
+    session_end = max(ends) if ends else None
+    damaged = False
+    for stream, reports in sorted(results.items()):
+        for report in reports:
+            name = os.path.relpath(report['file'], args.session_dir)
+            for lost in report['lost']:
+                damaged = True
+                samples = '%d samples' % lost['samples'] if lost['samples'] is not None else 'unknown samples'
+                span = ('%s to %s' if lost['exact'] else 'between %s and %s') % (format_time(lost['t_start']),
+                                                                                  format_time(lost['t_end']))
+                print('%s: lost %s (%s, %d bytes)' % (name, span, samples, lost['bytes']))
+            if report['changed']:
+                print('%s: %s to %d bytes, %d samples kept'
+                      % (name, 'would cut' if args.dry_run else 'cut', report['bytes'], report['samples']))
+        stream_ends = [report['t_end'] for report in reports if report['t_end'] is not None]
+        if stream_ends and session_end - max(stream_ends) > args.gap:
+            # Samples still queued in memory at the crash leave no trace in the files
+            print('%s: ends %.1f s before the session, samples after %s may be missing'
+                  % (stream, session_end - max(stream_ends), format_time(max(stream_ends))))
+    if not damaged:
+        print('No damaged recordings in %s' % args.session_dir)
+
+
+def export_command(args):
+    written = export.export_tree(args.data_dir, args.prefix, args.output, row_group_rows=args.row_group_rows,
+                                 compression=args.compression, force=args.force)
+    for target, rows in sorted(written.items()):
+        print('%s: %d rows' % (os.path.relpath(target, args.output), rows))
+    print('Exported %d files to %s' % (len(written), args.output))
+
+
+def catalog_command(args):
+    catalog = open_catalog(configObject)
+    if catalog is None:
+        print('No catalog is set up in config.ini ([File Info] catalog)')
+        return 1
+    try:
+        if args.scan:
+            print('Catalogued %d new or changed files' % catalog.scan(args.prefix))
+        rows = catalog.find(participant_name=args.participant, participant_session=args.session, stream=args.stream,
+                            label=args.label, trial_id=args.trial, t_start=args.start, t_end=args.end)
+    finally:
+        catalog.close()
+    for row in rows:
+        print('%s  %s/%s  %s  %d samples  %s to %s%s'
+              % (row['path'], row['participant_name'], row['participant_session'], row['stream'], row['samples'],
+                 format_time(row['t_start']), format_time(row['t_end']),
+                 '  %s %s' % (row['label'], row['trial_id']) if row['label'] else ''))
+    print('%d files' % len(rows))
+
+
+def build_parser():
+    session_dir, prefix = default_session()
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    merge_parser = commands.add_parser('merge', help='Merge all streams of a session into one time-aligned CSV')
+    merge_parser.add_argument('session_dir', nargs='?', default=session_dir,
+                              help='Session directory holding one directory per stream')
+    merge_parser.add_argument('-p', '--prefix', default=prefix, help='file_name_prefix used while recording')
+    merge_parser.add_argument('-o', '--output', default='merged.csv', help='CSV file to write')
+    merge_parser.add_argument('-s', '--streams', nargs='+', help='Streams to merge (default: all)')
+    merge_parser.add_argument('-r', '--rate', type=float,
+                              help='Resample onto a grid of this many rows per second '
+                                   '(default: one row per sample of any stream)')
+    merge_parser.add_argument('-m', '--method', choices=merge.METHODS, default='ffill',
+                              help='How resampled values are filled in')
+    merge_parser.add_argument('-t', '--tolerance', type=float,
+                              help='Leave a value empty if the stream had no sample for this many seconds')
+    merge_parser.add_argument('--timestamps', choices=['auto', 'raw', 'corrected'], default='auto',
+                              help='Align on raw or corrected LSL timestamps (auto: corrected when recorded)')
+    merge_parser.add_argument('--chunk-rows', type=int, default=merge.DEFAULT_CHUNK_ROWS,
+                              help='Rows read from each CSV file at a time')
+    merge_parser.set_defaults(func=merge_command)
+
+    recover_parser = commands.add_parser('recover', help='Cut damaged tails out of a crashed session and report '
+                                                         'the time ranges that were lost')
+    recover_parser.add_argument('session_dir', nargs='?', default=session_dir,
+                                help='Session directory holding one directory per stream')
+    recover_parser.add_argument('-p', '--prefix', default=prefix, help='file_name_prefix used while recording')
+    recover_parser.add_argument('-n', '--dry-run', action='store_true', help='Only report, change no files')
+    recover_parser.add_argument('--gap', type=float, default=5.0,
+                                help='Report streams that end this many seconds before the last one')
+    recover_parser.set_defaults(func=recover_command)
+
+    export_parser = commands.add_parser('export', help='Convert every session of the data directory into a '
+                                                       'Parquet dataset partitioned by participant, session and stream')
+    export_parser.add_argument('data_dir', nargs='?', default=file_info().get('directory', './data/'),
+                               help='Directory holding <participant_name>/<participant_session> directories')
+    export_parser.add_argument('-p', '--prefix', default=prefix, help='file_name_prefix used while recording')
+    export_parser.add_argument('-o', '--output', default='dataset', help='Dataset directory to write')
+    export_parser.add_argument('--row-group-rows', type=int, default=export.DEFAULT_ROW_GROUP_ROWS,
+                               help='Rows per Parquet row group; smaller groups make time windows cheaper to read')
+    export_parser.add_argument('--compression', default='zstd', help='Parquet codec (zstd, snappy, gzip or none)')
+    export_parser.add_argument('-f', '--force', action='store_true', help='Convert files that are already exported')
+    export_parser.set_defaults(func=export_command)
+
+    catalog_parser = commands.add_parser('catalog', help='Look up recorded files in the data catalog')
+    catalog_parser.add_argument('--scan', action='store_true',
+                                help='First add files that were recorded without the catalog or changed since')
+    catalog_parser.add_argument('-p', '--prefix', default=prefix, help='file_name_prefix used while recording')
+    catalog_parser.add_argument('--participant', help='participant_name')
+    catalog_parser.add_argument('--session', help='participant_session')
+    catalog_parser.add_argument('--stream', help='Start of the stream name (shapes for capture_shapes.py trials)')
+    catalog_parser.add_argument('--label', help='Shape label of capture_shapes.py trials')
+    catalog_parser.add_argument('--trial', help='trial_id of a capture_shapes.py trial')
+    catalog_parser.add_argument('--start', type=float, help='Files with data at or after this time')
+    catalog_parser.add_argument('--end', type=float, help='Files with data at or before this time')
+    catalog_parser.set_defaults(func=catalog_command)
+    return parser
+
+
+def main(argv=None):
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(message)s')
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
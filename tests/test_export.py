@@ -0,0 +1,27 @@
+import os
+import pytest
+import numpy as np
+
+pa = pytest.importorskip('pyarrow')
+from Util import export  # NOQA
+
+
+def tables(fail_after):
+    for k in range(fail_after):
+        yield pa.table({'Timestamp': np.arange(10, dtype=np.float64) + 10 * k})
+    raise ValueError('unreadable chunk')
+
+
+def test_failed_write_leaves_no_partial_file(tmpdir):
+    target = str(tmpdir.join('stream=Test', 'test_data.parquet'))
+    with pytest.raises(ValueError):
+        export._write_parquet(target, tables(2), 100, 'snappy')
+    assert os.listdir(os.path.dirname(target)) == []
+
+
+def test_stale_temp_file_is_removed(tmpdir):
+    target = str(tmpdir.join('stream=Test', 'test_data.parquet'))
+    os.makedirs(os.path.dirname(target))
+    open(target + '.tmp', 'wb').close()
+    assert export._write_parquet(target, iter([]), 100, 'snappy') == 0
+    assert os.listdir(os.path.dirname(target)) == []
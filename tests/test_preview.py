@@ -0,0 +1,44 @@
+import queue
+import numpy as np
+from Util.recorder import StreamBuffer
+from Util.acquisition import InletReader
+from Util.preview import LivePreview
+
+
+class ListInlet:
+    """Hands out the given pulls one by one, then calls done() and returns nothing."""
+
+    def __init__(self, pulls, done):
+        self.pulls = list(pulls)
+        self.done = done
+
+    def pull_chunk(self, timeout=0.0, max_samples=1024, dest_obj=None):
+        if not self.pulls:
+            self.done()
+            return None, []
+        samples, timestamps = self.pulls.pop(0)
+        dest_obj[:len(timestamps)] = samples
+        return None, timestamps
+
+
+def test_reader_feeds_the_preview_as_it_pulls():
+    preview = LivePreview(window_seconds=10, points=64)
+    preview.add_stream('Test', ['A', 'B'], 100)
+    # Nothing is drained to the writer for an hour
+    buffer = StreamBuffer('Test', ['A', 'B'], 100, flush_seconds=3600)
+    samples = np.arange(20, dtype=np.float32).reshape(10, 2)
+    seen = []
+
+    def done():
+        seen.append(preview.snapshot('Test', 1.0))
+        reader.stop()
+
+    inlet = ListInlet([(samples, np.arange(10) / 100.0)], done)
+    output = queue.Queue()
+    reader = InletReader('Test', inlet, buffer, output, 100, pull_timeout=0.01, preview=preview)
+    reader.run()
+    assert output.qsize() == 1
+    snapshot = seen[0]
+    assert snapshot['labels'] == ['A', 'B']
+    assert snapshot['t'].tolist() == (np.arange(10) / 100.0).tolist()
+    assert snapshot['min'].tolist() == samples.T.tolist()
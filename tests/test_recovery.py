@@ -0,0 +1,37 @@
+import os
+import numpy as np
+import pandas as pd
+from Util.recorder import Chunk
+from Util.writers import open_writer
+from Util.recovery import recover_file
+
+
+def write_chunks(stream_dir, chunks, rows):
+    writer = open_writer(str(stream_dir), 'test', ['A', 'B'])
+    for k in range(chunks):
+        timestamps = 100.0 + k * rows + np.arange(rows, dtype=np.float64)
+        writer.write(Chunk('Test', timestamps, [np.arange(rows, dtype=np.float32), np.ones(rows, dtype=np.float32)]))
+    writer.close()
+    return str(stream_dir.join('test_data.csv'))
+
+
+def test_torn_last_chunk_keeps_its_complete_rows(tmpdir):
+    file_name = write_chunks(tmpdir.join('Test'), 2, 10)
+    with open(file_name, 'rb') as f:
+        data = f.read()
+    # Cut the file in the middle of the last chunk's fourth row
+    lines = data.split(b'\n')
+    cut = len(b'\n'.join(lines[:1 + 10 + 3])) + 1 + 5
+    with open(file_name, 'r+b') as f:
+        f.truncate(cut)
+    report = recover_file(file_name)
+    assert report['samples'] == 13
+    assert report['t_end'] == 112.0
+    assert len(report['lost']) == 1
+    assert report['lost'][0]['t_start'] == 112.0
+    assert report['lost'][0]['t_end'] == 119.0
+    frame = pd.read_csv(file_name)
+    assert frame['Timestamp'].tolist() == [100.0 + k for k in range(13)]
+    assert os.path.getsize(file_name) == cut - 5
+    # The rebuilt journal matches the file
+    assert recover_file(file_name, dry_run=True)['lost'] == []
@@ -0,0 +1,35 @@
+import time
+import numpy as np
+from Util.timesync import TimestampCorrector, OffsetRefresher
+
+
+class OffsetInlet:
+    """Answers time_correction() with a fixed offset and counts the calls."""
+
+    def __init__(self, offset):
+        self.offset = offset
+        self.calls = 0
+
+    def time_correction(self, timeout=None):
+        self.calls += 1
+        return self.offset
+
+
+def test_correct_does_not_ask_the_inlet():
+    inlet = OffsetInlet(2.0)
+    corrector = TimestampCorrector(inlet, 0, clock_correction=True)
+    corrected = corrector.correct(np.array([1.0, 2.0]))
+    assert inlet.calls == 0
+    assert corrected.tolist() == [1.0, 2.0]
+
+
+def test_refresher_updates_the_offset_used_by_correct():
+    inlet = OffsetInlet(2.0)
+    corrector = TimestampCorrector(inlet, 0, clock_correction=True)
+    refresher = OffsetRefresher(lambda: [corrector], interval=0.01)
+    refresher.start()
+    deadline = time.monotonic() + 5
+    while inlet.calls == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    refresher.stop()
+    assert corrector.correct(np.array([1.0, 2.0])).tolist() == [3.0, 4.0]
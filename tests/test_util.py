@@ -0,0 +1,22 @@
+import numpy as np
+from Util import util
+
+
+def test_empty_pull_gives_empty_arrays():
+    timestamps, data = util.chunk_to_arrays([], [], np.float32, channels=3)
+    assert timestamps.shape == (0,)
+    assert data.shape == (0, 3)
+    assert data.dtype == np.float32
+
+
+def test_empty_pull_gives_empty_dataframe():
+    header = ['EMG_1', 'EMG_2', 'Device_Time']
+    df = util.format_data_into_dataframe([], [], header)
+    assert df.shape == (0, 3)
+    assert df.columns.tolist() == header
+
+
+def test_pull_becomes_dataframe_with_device_time():
+    df = util.format_data_into_dataframe([[1.0, 2.0], [3.0, 4.0]], [10.0, 10.5], ['A', 'B', 'Device_Time'])
+    assert df[['A', 'B']].values.tolist() == [[1.0, 2.0], [3.0, 4.0]]
+    assert df.columns.tolist() == ['A', 'B', 'Device_Time']
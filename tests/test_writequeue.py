@@ -0,0 +1,51 @@
+import threading
+import numpy as np
+from Util.recorder import Chunk
+from Util.writequeue import ChunkQueue
+
+
+def make_chunk(k):
+    return Chunk('Test', np.array([float(k)]), [np.array([k], dtype=np.float32)])
+
+
+def test_spill_keeps_order(tmpdir):
+    queue = ChunkQueue(maxsize=4, policy='spill', spill_dir=str(tmpdir))
+    for k in range(20):
+        queue.put(make_chunk(k))
+    assert queue.stats()['spilled_chunks'] == 16
+    queue.close()
+    received = []
+    while True:
+        chunk = queue.get()
+        if chunk is None:
+            break
+        received.append(int(chunk.timestamps[0]))
+    assert received == list(range(20))
+    assert tmpdir.listdir() == []
+
+
+def test_spill_keeps_order_with_concurrent_readers(tmpdir):
+    queue = ChunkQueue(maxsize=4, policy='spill', spill_dir=str(tmpdir))
+
+    def reader(offset):
+        for k in range(200):
+            queue.put(make_chunk(offset + k))
+
+    threads = [threading.Thread(target=reader, args=(offset,)) for offset in (0, 1000)]
+    for thread in threads:
+        thread.start()
+    received = []
+    while len(received) < 400:
+        received.append(int(queue.get().timestamps[0]))
+    for thread in threads:
+        thread.join()
+    # Each reader's chunks come out in the order it put them
+    assert [k for k in received if k < 1000] == list(range(200))
+    assert [k for k in received if k >= 1000] == list(range(1000, 1200))
+
+
+def test_rate_does_not_depend_on_stats_calls():
+    queue = ChunkQueue(rate_seconds=3600)
+    queue.record_written(1000)
+    assert queue.stats()['bytes_per_second'] == 0
+    assert queue.stats()['bytes_written'] == 1000
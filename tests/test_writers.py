@@ -0,0 +1,55 @@
+import numpy as np
+import pytest
+import pandas as pd
+from Util.recorder import Chunk
+from Util.writers import open_writer
+from Util.recovery import recover_file
+from Util.merge import merge_session
+
+MARKER = 'a,b "c"\nd'
+
+
+def write_markers(stream_dir, markers):
+    writer = open_writer(str(stream_dir), 'test', ['Marker'])
+    timestamps = np.arange(len(markers), dtype=np.float64) + 100.0
+    writer.write(Chunk('Markers', timestamps, [np.array(markers, dtype=object)]))
+    writer.close()
+    return str(stream_dir.join('test_data.csv'))
+
+
+def test_text_samples_with_separators_round_trip(tmpdir):
+    file_name = write_markers(tmpdir.join('Markers'), ['start', MARKER, 'stop'])
+    frame = pd.read_csv(file_name)
+    assert frame['Marker'].tolist() == ['start', MARKER, 'stop']
+    assert frame['Timestamp'].tolist() == [100.0, 101.0, 102.0]
+
+
+def test_recovery_keeps_quoted_text_samples(tmpdir):
+    file_name = write_markers(tmpdir.join('Markers'), ['start', MARKER, 'stop'])
+    report = recover_file(file_name, dry_run=True)
+    assert report['lost'] == []
+    assert report['samples'] == 3
+    # Rows after the last journal record are checked one by one
+    open(file_name + '.journal', 'wb').close()
+    report = recover_file(file_name, dry_run=True)
+    assert report['lost'] == []
+    assert report['samples'] == 3
+
+
+def test_merge_reads_quoted_text_samples(tmpdir):
+    write_markers(tmpdir.join('Markers'), ['start', MARKER, 'stop'])
+    output = str(tmpdir.join('merged.csv'))
+    assert merge_session(str(tmpdir), 'test', output) == 3
+    assert pd.read_csv(output)['Markers/Marker'].tolist() == ['start', MARKER, 'stop']
+
+
+def test_reopening_with_other_columns_is_refused(tmpdir):
+    stream_dir = tmpdir.join('Markers')
+    write_markers(stream_dir, ['start'])
+    # Same columns: rows are appended
+    write_markers(stream_dir, ['stop'])
+    with pytest.raises(ValueError):
+        open_writer(str(stream_dir), 'test', ['Marker', 'Other'])
+    with pytest.raises(ValueError):
+        open_writer(str(stream_dir), 'test', ['Marker'], corrected=True)
+    assert pd.read_csv(str(stream_dir.join('test_data.csv')))['Marker'].tolist() == ['start', 'stop']